@@ -0,0 +1,110 @@
+"""Load test of the fsdb HTTP server on localhost
+
+Without --port a temporary fsdb is created, filled and served in process,
+otherwise objects are uploaded to the server already running on that port.
+Every client keeps its connection alive and issues GET (or ranged GET)
+requests on random objects for the given duration.
+
+    python benchmarks/http_loadtest.py --clients 16 --size 65536 --duration 10
+"""
+from __future__ import print_function, unicode_literals
+
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+
+try:
+    from http.client import HTTPConnection
+except ImportError:
+    from httplib import HTTPConnection
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fsdb import Fsdb  # noqa: E402
+from fsdb.server import FsdbServer  # noqa: E402
+
+
+def upload(port, objects, size):
+    conn = HTTPConnection("127.0.0.1", port)
+    digests = []
+    for _ in range(objects):
+        conn.request("POST", "/", os.urandom(size))
+        response = conn.getresponse()
+        digests.append(response.read().decode('ascii').strip())
+    conn.close()
+    return digests
+
+
+def client(port, digests, deadline, rangeSize, results):
+    conn = HTTPConnection("127.0.0.1", port)
+    rnd = random.Random()
+    latencies = []
+    received = 0
+    while time.time() < deadline:
+        headers = {}
+        if rangeSize:
+            headers['Range'] = "bytes=0-{0}".format(rangeSize - 1)
+        start = time.time()
+        conn.request("GET", "/" + rnd.choice(digests), headers=headers)
+        response = conn.getresponse()
+        received += len(response.read())
+        latencies.append(time.time() - start)
+    conn.close()
+    results.append((latencies, received))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--port", type=int, help="port of a running server (default: start one)")
+    parser.add_argument("--workers", type=int, default=16, help="workers of the in process server")
+    parser.add_argument("--clients", type=int, default=8, help="number of concurrent connections")
+    parser.add_argument("--objects", type=int, default=100, help="number of objects uploaded")
+    parser.add_argument("--size", type=int, default=2**16, help="size of the objects in bytes")
+    parser.add_argument("--range", type=int, default=0, help="request only the first RANGE bytes")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of load")
+    args = parser.parse_args()
+
+    tmp = server = None
+    port = args.port
+    if port is None:
+        tmp = tempfile.mkdtemp(prefix="fsdb_loadtest")
+        server = FsdbServer(("127.0.0.1", 0), Fsdb(os.path.join(tmp, "root")), workers=args.workers)
+        threading.Thread(target=server.serve_forever).start()
+        port = server.server_address[1]
+    try:
+        digests = upload(port, args.objects, args.size)
+        results = []
+        deadline = time.time() + args.duration
+        threads = [threading.Thread(target=client, args=(port, digests, deadline, args.range, results))
+                   for _ in range(args.clients)]
+        start = time.time()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.time() - start
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+            shutil.rmtree(tmp)
+
+    latencies = sorted(latency for r in results for latency in r[0])
+    received = sum(r[1] for r in results)
+    if not latencies:
+        print("no request completed")
+        return 1
+    print("{0} requests in {1:.1f}s, {2} clients".format(len(latencies), elapsed, args.clients))
+    print("{0:.0f} requests/s, {1:.1f} MiB/s".format(len(latencies) / elapsed, received / elapsed / 2**20))
+    print("latency p50 {0:.2f}ms, p99 {1:.2f}ms".format(latencies[len(latencies) // 2] * 1000,
+                                                         latencies[int(len(latencies) * 0.99)] * 1000))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,70 @@
+"""Micro-benchmark of digest to path generation
+
+Compares, per digest, the path generation by ``Fsdb.generate_tree_path``
+(used by every lookup before the precomputed layout) with
+``Fsdb.get_file_path``, the batch ``Fsdb.get_file_paths`` and the overhead
+of ``Fsdb.exists`` on digests that are not stored.
+
+    python benchmarks/path_lookup.py --digests 100000 --depth 3
+"""
+from __future__ import print_function, unicode_literals
+
+import os
+import sys
+import time
+import shutil
+import hashlib
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fsdb import Fsdb  # noqa: E402
+
+
+def measure(label, func, count, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print("{0:<28} {1:8.0f} ns/digest".format(label, best / count * 1e9))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--digests", type=int, default=100000, help="number of digests")
+    parser.add_argument("--depth", type=int, default=3, help="depth of the fsdb tree")
+    parser.add_argument("--repeat", type=int, default=5, help="best of REPEAT runs")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="fsdb_paths")
+    try:
+        fsdb = Fsdb(os.path.join(tmp, "root"), depth=args.depth)
+        digests = [hashlib.sha1(str(i).encode('ascii')).hexdigest() for i in range(args.digests)]
+        root = fsdb.fsdbRoot
+
+        def legacy():
+            for digest in digests:
+                os.path.join(root, Fsdb.generate_tree_path(digest, args.depth))
+
+        def single():
+            for digest in digests:
+                fsdb.get_file_path(digest)
+
+        def missing():
+            for digest in digests:
+                fsdb.exists(digest)
+
+        measure("generate_tree_path + join", legacy, len(digests), args.repeat)
+        measure("get_file_path", single, len(digests), args.repeat)
+        measure("get_file_paths", lambda: fsdb.get_file_paths(digests), len(digests), args.repeat)
+        measure("exists (not stored)", missing, len(digests), args.repeat)
+    finally:
+        shutil.rmtree(tmp)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,5 +1,7 @@
 from .fsdb import Fsdb
+from .verify import CorruptedError
+from .digestset import DigestSet
 
-__all__ = ['Fsdb']
+__all__ = ['Fsdb', 'CorruptedError', 'DigestSet']
 
 __version__ = '1.2.2'
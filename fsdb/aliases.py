@@ -0,0 +1,68 @@
+from __future__ import unicode_literals
+
+import os
+import errno
+import threading
+
+from .locking import stripe_of
+from .striped import StripedLog
+
+
+class Aliases(object):
+    '''Index from secondary digests to the digest files are stored under
+
+       Every secondary algorithm has its own striped log of records
+       ``<alias> <digest>``. Stripes are append-only, so lookups keep a
+       per-stripe dictionary in memory and only read what was appended
+       since the previous lookup.
+       Records are never removed: content addressing guarantees an alias
+       always maps to the same digest, whether that file is stored or not.
+    '''
+
+    def __init__(self, fsdb, folder, algorithms, lengths):
+        self._fsdb = fsdb
+        self.algorithms = algorithms
+        self._logs = dict((alg, StripedLog(fsdb, os.path.join(folder, alg))) for alg in algorithms)
+        # digest length -> algorithm
+        self._byLength = dict((lengths[alg], alg) for alg in algorithms)
+        # (algorithm, stripe) -> (read offset, {alias: digest})
+        self._index = {}
+        self._lock = threading.Lock()
+
+    def algorithm_of(self, digest):
+        '''Return the secondary algorithm of `digest` or None if it is not an alias'''
+        return self._byLength.get(len(digest))
+
+    def register(self, digest, aliases):
+        '''Record `aliases` (dictionary `algorithm -> alias`) of the file stored as `digest`'''
+        for alg in self.algorithms:
+            alias = aliases[alg]
+            if self.resolve(alias) != digest:
+                self._logs[alg].append(alias, digest)
+
+    def resolve(self, alias):
+        '''Return the digest `alias` refers to, or None if it is unknown'''
+        alg = self.algorithm_of(alias)
+        if alg is None:
+            return None
+        return self._load(alg, stripe_of(alias)).get(alias)
+
+    def _load(self, alg, stripe):
+        path = self._logs[alg]._path(stripe)
+        with self._lock:
+            offset, entries = self._index.get((alg, stripe), (0, {}))
+            try:
+                with open(path, 'rb') as f:
+                    f.seek(offset)
+                    data = f.read()
+            except IOError as e:
+                if e.errno == errno.ENOENT:
+                    return entries
+                raise
+            # a concurrent append may be partially written, stop at the last full line
+            end = data.rfind(b"\n") + 1
+            for line in data[:end].decode('ascii').splitlines():
+                alias, digest = line.split(" ")
+                entries[alias] = digest
+            self._index[(alg, stripe)] = (offset + end, entries)
+            return entries
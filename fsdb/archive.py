@@ -0,0 +1,195 @@
+from __future__ import unicode_literals
+
+import os
+import tarfile
+import threading
+import collections
+from multiprocessing.pool import ThreadPool
+
+from . import iohints
+from .compat import queue, zstandard
+from .utils import bounded_imap
+from .verify import CorruptedError
+
+COMPRESSIONS = (None, 'gz', 'bz2', 'zstd')
+
+ImportResult = collections.namedtuple('ImportResult', ['imported', 'skipped', 'corrupted'])
+
+# number of chunks of an entry buffered between the reader and the writing worker
+PIPE_CHUNKS = 16
+
+
+def export_archive(fsdb, stream, digests=None, compression=None, workers=4):
+    '''Write stored files as a tar archive to `stream`, every entry is named after its digest
+
+       Files are exported in traversal order (or in the given `digests` order) while
+       the following ones are opened and prefetched by a pool of `workers` threads.
+       Returns the number of exported files.
+    '''
+    _check_compression(compression)
+    if digests is None:
+        digests = fsdb
+
+    def prefetch(digest):
+        try:
+            f = open(fsdb.get_file_path(digest), 'rb')
+        except IOError:
+            raise KeyError("no stored file found for '{0}'".format(digest))
+        iohints.advise(f.fileno(), 0, 0, 'POSIX_FADV_WILLNEED')
+        return digest, f
+
+    count = 0
+    pool = ThreadPool(workers)
+    try:
+        with _open_tar(stream, 'w', compression) as tar:
+            for digest, f in bounded_imap(pool, prefetch, digests, workers * 2):
+                with f:
+                    st = os.fstat(f.fileno())
+                    info = tarfile.TarInfo(digest)
+                    info.size = st.st_size
+                    info.mtime = st.st_mtime
+                    info.mode = fsdb._conf['fmode']
+                    tar.addfile(info, f)
+                count += 1
+    finally:
+        pool.close()
+        pool.join()
+    return count
+
+
+def import_archive(fsdb, stream, compression=None, workers=4):
+    '''Add the files of a tar archive written by :py:func:`export_archive`
+
+       The archive is read sequentially while entries are hashed and written
+       into place by a pool of `workers` threads: the next entry is read as soon
+       as any of them is free. Digests already stored and entries not named after
+       a digest are skipped, entries whose content does not match their name are
+       discarded. Returns an `ImportResult` tuple.
+    '''
+    _check_compression(compression)
+    imported = skipped = 0
+    corrupted = []
+    pending = collections.deque()
+    # entries being written, the reader never waits for a specific one
+    slots = threading.Semaphore(workers)
+
+    def finish(name, result):
+        try:
+            result.get()
+            return 1
+        except CorruptedError:
+            fsdb.logger.warning("Corrupted archive entry discarded: [{0}]".format(name))
+            corrupted.append(name)
+            return 0
+
+    pool = ThreadPool(workers)
+    try:
+        with _open_tar(stream, 'r', compression) as tar:
+            for member in tar:
+                digest = os.path.basename(member.name)
+                if not member.isfile() or digest.startswith('.'):
+                    continue
+                if not fsdb._layout.valid(digest):
+                    fsdb.logger.warning("Archive entry not named after a digest skipped: '{0}'".format(member.name))
+                    skipped += 1
+                    continue
+                if fsdb.exists(digest):
+                    skipped += 1
+                    continue
+                slots.acquire()
+                pipe = _ChunkPipe()
+                pending.append((digest, pool.apply_async(_insert, (fsdb, pipe, digest, slots))))
+                pipe.feed(tar.extractfile(member))
+                while pending and pending[0][1].ready():
+                    imported += finish(*pending.popleft())
+            while pending:
+                imported += finish(*pending.popleft())
+    finally:
+        pool.close()
+        pool.join()
+    return ImportResult(imported, skipped, corrupted)
+
+
+def _insert(fsdb, pipe, digest, slots):
+    try:
+        # stored as add() does: references, expiration and duplicates are handled
+        fsdb._store(pipe, digest, trusted=True)
+    finally:
+        pipe.close()
+        slots.release()
+
+
+class _ChunkPipe(object):
+    '''Readable object fed, chunk by chunk, by another thread'''
+
+    def __init__(self):
+        self._queue = queue.Queue(PIPE_CHUNKS)
+        self._closed = False
+
+    def feed(self, f):
+        '''Copy the content of `f` into the pipe, stops if the reader goes away'''
+        try:
+            while not self._closed:
+                chunk = f.read(2**16)
+                self._put(chunk)
+                if not chunk:
+                    break
+        except BaseException:
+            # the reader gets a truncated content, never blocks
+            self.close()
+            raise
+
+    def _put(self, chunk):
+        while not self._closed:
+            try:
+                self._queue.put(chunk, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def read(self, size=-1):
+        while not self._closed:
+            try:
+                return self._queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return b""
+
+    def close(self):
+        self._closed = True
+
+
+def _check_compression(compression):
+    if compression not in COMPRESSIONS:
+        raise ValueError("compression must be one of " + str(COMPRESSIONS))
+    if compression == 'zstd' and zstandard is None:
+        raise ValueError("zstd compression requires the `zstandard` package")
+
+
+class _open_tar(object):
+    '''Open a streaming tar archive, wrapping `stream` for zstd compression'''
+
+    def __init__(self, stream, mode, compression):
+        self.zstream = None
+        if compression == 'zstd':
+            if mode == 'w':
+                self.zstream = zstandard.ZstdCompressor().stream_writer(stream, closefd=False)
+            else:
+                self.zstream = zstandard.ZstdDecompressor().stream_reader(stream, closefd=False)
+            self.tar = tarfile.open(fileobj=self.zstream, mode=mode + '|')
+        elif mode == 'w':
+            self.tar = tarfile.open(fileobj=stream, mode='w|' + (compression or ''))
+        else:
+            # compression is detected from the stream itself
+            self.tar = tarfile.open(fileobj=stream, mode='r|*')
+
+    def __enter__(self):
+        return self.tar
+
+    def __exit__(self, *exc):
+        self.tar.close()
+        if self.zstream is not None:
+            if hasattr(self.zstream, 'flush'):
+                self.zstream.flush(zstandard.FLUSH_FRAME)
+            self.zstream.close()
+        return False
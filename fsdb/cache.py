@@ -0,0 +1,325 @@
+from __future__ import unicode_literals
+
+import os
+import time
+import errno
+import heapq
+import random
+import threading
+import logging
+
+from .locking import stripe_of
+from .striped import StripedLog
+
+LRU = 'lru'
+LFU = 'lfu'
+FIFO = 'fifo'
+POLICIES = (LRU, LFU, FIFO)
+
+# name of the fsdb lock stripes guarding usage counters and eviction
+USAGE_LOCK = "cache-usage"
+EVICT_LOCK = "cache-evict"
+
+# eviction frees space down to this fraction of the budgets
+LOW_WATERMARK = 0.9
+# number of distinct accessed digests buffered before writing them
+ACCESS_BUFFER = 256
+
+
+class Cache(object):
+    '''Size-bounded cache mode
+
+       Usage (number of files and bytes) is kept incrementally in a small
+       counters file updated at every insertion and removal, so checking the
+       budgets never requires a scan. Insertions, removals and (sampled,
+       buffered) accesses are appended to a striped index:
+
+         ``<digest> I <time> <size>``   inserted
+         ``<digest> A <time> <hits>``   accessed `hits` times, last at `time`
+         ``<digest> R``                 removed
+
+       When a budget is exceeded files are evicted in batch, on a background
+       thread, according to the configured policy until usage drops below
+       LOW_WATERMARK of the budgets. The replayed index is kept in memory
+       between evictions and only the records appended since are read; only
+       the stripes files are evicted from are compacted.
+    '''
+
+    def __init__(self, fsdb, folder, max_bytes, max_objects, policy, sample):
+        self._fsdb = fsdb
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.max_objects = max_objects
+        self.policy = policy
+        self.sample = sample
+        self._index = StripedLog(fsdb, os.path.join(folder, "index"))
+        self._usage_path = os.path.join(folder, "usage")
+        self._accesses = {}
+        # stripe -> (inode, replayed length, state), used under EVICT_LOCK only
+        self._states = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        # an eviction was requested while one was running
+        self._again = False
+        self.logger = logging.getLogger(__name__)
+
+    # accounting
+
+    def usage(self):
+        '''Return `(files, bytes)` currently stored'''
+        with self._fsdb._locks.stripe(USAGE_LOCK, shared=True):
+            usage = self._read_usage()
+        if usage is None:
+            usage = self.rebuild()
+        return usage
+
+    def _read_usage(self):
+        try:
+            with open(self._usage_path, 'r') as f:
+                objects, size = f.read().split()
+            return int(objects), int(size)
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                return None
+            raise
+
+    def _write_usage(self, objects, size):
+        tmpPath = self._usage_path + ".tmp"
+        with open(tmpPath, 'w') as f:
+            f.write("{0} {1}".format(objects, size))
+        os.rename(tmpPath, self._usage_path)
+
+    def _update_usage(self, objects, size):
+        self._fsdb._makedirs(self.folder)
+        with self._fsdb._locks.stripe(USAGE_LOCK):
+            usage = self._read_usage()
+            if usage is None:
+                # counters are (re)built scanning the fsdb, which already includes this change
+                usage = self._scan()
+            else:
+                usage = (max(usage[0] + objects, 0), max(usage[1] + size, 0))
+            self._write_usage(*usage)
+        return usage
+
+    def _scan(self):
+        '''Count stored files, adding to the index the ones it does not know yet'''
+        objects = size = 0
+        known = set()
+        records = []
+        for stripe in self._index.stripes():
+            state = {}
+            for record in self._index.read(stripe):
+                _replay(state, record)
+            known.update(state)
+        for digest, path in self._fsdb._walk():
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            objects += 1
+            size += st.st_size
+            if digest not in known:
+                records.append((digest, "I", _timestamp(st.st_mtime), str(st.st_size)))
+        self._index.append_many(records)
+        return objects, size
+
+    def rebuild(self):
+        '''Recompute usage counters scanning the whole fsdb'''
+        self._fsdb._makedirs(self.folder)
+        with self._fsdb._locks.stripe(USAGE_LOCK):
+            usage = self._scan()
+            self._write_usage(*usage)
+        return usage
+
+    def inserted(self, digest, size):
+        self._index.append(digest, "I", _timestamp(time.time()), str(size))
+        if self._over_budget(self._update_usage(1, size), 1.0):
+            self.evict_async()
+
+    def removed(self, digest, size, locked=False):
+        '''Account a removed file, `locked` if the caller holds its stripe lock'''
+        self._index.append_many([(digest, "R")], locked)
+        self._update_usage(-1, -size)
+
+    def accessed(self, digest):
+        if self.sample > 1 and random.randint(1, self.sample) != 1:
+            return
+        with self._lock:
+            hits = self._accesses.get(digest, (0, 0))[1]
+            self._accesses[digest] = (time.time(), hits + self.sample)
+            if len(self._accesses) < ACCESS_BUFFER:
+                return
+            accesses, self._accesses = self._accesses, {}
+        self._write_accesses(accesses)
+
+    def flush(self):
+        with self._lock:
+            accesses, self._accesses = self._accesses, {}
+        self._write_accesses(accesses)
+
+    def _write_accesses(self, accesses):
+        if accesses:
+            self._index.append_many((d, "A", _timestamp(ts), str(hits)) for d, (ts, hits) in accesses.items())
+
+    def _over_budget(self, usage, fraction):
+        objects, size = usage
+        return (self.max_objects and objects > self.max_objects * fraction) or \
+               (self.max_bytes and size > self.max_bytes * fraction)
+
+    # eviction
+
+    def evict_async(self):
+        '''Start the eviction on a background thread, if already running it runs once more'''
+        with self._lock:
+            if self._thread is not None:
+                # insertions made after it read the usage are evicted next run
+                self._again = True
+                return
+            self._thread = threading.Thread(target=self._evict_background, name="fsdb-evict")
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _evict_background(self):
+        while True:
+            try:
+                self.evict()
+            except Exception:
+                self.logger.exception("cache eviction failed")
+            with self._lock:
+                if not self._again:
+                    self._thread = None
+                    return
+                self._again = False
+
+    def join(self):
+        '''Wait for the background eviction to finish'''
+        thread = self._thread
+        if thread is not None:
+            thread.join()
+
+    def evict(self):
+        '''Evict files until usage is below the low watermark of the budgets
+
+           Returns:
+             `(files, bytes)` evicted
+        '''
+        self.flush()
+        self._fsdb._makedirs(self.folder)
+        with self._fsdb._locks.stripe(EVICT_LOCK):
+            usage = self.usage()
+            if not self._over_budget(usage, LOW_WATERMARK):
+                return 0, 0
+            entries = []
+            for stripe in self._index.stripes():
+                for digest, entry in self._load(stripe).items():
+                    if not entry[0]:
+                        # accessed before enabling the cache
+                        entry[0] = entry[1]
+                        entry[3] = self._size(digest)
+                    entries.append((self._key(entry), digest, entry[3]))
+            heapq.heapify(entries)
+            snapshotted = self._fsdb._snapshots.live()
+
+            objects, size = usage
+            evicted = [0, 0]
+            folders = set()
+            # stripes evicted from -> digests found missing (removed while the cache was disabled)
+            touched = {}
+            while entries and self._over_budget((objects - evicted[0], size - evicted[1]), LOW_WATERMARK):
+                key, digest, fsize = heapq.heappop(entries)
+                if not self._fsdb._evictable(digest, snapshotted):
+                    continue
+                try:
+                    folders.add((digest, os.path.dirname(self._fsdb._remove_file(digest))))
+                except OSError as e:
+                    if e.errno != errno.ENOENT:
+                        raise
+                    touched.setdefault(stripe_of(digest), set()).add(digest)
+                    continue
+                touched.setdefault(stripe_of(digest), set())
+                evicted[0] += 1
+                evicted[1] += fsize
+            for digest, folder in folders:
+                with self._fsdb._tree_lock(digest):
+                    self._fsdb._prune(folder)
+            for stripe in sorted(touched):
+                with self._fsdb._locks.stripe(stripe):
+                    state = self._load(stripe)
+                    for digest in touched[stripe]:
+                        if digest in state and not self._fsdb.exists(digest):
+                            del state[digest]
+                    self._compact(stripe, state)
+        self.logger.debug("Evicted {0} files, {1} bytes".format(*evicted))
+        return tuple(evicted)
+
+    def _key(self, entry):
+        inserted, lastAccess, hits, size = entry
+        if self.policy == FIFO:
+            return (inserted,)
+        if self.policy == LFU:
+            return (hits, max(inserted, lastAccess))
+        return (max(inserted, lastAccess),)
+
+    def _load(self, stripe):
+        '''Return a dictionary `digest -> [inserted, last access, hits, size]`
+
+           Only the records appended since the previous call are replayed,
+           the whole stripe is read again after it has been rewritten.
+        '''
+        try:
+            f = open(self._index._path(stripe), 'rb')
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                self._states.pop(stripe, None)
+                return {}
+            raise
+        with f:
+            st = os.fstat(f.fileno())
+            cached = self._states.get(stripe)
+            if cached is None or cached[0] != st.st_ino or cached[1] > st.st_size:
+                cached = (st.st_ino, 0, {})
+            ino, offset, state = cached
+            f.seek(offset)
+            data = f.read()
+        # a record being appended right now is read next time
+        data = data[:data.rfind(b"\n") + 1]
+        for line in data.decode('ascii').splitlines():
+            if line:
+                _replay(state, line.split(" "))
+        self._states[stripe] = (ino, offset + len(data), state)
+        return state
+
+    def _size(self, digest):
+        try:
+            return os.path.getsize(self._fsdb.get_file_path(digest))
+        except OSError:
+            return 0
+
+    def _compact(self, stripe, state):
+        records = []
+        for digest in sorted(state):
+            inserted, lastAccess, hits, size = state[digest]
+            records.append((digest, "I", _timestamp(inserted), str(size)))
+            if hits:
+                records.append((digest, "A", _timestamp(lastAccess), str(hits)))
+        self._index.rewrite(stripe, records)
+        st = os.stat(self._index._path(stripe))
+        self._states[stripe] = (st.st_ino, st.st_size, state)
+
+
+def _replay(state, record):
+    digest, op = record[0], record[1]
+    if op == "R":
+        state.pop(digest, None)
+        return
+    entry = state.setdefault(digest, [0, 0, 0, 0])
+    if op == "I":
+        entry[0] = float(record[2])
+        entry[3] = int(record[3])
+    elif op == "A":
+        entry[1] = max(entry[1], float(record[2]))
+        entry[2] += int(record[3])
+
+
+def _timestamp(t):
+    return "{0:.6f}".format(t)
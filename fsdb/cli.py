@@ -0,0 +1,430 @@
+from __future__ import unicode_literals
+
+import os
+import sys
+import time
+import errno
+import argparse
+import logging
+import threading
+from multiprocessing.pool import ThreadPool
+
+from . import __version__
+from . import iohints
+from .fsdb import Fsdb
+from .utils import bounded_imap
+from .compat import ISPYTHON2
+
+
+def main(argv=None):
+    """Entry point of the ``fsdb`` console script"""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING)
+    if not args.root:
+        parser.error("fsdb root not given, use --root or the FSDB_ROOT environment variable")
+    if args.command == 'init':
+        return cmd_init(args)
+    if not Fsdb.config_exists(args.root):
+        parser.error("no fsdb found in: {0}".format(args.root))
+    try:
+        # closing flushes buffered records and waits for background evictions
+        with Fsdb(args.root) as fsdb:
+            return args.func(fsdb, args) or 0
+    except KeyboardInterrupt:
+        return 130
+    except IOError as e:
+        # e.g. closed pipe on `fsdb ls | head`
+        if e.errno == errno.EPIPE:
+            return 0
+        raise
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="fsdb", description="manage a file system database")
+    parser.add_argument("-R", "--root", default=os.environ.get("FSDB_ROOT"),
+                        help="fsdb root folder (default: $FSDB_ROOT)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="enable debug logging")
+    parser.add_argument("--version", action="version", version="%(prog)s " + __version__)
+    sub = parser.add_subparsers(dest="command", metavar="command")
+    sub.required = True
+
+    p = sub.add_parser("init", help="create a new fsdb")
+    p.add_argument("--depth", type=int, help="number of levels of the directory tree")
+    p.add_argument("--hash-alg", help="hash algorithm used to compute digests")
+    p.add_argument("--fmode", help="permissions mask of stored files")
+    p.set_defaults(func=cmd_init)
+
+    p = sub.add_parser("add", help="add files, reading paths from stdin if none is given")
+    p.add_argument("paths", nargs="*", help="files or folders to add ('-' reads paths from stdin)")
+    p.add_argument("-r", "--recursive", action="store_true", help="add the content of folders")
+    p.add_argument("--ttl", type=int, help="remove the files after this number of seconds (see expire)")
+    add_jobs_argument(p)
+    add_progress_argument(p)
+    p.set_defaults(func=cmd_add)
+
+    p = sub.add_parser("get", help="write the content of a stored file")
+    p.add_argument("digest")
+    p.add_argument("-o", "--output", help="destination file (default: stdout)")
+    p.set_defaults(func=cmd_get)
+
+    p = sub.add_parser("rm", help="remove stored files")
+    p.add_argument("digests", nargs="*", help="digests to remove ('-' reads digests from stdin)")
+    p.set_defaults(func=cmd_rm)
+
+    p = sub.add_parser("ls", help="list stored digests")
+    p.add_argument("-p", "--path", action="store_true", help="print paths instead of digests")
+    p.set_defaults(func=cmd_ls)
+
+    p = sub.add_parser("du", help="print the number and total size of stored files")
+    p.add_argument("-H", "--human", action="store_true", help="print human readable sizes")
+    add_jobs_argument(p)
+    p.set_defaults(func=cmd_du)
+
+    p = sub.add_parser("fsck", help="check the integrity of stored files, print corrupted digests")
+    p.add_argument("-i", "--incremental", action="store_true",
+                   help="skip files recently verified, oldest verified first (see Fsdb.scrub)")
+    p.add_argument("--max-bytes", type=int, help="with --incremental stop after checking this amount of data")
+    p.add_argument("-q", "--quarantine", action="store_true", help="move corrupted files to quarantine (see repair)")
+    p.add_argument("-b", "--background", action="store_true",
+                   help="drop checked files from the page cache, to not disturb serving")
+    add_jobs_argument(p)
+    add_progress_argument(p)
+    p.set_defaults(func=cmd_fsck)
+
+    p = sub.add_parser("repair", help="restore quarantined files from replicas")
+    p.add_argument("digests", nargs="*", help="digests to repair (default: all quarantined files)")
+    p.add_argument("--replica", action="append", dest="replicas", metavar="ROOT",
+                   help="root of a replica to restore from (default: the `replicas` config option)")
+    add_jobs_argument(p)
+    p.set_defaults(func=cmd_repair)
+
+    p = sub.add_parser("gc", help="remove released files (requires refcount)")
+    p.set_defaults(func=cmd_gc)
+
+    p = sub.add_parser("export", help="write stored files as a tar archive")
+    p.add_argument("digests", nargs="*", help="digests to export (default: all, '-' reads digests from stdin)")
+    p.add_argument("-o", "--output", help="destination archive (default: stdout)")
+    p.add_argument("-z", "--compression", choices=("gz", "bz2", "zstd"), help="compress the archive")
+    add_jobs_argument(p)
+    p.set_defaults(func=cmd_export)
+
+    p = sub.add_parser("import", help="add the files of an archive written by export")
+    p.add_argument("archive", nargs="?", help="source archive (default: stdin)")
+    p.add_argument("--zstd", action="store_true", help="the archive is zstd compressed")
+    add_jobs_argument(p)
+    p.set_defaults(func=cmd_import)
+
+    p = sub.add_parser("expire", help="remove the files added with a ttl that is over")
+    p.add_argument("-H", "--human", action="store_true", help="print human readable sizes")
+    p.set_defaults(func=cmd_expire)
+
+    p = sub.add_parser("serve", help="serve stored files over HTTP")
+    p.add_argument("--host", default="127.0.0.1", help="address to listen on (default: 127.0.0.1)")
+    p.add_argument("-p", "--port", type=int, default=8080, help="port to listen on (default: 8080)")
+    p.add_argument("-w", "--workers", type=int, default=16, help="number of connections served in parallel (default: 16)")
+    p.add_argument("--read-only", action="store_true", help="refuse PUT and POST requests")
+    p.set_defaults(func=cmd_serve)
+
+    p = sub.add_parser("stats", help="print configuration and usage")
+    add_jobs_argument(p)
+    p.set_defaults(func=cmd_stats)
+
+    return parser
+
+
+def add_jobs_argument(parser):
+    parser.add_argument("-j", "--jobs", type=int, default=4, help="number of parallel workers (default: 4)")
+
+
+def add_progress_argument(parser):
+    parser.add_argument("-P", "--progress", action="store_true", help="report progress and throughput on stderr")
+
+
+def cmd_init(args):
+    if Fsdb.config_exists(args.root):
+        return error("fsdb already exists: {0}".format(args.root))
+    fsdb = Fsdb(args.root, depth=args.depth, hash_alg=args.hash_alg, fmode=args.fmode)
+    out(str(fsdb))
+
+
+def cmd_add(fsdb, args):
+    paths = args.paths
+    if not paths or paths == ['-']:
+        paths = read_lines(sys.stdin)
+
+    def add(path):
+        try:
+            size = os.path.getsize(path)
+            return fsdb.add(path, ttl=args.ttl), path, size
+        except (IOError, OSError, ValueError) as e:
+            return None, path, e
+
+    failed = 0
+    progress = Progress(args.progress)
+    pool = ThreadPool(args.jobs)
+    try:
+        for digest, path, size in bounded_imap(pool, add, iter_files(paths, args.recursive), args.jobs * 4):
+            if digest is None:
+                failed += 1
+                error("cannot add {0}: {1}".format(path, size))
+                continue
+            out(digest + " " + path)
+            progress.update(size)
+    finally:
+        pool.close()
+        pool.join()
+        progress.done()
+    return 1 if failed else 0
+
+
+def cmd_get(fsdb, args):
+    if not fsdb.exists(args.digest):
+        return error("no stored file found for '{0}'".format(args.digest))
+    dst = open(args.output, 'wb') if args.output else binary_stdout()
+    try:
+        with fsdb[args.digest] as f:
+            while True:
+                chunk = f.read(Fsdb.BLOCK_SIZE)
+                if not chunk:
+                    break
+                dst.write(chunk)
+    finally:
+        if args.output:
+            dst.close()
+        else:
+            dst.flush()
+
+
+def cmd_rm(fsdb, args):
+    digests = args.digests
+    if not digests or digests == ['-']:
+        digests = read_lines(sys.stdin)
+    failed = 0
+    for digest in digests:
+        if not fsdb.exists(digest):
+            error("no stored file found for '{0}'".format(digest))
+            failed += 1
+            continue
+        fsdb.remove(digest)
+    return 1 if failed else 0
+
+
+def cmd_ls(fsdb, args):
+    for digest, path in fsdb._walk():
+        out(path if args.path else digest)
+
+
+def cmd_du(fsdb, args):
+    count, size = usage(fsdb, args.jobs)
+    out("{0}\t{1} files".format(format_size(size, args.human), count))
+
+
+def cmd_fsck(fsdb, args):
+    io_class = iohints.BACKGROUND if args.background else iohints.NORMAL
+    if args.incremental:
+        corrupted = 0
+        for digest in fsdb.scrub(max_bytes=args.max_bytes, io_class=io_class):
+            corrupted += 1
+            out(digest)
+            if args.quarantine and fsdb.exists(digest):
+                fsdb.quarantine(digest)
+        return 1 if corrupted else 0
+
+    def check(item):
+        digest, path = item
+        # a corrupted file may be moved to quarantine by check()
+        size = os.path.getsize(path)
+        ok = fsdb.check(digest, io_class=io_class)
+        if not ok and args.quarantine and fsdb.exists(digest):
+            fsdb.quarantine(digest)
+        return digest, ok, size
+
+    corrupted = 0
+    progress = Progress(args.progress)
+    pool = ThreadPool(args.jobs)
+    try:
+        for digest, ok, size in bounded_imap(pool, check, fsdb._walk(), args.jobs * 4):
+            progress.update(size)
+            if not ok:
+                corrupted += 1
+                out(digest)
+    finally:
+        pool.close()
+        pool.join()
+        progress.done()
+    return 1 if corrupted else 0
+
+
+def cmd_repair(fsdb, args):
+    def report(digest, source):
+        if source is None:
+            error("no intact copy found: {0}".format(digest))
+        else:
+            out("{0} restored from {1}".format(digest, source))
+
+    result = fsdb.repair(args.digests or None, args.replicas, args.jobs, report)
+    return 1 if result.failed else 0
+
+
+def cmd_gc(fsdb, args):
+    try:
+        removed = fsdb.gc()
+    except ValueError as e:
+        return error(e.args[0])
+    out("{0} files removed".format(removed))
+
+
+def cmd_export(fsdb, args):
+    digests = args.digests or None
+    if digests == ['-']:
+        digests = read_lines(sys.stdin)
+    dst = open(args.output, 'wb') if args.output else binary_stdout()
+    try:
+        fsdb.export_archive(dst, digests, compression=args.compression, workers=args.jobs)
+    except KeyError as e:
+        return error(e.args[0])
+    finally:
+        if args.output:
+            dst.close()
+        else:
+            dst.flush()
+
+
+def cmd_import(fsdb, args):
+    src = open(args.archive, 'rb') if args.archive else binary_stdin()
+    try:
+        imported, skipped, corrupted = fsdb.import_archive(src, 'zstd' if args.zstd else None, args.jobs)
+    finally:
+        if args.archive:
+            src.close()
+    for digest in corrupted:
+        error("corrupted entry discarded: {0}".format(digest))
+    out("{0} files imported, {1} already present".format(imported, skipped))
+    return 1 if corrupted else 0
+
+
+def cmd_expire(fsdb, args):
+    count, size = fsdb.expire()
+    out("{0}\t{1} files expired".format(format_size(size, args.human), count))
+
+
+def cmd_serve(fsdb, args):
+    from .server import serve
+    serve(fsdb, args.host, args.port, args.workers, args.read_only)
+
+
+def cmd_stats(fsdb, args):
+    count, size = usage(fsdb, args.jobs)
+    out("root: {0}".format(fsdb.fsdbRoot))
+    for name in sorted(fsdb._conf):
+        value = fsdb._conf[name]
+        if name in ('fmode', 'dmode'):
+            value = oct(value)[-3:]
+        out("{0}: {1}".format(name, value))
+    out("files: {0}".format(count))
+    out("size: {0}".format(format_size(size, True)))
+
+
+def usage(fsdb, jobs):
+    '''Return number and total size of stored files, stat-ing them in parallel'''
+    pool = ThreadPool(jobs)
+    count = size = 0
+    try:
+        for s in bounded_imap(pool, os.path.getsize, fsdb.__iter__(overPath=True), jobs * 16):
+            count += 1
+            size += s
+    finally:
+        pool.close()
+        pool.join()
+    return count, size
+
+
+def iter_files(paths, recursive):
+    for path in paths:
+        if os.path.isdir(path):
+            if not recursive:
+                error("skipping folder (use --recursive): {0}".format(path))
+                continue
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames.sort()
+                for name in sorted(filenames):
+                    yield os.path.join(dirpath, name)
+        else:
+            yield path
+
+
+def read_lines(stream):
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield line
+
+
+class Progress(object):
+    '''Report processed files, bytes and throughput on stderr'''
+
+    INTERVAL = 0.5
+
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self.files = 0
+        self.bytes = 0
+        self.start = self.last = time.time()
+
+    def update(self, size):
+        self.files += 1
+        self.bytes += size
+        if self.enabled:
+            now = time.time()
+            if now - self.last >= self.INTERVAL:
+                self.last = now
+                self._print(now, "\r")
+
+    def done(self):
+        if self.enabled:
+            self._print(time.time(), "\n")
+
+    def _print(self, now, end):
+        elapsed = max(now - self.start, 1e-6)
+        sys.stderr.write("{0} files, {1}, {2}/s, {3:.1f} files/s{4}".format(
+            self.files, format_size(self.bytes, True),
+            format_size(self.bytes / elapsed, True), self.files / elapsed, end))
+        sys.stderr.flush()
+
+
+def format_size(size, human):
+    if not human:
+        return str(int(size))
+    for unit in ("B", "KiB", "MiB", "GiB", "TiB"):
+        if size < 1024 or unit == "TiB":
+            break
+        size /= 1024.0
+    return "{0:.1f} {1}".format(size, unit) if unit != "B" else "{0} B".format(int(size))
+
+
+_out_lock = threading.Lock()
+
+
+def out(line):
+    # called from pool threads, flushed to stream results when piped
+    with _out_lock:
+        sys.stdout.write(line + "\n")
+        sys.stdout.flush()
+
+
+def error(msg):
+    sys.stderr.write("fsdb: " + msg + "\n")
+    return 1
+
+
+def binary_stdout():
+    return sys.stdout if ISPYTHON2 else sys.stdout.buffer
+
+
+def binary_stdin():
+    return sys.stdin if ISPYTHON2 else sys.stdin.buffer
+
+
+if __name__ == '__main__':
+    sys.exit(main())
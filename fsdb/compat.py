@@ -7,3 +7,28 @@ if ISPYTHON2:
     string_types = basestring
 else:
     string_types = str
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue  # noqa: F401
+
+try:
+    from os import scandir
+except ImportError:
+    scandir = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+except ImportError:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler  # noqa: F401
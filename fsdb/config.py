@@ -2,7 +2,9 @@ from __future__ import unicode_literals
 import json
 
 from .utils import calc_dir_mode
+from .hashtools import digest_length, tree_base
 from .compat import string_types
+from .cache import POLICIES as CACHE_POLICIES
 
 
 ACCEPTED_HASH_ALG = ['md5', 'sha1', 'sha224', 'sha256', 'sha384', 'sha512']
@@ -12,6 +14,22 @@ __defaults = dict(
         fmode="660",
         depth=3,
         hash_alg='sha1',
+        refcount=False,
+        locking=False,
+        verify_on_read=False,
+        scrub_window=7 * 24 * 3600,
+        journal=False,
+        journal_batch=64,
+        journal_segment_size=2**20,
+        cache_max_bytes=0,
+        cache_max_objects=0,
+        cache_policy='lru',
+        cache_access_sample=1,
+        alias_algs=[],
+        tree_chunk_size=2**22,
+        metadata=False,
+        replicas=[],
+        auto_quarantine=False,
     )
 
 
@@ -23,6 +41,8 @@ def update_backword(conf):
     # Previous to version 1.0 the depth parameter was called deep
     if 'depth' not in conf and 'deep' in conf:
         conf['depth'] = conf.pop('deep')
+    # the I/O class used to be a config option, it is chosen per call now
+    conf.pop('io_class', None)
 
 
 def check_config(conf):
@@ -42,8 +62,63 @@ def check_config(conf):
     if 'hash_alg' in conf:
         if not isinstance(conf['hash_alg'], string_types):
             raise TypeError(TAG + ": `hash_alg` must be a string")
-        if conf['hash_alg'] not in ACCEPTED_HASH_ALG:
-            raise ValueError(TAG + ": `hash_alg` must be one of " + str(ACCEPTED_HASH_ALG))
+        if conf['hash_alg'] not in ACCEPTED_HASH_ALG and tree_base(conf['hash_alg']) not in ACCEPTED_HASH_ALG:
+            raise ValueError(TAG + ": `hash_alg` must be one of {0}, optionally followed by '-tree'".format(
+                ACCEPTED_HASH_ALG))
+
+    if 'scrub_window' in conf:
+        if not isinstance(conf['scrub_window'], int):
+            raise TypeError(TAG + ": `scrub_window` must be an int")
+        if conf['scrub_window'] < 0:
+            raise ValueError(TAG + ": `scrub_window` must be a positive number")
+
+    for name in ('journal_batch', 'journal_segment_size', 'cache_access_sample', 'tree_chunk_size'):
+        if name in conf:
+            if not isinstance(conf[name], int):
+                raise TypeError(TAG + ": `{0}` must be an int".format(name))
+            if conf[name] < 1:
+                raise ValueError(TAG + ": `{0}` must be greater than zero".format(name))
+
+    for name in ('cache_max_bytes', 'cache_max_objects'):
+        if name in conf:
+            if not isinstance(conf[name], int):
+                raise TypeError(TAG + ": `{0}` must be an int".format(name))
+            if conf[name] < 0:
+                raise ValueError(TAG + ": `{0}` must be a positive number".format(name))
+
+    if 'cache_policy' in conf:
+        if not isinstance(conf['cache_policy'], string_types):
+            raise TypeError(TAG + ": `cache_policy` must be a string")
+        if conf['cache_policy'] not in CACHE_POLICIES:
+            raise ValueError(TAG + ": `cache_policy` must be one of " + str(CACHE_POLICIES))
+
+    if 'alias_algs' in conf:
+        if not isinstance(conf['alias_algs'], list):
+            raise TypeError(TAG + ": `alias_algs` must be a list")
+        for alg in conf['alias_algs']:
+            if alg not in ACCEPTED_HASH_ALG:
+                raise ValueError(TAG + ": `alias_algs` items must be in " + str(ACCEPTED_HASH_ALG))
+        # the algorithm of a digest is told by its length
+        algorithms = conf['alias_algs'] + [conf.get('hash_alg', __defaults['hash_alg'])]
+        if len(set(digest_length(alg) for alg in algorithms)) != len(algorithms):
+            raise ValueError(TAG + ": `alias_algs` must have distinct digest lengths, different from `hash_alg`")
+
+    if 'replicas' in conf:
+        replicas = conf['replicas']
+        if not isinstance(replicas, list) or not all(isinstance(path, string_types) and path for path in replicas):
+            raise TypeError(TAG + ": `replicas` must be a list of paths")
+
+    check_bool(conf, 'refcount')
+    check_bool(conf, 'locking')
+    check_bool(conf, 'verify_on_read')
+    check_bool(conf, 'journal')
+    check_bool(conf, 'metadata')
+    check_bool(conf, 'auto_quarantine')
+
+
+def check_bool(conf, name):
+    if name in conf and not isinstance(conf[name], bool):
+        raise TypeError(TAG + ": `{0}` must be a boolean".format(name))
 
 
 def from_json_format(conf):
@@ -0,0 +1,183 @@
+from __future__ import unicode_literals
+
+import os
+import mmap
+import struct
+import binascii
+
+MAGIC = b"FSDBDSET"
+VERSION = 1
+
+# magic, version, digest size in bytes, reserved, number of digests
+HEADER = struct.Struct(">8sHHIQ")
+
+# digests read at once while iterating
+READ_BATCH = 4096
+
+# a set this many times smaller than the other one is matched by binary searches instead of a merge
+SEARCH_RATIO = 32
+
+
+class DigestSet(object):
+    '''Read-only set of binary digests stored in a file
+
+       The file is a header followed by the sorted and unique digests, all of
+       the same size, with no separators: 100M sha1 digests take 2GB and,
+       since the file is mmapped, only the pages being read are kept in memory.
+       Membership is a binary search, set operations merge two sorted streams.
+       Digests can be given either binary or hex, they are iterated binary.
+       Files are written by :py:func:`DigestSet.create()`.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            header = f.read(HEADER.size)
+            if len(header) < HEADER.size or header[:len(MAGIC)] != MAGIC:
+                raise ValueError("not a digest set file: '{0}'".format(path))
+            _, version, self.digest_size, _, self._count = HEADER.unpack(header)
+            if version != VERSION:
+                raise ValueError("unsupported digest set version {0}: '{1}'".format(version, path))
+            if os.fstat(f.fileno()).st_size != HEADER.size + self._count * self.digest_size:
+                raise ValueError("truncated digest set file: '{0}'".format(path))
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @classmethod
+    def create(cls, path, digests, digest_size):
+        '''Write a digest set file and return it opened
+
+           The file is written aside and renamed, so a set is never seen half written.
+         Args:
+            path -- path of the file
+            digests -- iterable of binary digests in ascending order, duplicates are dropped
+            digest_size -- size of the digests in bytes
+        '''
+        tmpPath = path + ".tmp"
+        count = 0
+        last = None
+        try:
+            with open(tmpPath, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, VERSION, digest_size, 0, 0))
+                for digest in digests:
+                    if len(digest) != digest_size:
+                        raise ValueError("digest of {0} bytes in a set of {1} bytes digests"
+                                         .format(len(digest), digest_size))
+                    if last is not None and digest <= last:
+                        if digest == last:
+                            continue
+                        raise ValueError("digests are not sorted")
+                    f.write(digest)
+                    last = digest
+                    count += 1
+                f.seek(0)
+                f.write(HEADER.pack(MAGIC, VERSION, digest_size, 0, count))
+            os.rename(tmpPath, path)
+        except Exception:
+            if os.path.exists(tmpPath):
+                os.remove(tmpPath)
+            raise
+        return cls(path)
+
+    def close(self):
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        size = self.digest_size
+        for first in range(0, self._count, READ_BATCH):
+            start = HEADER.size + first * size
+            data = self._mmap[start:start + min(READ_BATCH, self._count - first) * size]
+            for pos in range(0, len(data), size):
+                yield data[pos:pos + size]
+
+    def hexdigests(self):
+        '''Iterate over the digests as hex strings'''
+        for digest in self:
+            yield binascii.hexlify(digest).decode('ascii')
+
+    def __contains__(self, digest):
+        digest = self._raw(digest)
+        if digest is None:
+            return False
+        i = self._search(digest)
+        return i < self._count and self._at(i) == digest
+
+    def _search(self, digest):
+        '''Return the position of the first digest not lower than `digest`'''
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._at(mid) < digest:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _at(self, i):
+        start = HEADER.size + i * self.digest_size
+        return self._mmap[start:start + self.digest_size]
+
+    def _raw(self, digest):
+        '''Return the binary form of `digest`, None if it can not belong to this set'''
+        if len(digest) == self.digest_size * 2:
+            try:
+                return binascii.unhexlify(digest)
+            except (TypeError, ValueError):
+                return None
+        if len(digest) == self.digest_size and isinstance(digest, bytes):
+            return digest
+        return None
+
+    def diff(self, other):
+        '''Merge this set with `other`, a DigestSet or any iterable of sorted binary digests
+
+           Returns:
+             iterator over `(side, digest)` tuples where side is '<' if the digest
+             is only in this set, '>' if it is only in `other` and '=' if in both
+        '''
+        if isinstance(other, DigestSet) and other.digest_size != self.digest_size:
+            raise ValueError("can not compare digests of {0} and {1} bytes".format(self.digest_size, other.digest_size))
+        mine = iter(self)
+        others = iter(other)
+        s = next(mine, None)
+        o = next(others, None)
+        while s is not None or o is not None:
+            if o is None or (s is not None and s < o):
+                yield '<', s
+                s = next(mine, None)
+            elif s is None or o < s:
+                yield '>', o
+                o = next(others, None)
+            else:
+                yield '=', s
+                s = next(mine, None)
+                o = next(others, None)
+
+    def intersection(self, other):
+        '''Iterate in order over the digests that are also in `other`, see :py:func:`diff()`'''
+        if _searchable(other, self):
+            return (digest for digest in other if digest in self)
+        if _searchable(self, other):
+            return (digest for digest in self if digest in other)
+        return (digest for side, digest in self.diff(other) if side == '=')
+
+    def difference(self, other):
+        '''Iterate in order over the digests that are not in `other`, see :py:func:`diff()`'''
+        if _searchable(self, other):
+            return (digest for digest in self if digest not in other)
+        return (digest for side, digest in self.diff(other) if side == '<')
+
+
+def _searchable(small, big):
+    # binary searches in `big` are cheaper than reading it whole
+    if not isinstance(small, DigestSet) or not isinstance(big, DigestSet):
+        return False
+    return small.digest_size == big.digest_size and len(small) * SEARCH_RATIO < len(big)
@@ -0,0 +1,197 @@
+from __future__ import unicode_literals
+
+import os
+import time
+import errno
+
+from .locking import stripe_of
+from .striped import StripedLog
+from .utils import open_append
+
+# seconds covered by every bucket file
+BUCKET_SPAN = 3600
+
+# name of the fsdb lock stripe guarding bucket files
+LOCK_NAME = "expiry"
+
+# expire time of the records dropping the expiration of a removed file
+FORGOTTEN = "-"
+
+
+class Expiry(object):
+    '''Expiration index of files added with a time to live
+
+       Two structures are kept under `folder`:
+
+         ``buckets/<n>``   lines ``<digest> <expire time>`` of the files due between
+                           ``n * BUCKET_SPAN`` and ``(n + 1) * BUCKET_SPAN``
+         ``index``         striped log of records ``<digest> <expire time> <record time>``,
+                           expire time 0 means the file does not expire anymore,
+                           ``-`` drops the previous records of a removed file
+
+       An expiration pass only reads the buckets that are due. Buckets only tell
+       which files may be expired: the index tells whether their expiration has
+       been postponed (the latest expire time wins) or cancelled (0 wins).
+       Stored files without records never expire.
+    '''
+
+    def __init__(self, fsdb, folder):
+        self._fsdb = fsdb
+        self.folder = folder
+        self._buckets = os.path.join(folder, "buckets")
+        self._index = StripedLog(fsdb, os.path.join(folder, "index"))
+
+    def set(self, digest, ttl, stored=False):
+        '''Make the file with the given digest expire in `ttl` seconds, unless it already lives longer
+
+           With `stored` the file was already in the fsdb: files that do not expire are left alone.
+        '''
+        now = time.time()
+        expires = now + ttl
+        current = self.get(digest)
+        if current is None and stored:
+            return
+        if current is not None and (current == 0 or current >= expires):
+            return
+        self._fsdb._makedirs(self._buckets)
+        with self._fsdb._locks.stripe(LOCK_NAME, shared=True):
+            fd = open_append(self._bucket_path(int(expires // BUCKET_SPAN)), self._fsdb._conf['fmode'])
+            try:
+                os.write(fd, "{0} {1:.3f}\n".format(digest, expires).encode('ascii'))
+            finally:
+                os.close(fd)
+        self._index.append(digest, "{0:.3f}".format(expires), _timestamp(now))
+
+    def persist(self, digest):
+        '''Cancel the expiration of the file with the given digest, if any'''
+        if self.get(digest):
+            self._index.append(digest, "0", _timestamp(time.time()))
+
+    def forget(self, digest, locked=False):
+        '''Drop the expiration of a removed file, `locked` if the caller holds its stripe lock'''
+        if self.get(digest) is not None:
+            self._index.append_many([(digest, FORGOTTEN, _timestamp(time.time()))], locked)
+
+    def get(self, digest):
+        '''Return the expire time of the given digest, 0 if cancelled, None if it never had one'''
+        if not os.path.isdir(self.folder):
+            return None
+        return self._state(self._index.read_digest(digest)).get(digest)
+
+    def _state(self, records, digests=None):
+        '''Replay index records (of the given `digests` only) into a dictionary `digest -> expire time`'''
+        state = {}
+        for digest, expires, _ in records:
+            if digests is not None and digest not in digests:
+                continue
+            if expires == FORGOTTEN:
+                state.pop(digest, None)
+                continue
+            expires = float(expires)
+            if expires == 0 or state.get(digest) == 0:
+                state[digest] = 0
+            else:
+                state[digest] = max(state.get(digest, 0), expires)
+        return state
+
+    def expire(self, now):
+        '''Remove the files whose expire time is earlier than `now`
+
+           Returns:
+             `(files, bytes)` removed
+        '''
+        if not os.path.isdir(self._buckets):
+            return 0, 0
+        removed = [0, 0]
+        folders = set()
+        with self._fsdb._locks.stripe(LOCK_NAME):
+            due = sorted(int(n) for n in os.listdir(self._buckets) if n.isdigit() and int(n) <= now // BUCKET_SPAN)
+            entries = dict((bucket, list(self._read_bucket(bucket))) for bucket in due)
+            byStripe = {}
+            for bucket in due:
+                for digest, expires in entries[bucket]:
+                    if expires <= now:
+                        byStripe.setdefault(stripe_of(digest), set()).add(digest)
+            held = set()
+            snapshotted = self._fsdb._snapshots.live()
+            for stripe in sorted(byStripe):
+                held.update(self._expire_stripe(stripe, byStripe[stripe], now, removed, folders, snapshotted))
+
+            # the current bucket may hold files due later, held files are reconsidered next time
+            for bucket in due:
+                pending = [e for e in entries[bucket] if e[1] > now or e[0] in held]
+                path = self._bucket_path(bucket)
+                if pending:
+                    self._rewrite_bucket(path, pending)
+                else:
+                    os.remove(path)
+
+        # every folder is pruned once, deepest first, after all removals
+        for digest, folder in sorted(folders, key=lambda f: f[1], reverse=True):
+            with self._fsdb._tree_lock(digest):
+                self._fsdb._prune(folder)
+        return tuple(removed)
+
+    def _expire_stripe(self, stripe, digests, now, removed, folders, snapshotted):
+        '''Remove the expired files among `digests`, return the ones that could not be removed
+
+           `snapshotted` are the digest sets of the snapshots, see :py:func:`Snapshots.live()`
+        '''
+        held = set()
+        with self._fsdb._locks.stripe(stripe):
+            records = list(self._index.read(stripe))
+            state = self._state(records, digests)
+            gone = set()
+            for digest in digests:
+                expires = state.get(digest)
+                if expires is None:
+                    # removed or replaced by a file without expiration
+                    gone.add(digest)
+                    continue
+                if expires == 0 or expires > now:
+                    continue
+                if not self._fsdb._expirable(digest, snapshotted):
+                    held.add(digest)
+                    continue
+                path = self._fsdb.get_file_path(digest)
+                try:
+                    size = os.path.getsize(path)
+                    self._fsdb._remove_file(digest, locked=True)
+                except OSError as e:
+                    if e.errno != errno.ENOENT:
+                        raise
+                    size = None
+                gone.add(digest)
+                if size is not None:
+                    removed[0] += 1
+                    removed[1] += size
+                    folders.add((digest, os.path.dirname(path)))
+            if gone:
+                self._index.rewrite(stripe, [r for r in records if r[0] not in gone])
+        return held
+
+    def _read_bucket(self, bucket):
+        try:
+            with open(self._bucket_path(bucket), 'rb') as f:
+                data = f.read().decode('ascii')
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                return
+            raise
+        for line in data.splitlines():
+            digest, expires = line.split(" ")
+            yield digest, float(expires)
+
+    def _rewrite_bucket(self, path, entries):
+        tmpPath = path + ".tmp"
+        with open(tmpPath, 'wb') as f:
+            f.write("".join("{0} {1:.3f}\n".format(*e) for e in entries).encode('ascii'))
+        os.chmod(tmpPath, self._fsdb._conf['fmode'])
+        os.rename(tmpPath, path)
+
+    def _bucket_path(self, bucket):
+        return os.path.join(self._buckets, str(bucket))
+
+
+def _timestamp(t):
+    return "{0:.6f}".format(t)
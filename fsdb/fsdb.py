@@ -1,16 +1,71 @@
 from __future__ import unicode_literals
 
+import io
 import os
 import sys
 import errno
+import time
+import uuid
+import binascii
 import stat
 import unicodedata
 import logging
+import atexit
+import contextlib
+import collections
+from multiprocessing.pool import ThreadPool
 
 from . import config
 from . import hashtools
-from .utils import copy_content
+from . import iohints
+from . import sync
+from . import archive
+from . import repair
+from . import snapshots
+from . import scrub
+from . import journal
+from .journal import Journal
+from .cache import Cache
+from .aliases import Aliases
+from .metadata import Metadata
+from .expiry import Expiry
+from .uploads import Uploads
+from .digestset import DigestSet
+from .layout import Layout
+from .snapshots import Snapshots
+from .utils import copy_content, list_dir, umask, physical_order_key
 from .compat import string_types
+from .locking import StripedLock
+from .refcount import RefCounts
+from .verify import VerifyingReader, BackgroundVerifier, CorruptedError
+from .scrub import ScrubMarkers
+
+
+@contextlib.contextmanager
+def _nolock():
+    yield
+
+
+def _content_size(origin, staged=None):
+    """Return the size of the content :py:func:`Fsdb.add()` is going to store"""
+    if staged is not None:
+        return os.path.getsize(staged)
+    if hasattr(origin, 'read'):
+        pos = origin.tell()
+        origin.seek(0, os.SEEK_END)
+        size = origin.tell() - pos
+        origin.seek(pos)
+        return size
+    return os.path.getsize(origin)
+
+
+def _seekable(fileobj):
+    if not hasattr(fileobj, 'seek'):
+        return False
+    return fileobj.seekable() if hasattr(fileobj, 'seekable') else True
+
+
+atexit.register(journal.flush_all)
 
 
 class Fsdb(object):
@@ -22,9 +77,12 @@ class Fsdb(object):
     """
 
     BLOCK_SIZE = 2**20
+    # how many times an operation is retried when it races with a concurrent one
+    RACE_RETRIES = 5
     CONFIG_FILE = ".fsdb.conf"
+    AUX_DIR = ".fsdb"
 
-    def __init__(self, fsdbRoot, depth=None, hash_alg=None, fmode=None, dmode=None):
+    def __init__(self, fsdbRoot, depth=None, hash_alg=None, fmode=None, dmode=None, **options):
         """Create an fsdb instance.
 
         If file named ".fsdb.conf" it is found in @fsdbRoot,
@@ -41,6 +99,7 @@ class Fsdb(object):
               to use for files creation (default: "660")
             dmode  -- string reppresenting the mask (octal) \
               to use for folders creation (default depends on fmode)
+            options -- any other config option, see the configuration documentation
         """
 
         self.logger = logging.getLogger(__name__)
@@ -59,6 +118,10 @@ class Fsdb(object):
 
         conf = config.get_defaults()
 
+        for name in options:
+            if name not in conf:
+                raise TypeError("unexpected config option: '{0}'".format(name))
+
         if Fsdb.config_exists(fsdbRoot):
             # warn user about config ignoring and load config from file
             self.logger.debug("Fsdb config file found. Runtime parameters will be ignored. [" + configPath + "]")
@@ -77,6 +140,7 @@ class Fsdb(object):
                 conf['fmode'] = fmode
             if dmode is not None:
                 conf['dmode'] = dmode
+            conf.update(options)
 
             self._conf = config.normalize_conf(conf)
 
@@ -88,48 +152,103 @@ class Fsdb(object):
 
         # fsdbRoot it is an existing regular folder and we have read and write permission
         self.fsdbRoot = fsdbRoot
+        self._layout = Layout(fsdbRoot, self._conf['depth'], hashtools.digest_length(self._conf['hash_alg']))
+
+        self._locks = StripedLock(self, self._aux_path("locks"))
+        self._refs = RefCounts(self, self._aux_path("refs")) if self._conf['refcount'] else None
+        self._scrub_markers = ScrubMarkers(self, self._aux_path("scrub"))
+        self._verifier = BackgroundVerifier(self)
+        self._journal = None
+        if self._conf['journal']:
+            self._journal = Journal(self, self._aux_path("journal"),
+                                    self._conf['journal_batch'], self._conf['journal_segment_size'])
+        self._cache = None
+        if self._conf['cache_max_bytes'] or self._conf['cache_max_objects']:
+            self._cache = Cache(self, self._aux_path("cache"), self._conf['cache_max_bytes'],
+                                self._conf['cache_max_objects'], self._conf['cache_policy'],
+                                self._conf['cache_access_sample'])
+        self._aliases = None
+        if self._conf['alias_algs']:
+            lengths = dict((alg, hashtools.digest_length(alg)) for alg in self._conf['alias_algs'])
+            self._aliases = Aliases(self, self._aux_path("aliases"), self._conf['alias_algs'], lengths)
+        self._meta = Metadata(self, self._aux_path("meta.sqlite")) if self._conf['metadata'] else None
+        self._expiry = Expiry(self, self._aux_path("expiry"))
+        self._uploads = Uploads(self, self._aux_path("uploads"))
+        self._snapshots = Snapshots(self, self._aux_path("snapshots"))
 
         self.logger.debug("Fsdb initialized successfully: " + self.__str__())
 
-    def _calc_digest(self, origin):
+    def _aux_path(self, *parts):
+        """Return the path of an fsdb private file or folder"""
+        return os.path.join(self.fsdbRoot, Fsdb.AUX_DIR, *parts)
+
+    def _calc_digest(self, origin, algorithm=None, io_class=None):
         """calculate digest for the given file or readable/seekable object
 
          Args:
             origin -- could be the path of a file or a readable/seekable object ( fileobject, stream, stringIO...)
+            algorithm -- algorithm or list of algorithms to use (default: `hash_alg`)
+            io_class -- page cache hints used reading a path, see :py:func:`check()`
          Returns:
-            String rapresenting the digest for the given origin
+            String rapresenting the digest for the given origin,
+            a dictionary `algorithm -> digest` if a list of algorithms is given
         """
+        algorithm = algorithm or self._conf['hash_alg']
         if hasattr(origin, 'read') and hasattr(origin, 'seek'):
             pos = origin.tell()
-            digest = hashtools.calc_digest(origin, algorithm=self._conf['hash_alg'])
+            digest = hashtools.calc_digest(origin, algorithm=algorithm, chunk_size=self._conf['tree_chunk_size'])
             origin.seek(pos)
         else:
-            digest = hashtools.calc_file_digest(origin, algorithm=self._conf['hash_alg'])
+            digest = hashtools.calc_file_digest(origin, algorithm=algorithm, io_class=io_class,
+                                                chunk_size=self._conf['tree_chunk_size'])
         return digest
 
-    def _copy_content(self, origin, dstPath):
+    def _hash_algorithms(self):
+        """Return the list of algorithms computed when a file is added, `hash_alg` first"""
+        return [self._conf['hash_alg']] + self._conf['alias_algs']
+
+    def _new_hash(self):
+        """Return a hash object computing `hash_alg`, and the alias algorithms if enabled"""
+        if self._aliases is not None:
+            return hashtools.MultiHash(self._hash_algorithms(), self._conf['tree_chunk_size'])
+        return hashtools.new(self._conf['hash_alg'], self._conf['tree_chunk_size'])
+
+    def _digests(self, hashM):
+        """Return `(digest, aliases)` computed by a hash object of :py:func:`_new_hash()`"""
+        if self._aliases is None:
+            return hashM.hexdigest(), None
+        aliases = hashM.hexdigests()
+        return aliases.pop(self._conf['hash_alg']), aliases
+
+    def _copy_content(self, origin, dstPath, expected=None, io_class=None):
         """copy the content of origin into dstPath
 
            Due to concurrency problem, the content will be first
            copied to a temporary file alongside `dstPath` and
-           then atomically moved to `dstPath`
+           then atomically moved to `dstPath`.
+           If `expected` is given the content is hashed while copied and
+           moved to `dstPath` only if its digest matches.
+           `io_class` selects the page cache hints, see :py:func:`check()`.
+           Returns the hash object used, if any.
         """
-
+        hashM = None
+        if expected is not None:
+            hashM = self._new_hash()
         if hasattr(origin, 'read'):
-            copy_content(origin, dstPath, self.BLOCK_SIZE, self._conf['fmode'])
+            copy_content(origin, dstPath, self.BLOCK_SIZE, self._conf['fmode'], hashM, expected, io_class)
         elif os.path.isfile(origin):
             with open(origin, 'rb') as f:
-                copy_content(f, dstPath, self.BLOCK_SIZE, self._conf['fmode'])
+                iohints.start_read(f.fileno(), io_class)
+                copy_content(f, dstPath, self.BLOCK_SIZE, self._conf['fmode'], hashM, expected, io_class)
+                iohints.end_read(f.fileno(), io_class)
         else:
             raise ValueError("Could not copy content, `origin` should be a path or a readable object")
+        return hashM
 
     def _create_empty_file(self, path):
-        oldmask = os.umask(0)
-        try:
+        with umask(0):
             fd = os.open(path, os.O_CREAT | os.O_WRONLY, self._conf['fmode'])
-            os.close(fd)
-        finally:
-            os.umask(oldmask)
+        os.close(fd)
 
     def _makedirs(self, path):
         """Make folders recursively for the given path and
@@ -138,13 +257,13 @@ class Fsdb(object):
             path -- path to the leaf folder
         """
         try:
-            oldmask = os.umask(0)
-            os.makedirs(path, self._conf['dmode'])
-            os.umask(oldmask)
+            with umask(0):
+                os.makedirs(path, self._conf['dmode'])
         except OSError as e:
             if(e.errno == errno.EACCES):
                 raise Exception('not sufficent permissions to write on fsdb folder: "{0}"'.format(path))
             elif(e.errno == errno.EEXIST):
+                # could raise ENOENT if pruned by a concurrent remove(), callers retry
                 fstat = os.stat(path)
                 if not stat.S_ISDIR(fstat.st_mode):
                     raise Exception('fsdb folder already exists but it is not a regular folder: "{0}"'.format(path))
@@ -153,54 +272,636 @@ class Fsdb(object):
             else:
                 raise e
 
-    def add(self, origin):
+    def add(self, origin, digest=None, deferred=False, meta=None, ttl=None):
         """Add new element to fsdb.
 
          Args:
-            origin -- could be the path of a file or a readable/seekable object ( fileobject, stream, stringIO...)
+            origin -- could be the path of a file or a readable object ( fileobject, stream, stringIO...).
+              Objects that are not seekable (pipes, sockets) are staged and hashed in a single pass
+            digest -- the digest of `origin` if already known. If such a file is already stored
+              `origin` is not read at all, otherwise the content is verified while it is copied
+              and ``CorruptedError`` is raised on mismatch
+            deferred -- with a known `digest`, copy without hashing and verify the file on a
+              background thread instead, corrupted files are moved to quarantine.
+              See :py:func:`wait_verification()`
+            meta -- metadata of the file, see :py:func:`set_meta()`. They are written
+              before the file is placed: if they can not be written the file is not added
+            ttl -- number of seconds after which the file is removed by :py:func:`expire()`.
+              Adding an already stored file can only postpone its expiration, files stored
+              without `ttl` never expire and adding a file without `ttl` cancels its expiration
          Returns:
             String rapresenting the digest of the file
         """
+        if meta is not None:
+            self._require_metadata()
+
+        trusted = digest is not None
+        aliases = None
+        staged = None
+        if not trusted:
+            if hasattr(origin, 'read') and not _seekable(origin):
+                staged, hashM = self._stage(origin)
+                digest, aliases = self._digests(hashM)
+            elif self._aliases is not None:
+                # secondary digests are computed in the same read pass
+                aliases = self._calc_digest(origin, self._hash_algorithms())
+                digest = aliases.pop(self._conf['hash_alg'])
+            else:
+                digest = self._calc_digest(origin)
+        return self._store(origin, digest, aliases, staged, trusted, deferred, meta, ttl)
 
-        digest = self._calc_digest(origin)
+    def _store(self, origin, digest, aliases=None, staged=None, trusted=False, deferred=False, meta=None, ttl=None,
+               io_class=None):
+        """Store `origin`, or the `staged` file, under `digest` unless it is already stored
 
+          Args:
+            aliases -- secondary digests to register
+            staged -- path of a file already hashed, it is moved into the tree or removed
+            trusted -- `digest` has not been computed from the content, see :py:func:`add()`
+            io_class -- page cache hints, see :py:func:`check()`
+          Returns:
+            the digest
+        """
+        if self._refs is None:
+            return self._store_content(origin, digest, aliases, staged, trusted, deferred, meta, ttl, io_class)
+        # the reference is recorded before placing the file,
+        # so that a concurrent gc() can not collect it
+        self._refs.incr(digest)
+        try:
+            return self._store_content(origin, digest, aliases, staged, trusted, deferred, meta, ttl, io_class)
+        except Exception:
+            self._refs.decr(digest)
+            raise
+
+    def _store_content(self, origin, digest, aliases, staged, trusted, deferred, meta, ttl, io_class):
+        """Body of :py:func:`_store()`, references are handled by the caller"""
         if self.exists(digest):
             self.logger.debug('Added File: [{0}] ( Already exists. Skipping transfer)'.format(digest))
+            if staged is not None:
+                os.remove(staged)
+            if self._cache is not None:
+                self._cache.accessed(digest)
+            if aliases:
+                self._aliases.register(digest, aliases)
+            if meta is not None:
+                self.set_meta(digest, meta)
+            if ttl is not None:
+                self._expiry.set(digest, ttl, stored=True)
+            else:
+                self._expiry.persist(digest)
             return digest
 
+        if meta is not None and staged is None and hasattr(origin, 'read') and not _seekable(origin):
+            # the size of a stream is known only once read: stage it, verifying the digest meanwhile
+            staged, hashM = self._stage(origin)
+            if self._digests(hashM)[0] != digest:
+                os.remove(staged)
+                raise CorruptedError(digest)
+            deferred = False
+        if meta is not None:
+            # written before placing the file: a failure never removes
+            # a file stored by a concurrent add() of the same content
+            try:
+                self._meta.set_many([(digest, _content_size(origin, staged), meta)])
+            except Exception:
+                if staged is not None:
+                    os.remove(staged)
+                raise
+        try:
+            if staged is not None:
+                absPath = self._place(staged, digest)
+            else:
+                absPath = self._insert(origin, digest, verify=trusted and not deferred, io_class=io_class)
+        except Exception:
+            if meta is not None and not self.exists(digest):
+                self._meta.delete(digest)
+            raise
+        if ttl is not None:
+            self._expiry.set(digest, ttl)
+        if aliases:
+            self._aliases.register(digest, aliases)
+        if trusted and deferred:
+            self._verifier.submit(digest)
+
+        self.logger.debug('Added file: "{0}" [{1}]'.format(digest, absPath))
+
+        return digest
+
+    def _insert(self, origin, digest, verify=False, io_class=None):
+        """Place the content of `origin` in the tree under the given digest
+
+           The digest is trusted unless `verify` is true, in that case the
+           content is hashed while copied and ``CorruptedError`` is raised on mismatch.
+           `io_class` selects the page cache hints, see :py:func:`check()`.
+          Returns:
+            absolute path of the inserted file
+        """
         absPath = self.get_file_path(digest)
         absFolderPath = os.path.dirname(absPath)
 
-        # make all parent directories if they do not exist
-        self._makedirs(absFolderPath)
-        self._copy_content(origin, absPath)
+        try:
+            with self._tree_lock(digest, shared=True):
+                for attempt in range(Fsdb.RACE_RETRIES, -1, -1):
+                    try:
+                        # make all parent directories if they do not exist
+                        self._makedirs(absFolderPath)
+                        hashM = self._copy_content(origin, absPath, digest if verify else None, io_class)
+                        break
+                    except OSError as e:
+                        # a concurrent remove() pruned the folders we just made.
+                        # Nothing has been read from `origin` yet: the temporary
+                        # file is created before copying and keeps the folder alive
+                        if e.errno != errno.ENOENT or attempt == 0 or not os.path.exists(self.fsdbRoot):
+                            raise
+                        self.logger.debug("Folder pruned while adding [{0}], retrying".format(digest))
+        except Exception:
+            # e.g. CorruptedError, do not leave the folders just made behind
+            with self._tree_lock(digest):
+                self._prune(absFolderPath)
+            raise
+        if isinstance(hashM, hashtools.MultiHash):
+            self._aliases.register(digest, self._digests(hashM)[1])
+        self._inserted(digest, absPath)
+        return absPath
 
-        self.logger.debug('Added file: "{0}" [{1}]'.format(digest, absPath))
+    def _stage(self, origin):
+        """Copy `origin` into the staging folder hashing it at the same time
 
-        return digest
+          Returns:
+            `(path, hash object)` of the staged file
+        """
+        folder = self._aux_path("staging")
+        self._makedirs(folder)
+        hashM = self._new_hash()
+        path = os.path.join(folder, uuid.uuid4().hex)
+        copy_content(origin, path, self.BLOCK_SIZE, self._conf['fmode'], hashM)
+        return path, hashM
+
+    def _place(self, stagedPath, digest):
+        """Move a staged file in the tree under the given digest
+
+          Returns:
+            absolute path of the inserted file
+        """
+        absPath = self.get_file_path(digest)
+        absFolderPath = os.path.dirname(absPath)
+
+        with self._tree_lock(digest, shared=True):
+            for attempt in range(Fsdb.RACE_RETRIES, -1, -1):
+                try:
+                    self._makedirs(absFolderPath)
+                    os.rename(stagedPath, absPath)
+                    break
+                except OSError as e:
+                    # a concurrent remove() pruned the folders we just made
+                    if e.errno != errno.ENOENT or attempt == 0 or not os.path.exists(stagedPath):
+                        if os.path.exists(stagedPath):
+                            os.remove(stagedPath)
+                        raise
+                    self.logger.debug("Folder pruned while adding [{0}], retrying".format(digest))
+        self._inserted(digest, absPath)
+        return absPath
+
+    def _inserted(self, digest, absPath):
+        """Called every time a new file has been placed in the tree"""
+        if self._journal is not None:
+            self._journal.record(journal.ADDED, digest)
+        if self._cache is not None:
+            self._cache.inserted(digest, os.path.getsize(absPath))
+
+    def begin_upload(self):
+        """Start a resumable upload
+
+          The content is sent in chunks with :py:func:`append()` and stored with
+          :py:func:`commit()`. Uploads are kept on disk until committed or aborted,
+          a client can resume them from :py:func:`upload_offset()` also after a restart.
+          Returns:
+            the id of the upload
+        """
+        return self._uploads.begin()
+
+    def append(self, upload_id, offset, data):
+        """Append a chunk to an upload
+
+         Args:
+            upload_id -- id returned by :py:func:`begin_upload()`
+            offset -- position of `data` in the content. It can not be past the bytes received so far,
+              the ones of `data` already received are skipped (``ValueError`` otherwise)
+            data -- bytes of the chunk
+         Returns:
+            number of bytes received so far
+        """
+        return self._uploads.append(upload_id, offset, data)
+
+    def upload_offset(self, upload_id):
+        """Return the number of bytes received by an upload, the offset to resume from"""
+        return self._uploads.offset(upload_id)
+
+    def uploads(self):
+        """Iterate over `(upload_id, offset, mtime)` of the uploads not committed nor aborted"""
+        return iter(self._uploads)
+
+    def commit(self, upload_id, digest=None, meta=None, ttl=None):
+        """Store the content of an upload
+
+          The content has already been hashed while received and the
+          upload file is renamed into the tree: nothing is copied.
+         Args:
+            upload_id -- id returned by :py:func:`begin_upload()`
+            digest -- the expected digest, on mismatch the upload is discarded and ``CorruptedError`` is raised
+            meta -- metadata of the file, see :py:func:`add()`
+            ttl -- time to live of the file, see :py:func:`add()`
+         Returns:
+            String rapresenting the digest of the file
+        """
+        if meta is not None:
+            self._require_metadata()
+        with self._uploads.finish(upload_id) as (path, hashM):
+            actual, aliases = self._digests(hashM)
+            if digest is not None and digest != actual:
+                os.remove(path)
+                raise CorruptedError(digest, path)
+            return self._store(None, actual, aliases, staged=path, meta=meta, ttl=ttl)
+
+    def abort(self, upload_id):
+        """Discard an upload"""
+        self._uploads.abort(upload_id)
+
+    def changes(self, since=0):
+        """Iterate over the changes recorded after the given sequence number
+
+          Requires the `journal` config option. Consumers should store the
+          sequence number of the last processed change and resume from there.
+          Returns:
+            iterator over `(seq, op, digest)` where op is '+' for added files
+            and '-' for removed ones
+        """
+        return self._require_journal().changes(since)
+
+    def journal_seq(self):
+        """Return the sequence number of the last recorded change"""
+        return self._require_journal().last_seq()
+
+    def compact_journal(self):
+        """Merge old journal segments keeping only the last change of every digest
+
+          Returns:
+            number of dropped records
+        """
+        return self._require_journal().compact()
+
+    def flush(self):
+        """Write buffered journal and cache access records"""
+        if self._journal is not None:
+            self._journal.flush()
+        if self._cache is not None:
+            self._cache.flush()
+
+    def close(self):
+        """Flush buffered records and wait for background verifications and evictions"""
+        self.flush()
+        self.wait_verification()
+        if self._cache is not None:
+            self._cache.join()
+        if self._meta is not None:
+            self._meta.close()
+        self._snapshots.close()
+
+    def cache_usage(self):
+        """Return the number of stored files and their total size in bytes
+
+          Requires the cache mode, where usage is kept up to date at every change.
+        """
+        return self._require_cache().usage()
+
+    def evict(self):
+        """Evict files, according to the cache policy, until usage is below the cache budgets
+
+          Eviction is also started automatically on a background thread
+          when an insertion exceeds the budgets.
+          Returns:
+            `(files, bytes)` evicted
+        """
+        return self._require_cache().evict()
+
+    def _evictable(self, digest, snapshotted=None):
+        """Tell whether the cache is allowed to evict the given digest
+
+          Args:
+            snapshotted -- digest sets of the snapshots loaded once per eviction, see :py:func:`Snapshots.live()`
+        """
+        if self._refs is not None:
+            count, pins = self._refs.get(digest)
+            if count or pins:
+                return False
+        return not self._snapshots.holds(digest, snapshotted)
+
+    def _require_cache(self):
+        if self._cache is None:
+            raise ValueError("cache mode is not enabled for this fsdb: {0}".format(self.fsdbRoot))
+        return self._cache
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def set_meta(self, digest, meta):
+        """Set the metadata of a stored file
+
+          Requires the `metadata` config option.
+          Args:
+            digest -- digest of a stored file
+            meta -- dictionary of metadata: "content_type", "filename" and "owner"
+              are indexed, "tags" is a list of strings replacing the current ones,
+              other json serializable values are stored as they are.
+              Previous metadata, but tags when not given, are replaced.
+        """
+        self.set_meta_many([(digest, meta)])
+
+    def set_meta_many(self, items):
+        """Set the metadata of many stored files in a single transaction
+
+          Args:
+            items -- iterable of `(digest, meta)`, see :py:func:`set_meta()`
+        """
+        meta = self._require_metadata()
+        rows = []
+        for digest, fields in items:
+            try:
+                rows.append((digest, os.path.getsize(self.get_file_path(digest)), fields))
+            except OSError:
+                raise KeyError("no stored file found for '{0}'".format(digest))
+        meta.set_many(rows)
+
+    def get_meta(self, digest):
+        """Return the metadata of a stored file, None if it has none
+
+          Beside the fields given to :py:func:`set_meta()` the returned dictionary
+          holds the "size" of the file, its "tags" and the "created" timestamp.
+        """
+        return self._require_metadata().get(digest)
+
+    def query(self, tags=(), min_size=None, max_size=None, content_type=None, filename=None, owner=None):
+        """Iterate over the digests of the files whose metadata match all the given conditions
+
+          Conditions are resolved through the indexes of the metadata database,
+          digests are returned in lexicographic order as they are found.
+          Args:
+            tags -- list of tags the files must all have
+            min_size -- minimum size in bytes
+            max_size -- maximum size in bytes
+            content_type, filename, owner -- exact values of these fields
+        """
+        if isinstance(tags, string_types):
+            tags = [tags]
+        fields = dict((name, value) for name, value in
+                      (('content_type', content_type), ('filename', filename), ('owner', owner))
+                      if value is not None)
+        return self._require_metadata().query(tags, min_size, max_size, **fields)
+
+    def expire(self, now=None):
+        """Remove the files added with a `ttl` that is over
+
+          Only the expiration buckets (one per hour) that are due are read,
+          files are removed in batch and every emptied folder is pruned once.
+          Files pinned (see :py:func:`pin()`) are kept.
+          Args:
+            now -- expire the files due at this time (default: now)
+          Returns:
+            `(files, bytes)` removed
+        """
+        files, size = self._expiry.expire(time.time() if now is None else now)
+        self.logger.debug("Expired {0} files, {1} bytes".format(files, size))
+        return files, size
+
+    def expires(self, digest):
+        """Return the time the file with the given digest expires at, None if it does not expire"""
+        return self._expiry.get(digest) or None
+
+    def _expirable(self, digest, snapshotted=None):
+        """Tell whether an expired file can be removed
+
+          Args:
+            snapshotted -- digest sets of the snapshots loaded once per expiration, see :py:func:`Snapshots.live()`
+        """
+        if self._refs is not None and self._refs.get(digest)[1]:
+            return False
+        return not self._snapshots.holds(digest, snapshotted)
+
+    def _require_metadata(self):
+        if self._meta is None:
+            raise ValueError("metadata is not enabled for this fsdb: {0}".format(self.fsdbRoot))
+        return self._meta
+
+    def _require_journal(self):
+        if self._journal is None:
+            raise ValueError("journal is not enabled for this fsdb: {0}".format(self.fsdbRoot))
+        return self._journal
+
+    def wait_verification(self):
+        """Wait for the background verification of the files added with `deferred`"""
+        self._verifier.join()
+
+    def quarantine(self, digest):
+        """Move the file with the given digest out of the tree, into the quarantine folder
+
+          The file is moved with an atomic rename and its metadata are kept.
+          Reads of quarantined digests raise ``CorruptedError``, see :py:func:`repair()`.
+        """
+        folder = self._aux_path("quarantine")
+        self._makedirs(folder)
+        absPath = self.get_file_path(digest)
+        size = os.path.getsize(absPath) if self._cache is not None else 0
+        os.rename(absPath, os.path.join(folder, digest))
+        if self._journal is not None:
+            self._journal.record(journal.REMOVED, digest)
+        if self._cache is not None:
+            self._cache.removed(digest, size)
+        with self._tree_lock(digest):
+            self._prune(os.path.dirname(absPath))
+        self.logger.warning('Quarantined corrupted file: "{0}" [{1}]'.format(absPath, digest))
+
+    def quarantined(self):
+        """Iterate in lexicographic order over the digests of the quarantined files"""
+        folder = self._aux_path("quarantine")
+        if not os.path.isdir(folder):
+            return
+        for name, is_dir in list_dir(folder):
+            if not is_dir and self._layout.valid(name):
+                yield name
+
+    def is_quarantined(self, digest):
+        """Tell whether the file with the given digest has been quarantined"""
+        return self._layout.valid(digest) and os.path.isfile(self._aux_path("quarantine", digest))
+
+    def repair(self, digests=None, replicas=None, workers=4, callback=None):
+        """Restore quarantined files from replicas
+
+          Every file is copied back from the first replica holding an intact copy,
+          its content is verified while copied. Files are restored in parallel.
+         Args:
+            digests -- digests to repair (default: all the quarantined ones)
+            replicas -- Fsdb instances or root paths to restore from (default: `replicas` config option)
+            workers -- number of files restored in parallel
+            callback -- called as `callback(digest, source)` after every attempt, `source`
+              is the root of the fsdb the file has been restored from, None on failure
+         Returns:
+            `(repaired, failed)` lists of digests
+        """
+        if digests is None:
+            digests = self.quarantined()
+        if replicas is None:
+            replicas = self._conf['replicas']
+        return repair.repair(self, digests, replicas, workers, callback)
+
+    def _unquarantine(self, digest):
+        """Drop the quarantined copy of a file that is stored again"""
+        try:
+            os.remove(self._aux_path("quarantine", digest))
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+    def _tree_lock(self, digest, shared=False):
+        """Lock the folders of the given digest against concurrent pruning
+
+           Adding files takes the lock in shared mode, pruning in exclusive mode.
+           When the `locking` config option is disabled races are handled by retrying.
+        """
+        if self._conf['locking']:
+            return self._locks.digest(digest, shared)
+        return _nolock()
 
     def remove(self, digest):
         """Remove an existing file from fsdb.
            File with the given digest will be removed from fsdb and
-           the directory tree will be cleaned (remove empty folders)
+           the directory tree will be cleaned (remove empty folders).
+           The file is removed even if it is still referenced.
          Args:
-            digest -- digest of the file to remove
+            digest -- digest (or alias) of the file to remove
+        """
+        digest = self.resolve(digest)
+        if not self._layout.valid(digest):
+            raise OSError(errno.ENOENT, "no such file in fsdb: '{0}'".format(digest))
+        absPath = self._remove_file(digest)
+        with self._tree_lock(digest):
+            self._prune(os.path.dirname(absPath))
+        if self._refs is not None:
+            self._refs.reset(digest)
+
+        self.logger.debug('Removed file: "{0}" [{1}]'.format(absPath, digest))
+
+    def _remove_file(self, digest, locked=False):
+        """Remove the file with the given digest without cleaning the directory tree
+
+          Args:
+            locked -- the caller holds the lock of the digest stripe
+          Returns:
+            absolute path of the removed file
         """
-        # remove file
         absPath = self.get_file_path(digest)
+        size = os.path.getsize(absPath) if self._cache is not None else 0
         os.remove(absPath)
+        if self._journal is not None:
+            self._journal.record(journal.REMOVED, digest)
+        if self._cache is not None:
+            self._cache.removed(digest, size, locked)
+        if self._meta is not None:
+            self._meta.delete(digest)
+        self._expiry.forget(digest, locked)
+        return absPath
 
-        # clean directory tree
-        tmpPath = os.path.dirname(absPath)
+    def _prune(self, folder):
+        """Remove `folder` and its parents as long as they are empty"""
+        tmpPath = folder
         while tmpPath != self.fsdbRoot:
             if os.path.islink(tmpPath):
                 raise Exception('fsdb found a link in db tree: "{0}"'.format(tmpPath))
-            if len(os.listdir(tmpPath)) > 0:
-                break
-            os.rmdir(tmpPath)
+            try:
+                if len(os.listdir(tmpPath)) > 0:
+                    break
+                os.rmdir(tmpPath)
+            except OSError as e:
+                # somebody else is filling (or pruning) the same folder
+                if e.errno in (errno.ENOENT, errno.ENOTEMPTY, errno.EEXIST):
+                    break
+                raise
             tmpPath = os.path.dirname(tmpPath)
 
-        self.logger.debug('Removed file: "{0}" [{1}]'.format(absPath, digest))
+    def release(self, digest):
+        """Drop a reference to the file with the given digest
+
+           The file is not removed immediately, files left
+           without references nor pins are removed by :py:func:`gc()`.
+           Requires the `refcount` config option.
+         Args:
+            digest -- digest of the file to release
+        """
+        refs = self._require_refcount()
+        if not self.exists(digest):
+            raise KeyError("no stored file found for '{0}'".format(digest))
+        refs.decr(digest)
+
+    def pin(self, digest, name):
+        """Protect the file with the given digest from :py:func:`gc()` under the given pin name
+
+           Requires the `refcount` config option.
+        """
+        refs = self._require_refcount()
+        if not self.exists(digest):
+            raise KeyError("no stored file found for '{0}'".format(digest))
+        refs.pin(digest, name)
+
+    def unpin(self, digest, name):
+        """Remove the named pin from the file with the given digest"""
+        self._require_refcount().unpin(digest, name)
+
+    def refcount(self, digest):
+        """Return the number of references to the file with the given digest"""
+        return self._require_refcount().get(digest)[0]
+
+    def pins(self, digest):
+        """Return the set of pin names of the file with the given digest"""
+        return set(self._require_refcount().get(digest)[1])
+
+    def gc(self):
+        """Remove all the files that have been released and are not pinned
+
+           Files are processed one lock stripe at a time, while a stripe is
+           collected concurrent :py:func:`add()` of its digests wait.
+           Files that were never referenced (i.e. added before enabling
+           `refcount`) are never collected, files listed in a snapshot
+           are collected once the snapshot is released.
+          Returns:
+            number of removed files
+        """
+        refs = self._require_refcount()
+        removed = 0
+        snapshotted = self._snapshots.live()
+        for stripe in refs.stripes():
+            with self._locks.stripe(stripe):
+                state = refs.state(stripe)
+                folders = set()
+                for digest, (count, pins) in list(state.items()):
+                    if count > 0 or pins or self._snapshots.holds(digest, snapshotted):
+                        continue
+                    if self.exists(digest):
+                        folders.add(os.path.dirname(self._remove_file(digest, locked=True)))
+                        removed += 1
+                    del state[digest]
+                refs.compact(stripe, state)
+                for folder in folders:
+                    self._prune(folder)
+        self.logger.debug("Garbage collected {0} files".format(removed))
+        return removed
+
+    def _require_refcount(self):
+        if self._refs is None:
+            raise ValueError("reference counting is not enabled for this fsdb: {0}".format(self.fsdbRoot))
+        return self._refs
 
     def exists(self, digest):
         """Check file existence in fsdb
@@ -210,39 +911,163 @@ class Fsdb(object):
         """
         if not isinstance(digest, string_types):
             raise TypeError("digest must be a string")
-        return os.path.isfile(self.get_file_path(digest))
+        digest = self.resolve(digest)
+        # malformed digests can not be stored
+        return self._layout.valid(digest) and os.path.isfile(self._layout.join(digest))
+
+    def exists_many(self, digests, workers=4):
+        """Check the existence of many files at once
+
+          Digests are grouped by the folder they would be stored in and each
+          folder holding more than one of them is listed just once, instead of
+          checking every digest on its own. Folders are probed in parallel.
+          Args:
+            digests -- iterable of digests
+            workers -- number of folders probed in parallel
+          Returns:
+            the set of given digests that are stored in this fsdb
+        """
+        groups = collections.defaultdict(list)
+        for digest in digests:
+            if not isinstance(digest, string_types):
+                raise TypeError("digest must be a string")
+            resolved = self.resolve(digest)
+            if self._layout.valid(resolved):
+                folder, name = self._layout.split(resolved)
+                groups[folder].append((name, digest))
+
+        def probe(folder):
+            candidates = groups[folder]
+            if len(candidates) == 1:
+                name, digest = candidates[0]
+                return [digest] if os.path.isfile(os.path.join(folder, name)) else []
+            try:
+                names = set(os.listdir(folder))
+            except OSError as e:
+                if e.errno in (errno.ENOENT, errno.ENOTDIR):
+                    return []
+                raise
+            return [digest for name, digest in candidates if name in names]
+
+        found = set()
+        if workers > 1 and len(groups) > 1:
+            pool = ThreadPool(min(workers, len(groups)))
+            try:
+                for present in pool.imap_unordered(probe, groups, 16):
+                    found.update(present)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for folder in groups:
+                found.update(probe(folder))
+        return found
+
+    def missing(self, digests, workers=4):
+        """Return the set of given digests that are not stored in this fsdb
+
+          See :py:func:`exists_many()`.
+        """
+        digests = set(digests)
+        return digests.difference(self.exists_many(digests, workers))
 
     def get_file_path(self, digest):
         """Retrieve the absolute path to the file with the given digest
 
           Args:
-            digest -- digest of the file
+            digest -- digest of the file, or any of its aliases (see :py:func:`resolve()`)
+          Returns:
+            String rapresenting the absolute path of the file,
+            ``ValueError`` is raised for malformed digests
+        """
+        return self._layout.path(self.resolve(digest))
+
+    def get_file_paths(self, digests):
+        """Retrieve the absolute paths of the files with the given digests
+
+          Args:
+            digests -- iterable of digests, or aliases
+          Returns:
+            list of absolute paths, in the same order
+        """
+        if self._aliases is not None:
+            digests = [self.resolve(digest) for digest in digests]
+        return self._layout.paths(digests)
+
+    def resolve(self, digest):
+        """Return the digest a file is stored under given any of its digests
+
+          With the `alias_algs` config option the digests of these algorithms
+          are computed alongside the primary one whenever a file is hashed on
+          insertion, and recorded as aliases. Unknown aliases and digests of
+          the primary algorithm are returned as they are.
+        """
+        if self._aliases is not None:
+            return self._aliases.resolve(digest) or digest
+        return digest
+
+    def chunk_digests(self, digest):
+        """Return the digests of the chunks of a stored file
+
+          Requires a tree hashing `hash_alg` (e.g. "sha256-tree"): the digest of
+          a file is the root of a Merkle tree whose leaves are the digests of its
+          chunks of `tree_chunk_size` bytes, so a single chunk (e.g. a ranged
+          read) can be verified against them without reading the whole file.
           Returns:
-            String rapresenting the absolute path of the file
+            list of hex digests, the i-th one is the digest of the bytes
+            starting at ``i * tree_chunk_size``
         """
-        relPath = Fsdb.generate_tree_path(digest, self._conf['depth'])
-        return os.path.join(self.fsdbRoot, relPath)
+        if hashtools.tree_base(self._conf['hash_alg']) is None:
+            raise ValueError("tree hashing is not enabled for this fsdb: " + self.fsdbRoot)
+        leaves = hashtools.calc_file_leaves(self.get_file_path(digest), self._conf['hash_alg'],
+                                            self._conf['tree_chunk_size'])
+        return [binascii.hexlify(leaf).decode('ascii') for leaf in leaves]
 
-    def check(self, digest):
+    def check(self, digest, record=False, io_class=None):
         """Check the integrity of the file with the given digest
 
+          With the `auto_quarantine` config option corrupted files are moved to quarantine.
           Args:
             digest -- digest of the file to check
+            record -- record the successful verification for :py:func:`scrub()`
+            io_class -- page cache hints, "normal" (default) or "background" for work that must
+              not evict the files served from the page cache, see :ref:`io_class`
           Returns:
             True if the file is not corrupted
         """
         path = self.get_file_path(digest)
-        if self._calc_digest(path) != digest:
+        if self._calc_digest(path, io_class=iohints.check_io_class(io_class)) != digest:
             self.logger.warning("found corrupted file: '{0}'".format(path))
+            if self._conf['auto_quarantine']:
+                self.quarantine(digest)
             return False
+        self.logger.debug("Verified file: [{0}]".format(digest))
+        if record:
+            self._scrub_markers.mark(digest, path)
         return True
 
-    def corrupted(self):
-        """Iterate over digests of all corrupted stored files"""
+    def corrupted(self, io_class=None):
+        """Iterate over digests of all corrupted stored files, see :py:func:`check()` for `io_class`"""
         for digest in self:
-            if not self.check(digest):
+            if not self.check(digest, io_class=io_class):
                 yield digest
 
+    def scrub(self, window=None, max_bytes=None, io_class=None):
+        """Iterate over digests of corrupted stored files checking them incrementally
+
+        Every successful verification made by a scrub or by a complete verified read is recorded.
+        Files verified within the last `window` seconds, whose size and mtime did not change,
+        are skipped. Files never verified are checked first, then the ones verified longest ago.
+
+         Args:
+            window -- seconds a verification is trusted for (default: `scrub_window` config option)
+            max_bytes -- stop after checking this amount of data
+            io_class -- page cache hints, see :py:func:`check()`
+        """
+        if window is None:
+            window = self._conf['scrub_window']
+        return scrub.scrub(self, window, max_bytes, iohints.check_io_class(io_class))
+
     def size(self):
         """Return the total size in bytes of all the files handled by this instance of fsdb.
 
@@ -254,22 +1079,205 @@ class Fsdb(object):
             tot += os.path.getsize(p)
         return tot
 
+    def diff(self, other):
+        """Compare the digests stored in this fsdb with the ones stored in `other`
+
+        Both instances are traversed in lexicographic order and merged,
+        so no digest set is ever kept in memory.
+
+         Args:
+            other -- another Fsdb instance using the same hash algorithm
+         Returns:
+            iterator over `(side, digest)` tuples where side is '<' if the digest
+            is stored only in this fsdb and '>' if it is stored only in `other`
+        """
+        return sync.diff(self, other)
+
+    def sync_to(self, other, workers=4, verify=False, checkpoint=None, io_class=None):
+        """Copy into `other` all the files that it is missing
+
+        Stored files are immutable, so only missing digests are transferred.
+        Files are copied in parallel and placed atomically in `other`, as by :py:func:`add()`.
+        Files stored only in `other` are left untouched.
+
+         Args:
+            other -- destination Fsdb instance using the same hash algorithm
+            workers -- number of files to copy in parallel
+            verify -- check the digest of every file while it is copied
+            checkpoint -- path of a file where the progress is recorded;
+              an interrupted sync will resume from there
+            io_class -- page cache hints for reading and writing, see :py:func:`check()`
+         Returns:
+            `(copied, corrupted)`: number of copied files and sorted list of the digests
+            of files found corrupted while copied with `verify`, not placed in `other`
+        """
+        return sync.sync(self, other, workers=workers, verify=verify, checkpoint=checkpoint,
+                         io_class=iohints.check_io_class(io_class))
+
+    def export_archive(self, stream, digests=None, compression=None, workers=4):
+        """Write stored files as a tar archive to a binary stream
+
+        Every entry is named after the digest of its content. The archive is
+        written sequentially, so `stream` can be a pipe or a socket.
+
+         Args:
+            stream -- writable binary file object
+            digests -- digests to export (default: all, in traversal order)
+            compression -- one of None, 'gz', 'bz2' or 'zstd' (requires `zstandard`)
+            workers -- number of threads opening and prefetching files
+         Returns:
+            number of exported files
+        """
+        return archive.export_archive(self, stream, digests=digests, compression=compression, workers=workers)
+
+    def import_archive(self, stream, compression=None, workers=4):
+        """Add the files contained in a tar archive written by :py:func:`export_archive()`
+
+        Entries are hashed while they are written into place, so the content is
+        verified without reading it twice; entries not matching their digest are
+        discarded. Digests already stored are skipped.
+
+         Args:
+            stream -- readable binary file object
+            compression -- 'zstd' for zstd archives, other formats are detected
+            workers -- number of entries hashed and written in parallel
+         Returns:
+            `(imported, skipped, corrupted)` where corrupted is the list of discarded entries
+        """
+        return archive.import_archive(self, stream, compression=compression, workers=workers)
+
     def __iter__(self, overPath=False):
         """Iterate over digests of all stored files
 
         Fsdb does not use auxiliary data structure, so this function
         will search the underlying filesystem for all the file at the expected depth.
+        Digests are returned in lexicographic order.
+        """
+        for digest, path in self._walk():
+            if overPath:
+                yield path
+            else:
+                yield digest
+
+    def raw_digests(self, start=None):
+        """Iterate in lexicographic order over the binary digests of all stored files
+
+          Binary digests take half the memory of hex strings, see also
+          :py:func:`fill_digests()` and :py:func:`write_digest_set()`.
+         Args:
+            start -- if given, only digests strictly greater than this hex digest are returned
+        """
+        for digest, _ in self._walk(start):
+            # skip anything that is not a digest
+            if self._layout.valid(digest):
+                yield binascii.unhexlify(digest)
+
+    def fill_digests(self, buffer, start=None):
+        """Write the binary digests of stored files, in lexicographic order, into a preallocated buffer
+
+         Args:
+            buffer -- writable buffer of bytes, e.g. a ``bytearray``, an ``array('B')``
+              or a numpy ``uint8`` array of shape `(N, digest size)`
+            start -- if given, only digests strictly greater than this hex digest are written
+         Returns:
+            number of digests written. If the buffer is full, the iteration continues
+            passing the last written digest (hex) as `start`
+        """
+        view = memoryview(buffer)
+        if view.ndim != 1 or view.itemsize != 1:
+            view = view.cast('B')
+        size = hashtools.digest_length(self._conf['hash_alg']) // 2
+        capacity = len(view) // size
+        count = 0
+        if capacity == 0:
+            return count
+        for digest in self.raw_digests(start):
+            view[count * size:(count + 1) * size] = digest
+            count += 1
+            if count == capacity:
+                break
+        return count
+
+    def write_digest_set(self, path):
+        """Write the digests of all stored files to a digest set file
+
+          Returns:
+            the :py:class:`DigestSet` written at `path`, supporting fast membership,
+            intersection and difference without loading it in memory
         """
-        for dirpath, dirnames, filenames in os.walk(self.fsdbRoot):
-            rel_dirpath = os.path.relpath(dirpath, self.fsdbRoot)
-            # rel_dirpath does not have os.sep neither on front nor at the end. Ex uno/due/tre
-            if (rel_dirpath.count(os.sep) + 1) != self._conf['depth']:
-                continue
-            for f in filenames:
-                if overPath:
-                    yield os.path.join(self.fsdbRoot, rel_dirpath, f)
-                else:
-                    yield (rel_dirpath + f).replace(os.sep, "")
+        return DigestSet.create(path, self.raw_digests(), hashtools.digest_length(self._conf['hash_alg']) // 2)
+
+    def snapshot(self, name=None, workers=8):
+        """Write a manifest of the digests stored right now
+
+          With the `journal` config option the manifest is the previous one updated
+          with the journal, or a scan corrected with the changes made while scanning:
+          it lists exactly the files stored at the last journal record.
+          Without journal the top level folders are scanned in parallel and files
+          added or removed during the scan may or may not be listed.
+          Files listed in a snapshot are not removed by :py:func:`gc()`, by the cache
+          eviction nor by :py:func:`expire()` until :py:func:`release_snapshot()`.
+         Args:
+            name -- name of the snapshot (default: current UTC time, e.g. "20240131T120000.123456Z")
+            workers -- number of folders scanned in parallel
+         Returns:
+            the name of the snapshot
+        """
+        return self._snapshots.create(name, workers)
+
+    def snapshots(self):
+        """Return the names of all the snapshots, oldest first"""
+        return self._snapshots.names()
+
+    def snapshot_info(self, name):
+        """Return a dictionary with `created` time, `count` of digests and `journal_seq` of a snapshot"""
+        return self._snapshots.info(name)
+
+    def open_snapshot(self, name):
+        """Return the :py:class:`DigestSet` of the digests listed in a snapshot, to be closed by the caller"""
+        return self._snapshots.open(name)
+
+    def snapshot_diff(self, old, new):
+        """Iterate in lexicographic order over the changes between two snapshots
+
+          Returns:
+            iterator over `(op, digest)` where op is '+' for digests only
+            in the `new` snapshot and '-' for digests only in the `old` one
+        """
+        with self.open_snapshot(old) as oldSet:
+            with self.open_snapshot(new) as newSet:
+                for change in snapshots.diff(oldSet, newSet):
+                    yield change
+
+    def release_snapshot(self, name):
+        """Remove a snapshot, the files it lists are not held anymore"""
+        self._snapshots.release(name)
+
+    def _walk(self, start=None):
+        """Iterate in lexicographic order over `(digest, path)` of all stored files
+
+         Args:
+            start -- if given, only digests strictly greater than `start` are returned
+        """
+        return self._walk_folder(self.fsdbRoot, "", 0, start)
+
+    def _walk_folder(self, path, prefix, level, start):
+        for name, is_dir in list_dir(path):
+            current = prefix + name
+            if start is not None:
+                if current < start[:len(current)]:
+                    continue
+                # the whole subtree follows `start`, no need to compare anymore
+                subStart = start if current == start[:len(current)] else None
+            else:
+                subStart = None
+            if level < self._conf['depth']:
+                if is_dir:
+                    for item in self._walk_folder(os.path.join(path, name), current, level + 1, subStart):
+                        yield item
+            elif not is_dir and not name.endswith('.tmp'):
+                if start is None or current > start:
+                    yield current, os.path.join(path, name)
 
     def __str__(self):
         return "{root: " + self.fsdbRoot + \
@@ -296,10 +1304,101 @@ class Fsdb(object):
 
            Could raise ``IOError`` acoording to the standard ``open()`` function.
            If you need to write on file or implement some more complicated logic refer to :py:func:`get_file_path()`
+           When the `verify_on_read` config option is enabled the returned object verifies
+           the content while it is read, see :py:func:`open()`.
+        """
+        return self.open(digest)
+
+    def open(self, digest, verify=None):
+        """Return a readable only file object of the stored file with the given digest
+
+           If `verify` is true (default: `verify_on_read` config option) the content is hashed
+           while it is read sequentially and :py:class:`CorruptedError` is raised
+           when the end of file is reached and the digest does not match.
+           This verifies the file at no extra I/O cost. The verifying file object is
+           buffered like a plain binary file, its ``raw.verified`` attribute tells
+           whether the whole content has been verified.
+           Quarantined files raise :py:class:`CorruptedError` right away, see :py:func:`quarantine()`.
         """
+        digest = self.resolve(digest)
         if not self.exists(digest):
+            if self.is_quarantined(digest):
+                raise CorruptedError(digest, self._aux_path("quarantine", digest))
             raise KeyError("no stored file found for '{0}'".format(digest))
-        return open(self.get_file_path(digest), 'rb')
+        f = open(self.get_file_path(digest), 'rb')
+        if self._cache is not None:
+            self._cache.accessed(digest)
+        if verify is None:
+            verify = self._conf['verify_on_read']
+        if verify:
+            onCorrupted = self.quarantine if self._conf['auto_quarantine'] else None
+            reader = VerifyingReader(f, digest, self._conf['hash_alg'], self._verified, self._conf['tree_chunk_size'],
+                                     onCorrupted)
+            return io.BufferedReader(reader)
+        return f
+
+    def get_many(self, digests, workers=4, in_flight=None, verify=None):
+        """Iterate over `(digest, file object)` of many stored files, reading them in disk order
+
+           Files are sorted by their physical position on disk (first extent if the
+           filesystem exposes it, inode number otherwise) so that reading them in turn
+           is close to sequential I/O. Files are opened and prefetched by a pool of
+           `workers` threads keeping at most `in_flight` files ahead of the consumer.
+           Client should close every returned file object.
+
+           ``KeyError`` is raised, before returning anything, if a digest is not stored.
+         Args:
+            digests -- iterable of digests
+            workers -- number of threads opening and prefetching files
+            in_flight -- maximum number of files opened ahead (default: twice the workers)
+            verify -- see :py:func:`open()`
+        """
+        digests = list(digests)
+
+        def order_key(digest):
+            try:
+                return physical_order_key(self.get_file_path(digest)), digest
+            except (IOError, OSError) as e:
+                if e.errno == errno.ENOENT:
+                    return None, digest
+                raise
+
+        def prefetch(digest):
+            f = self.open(digest, verify)
+            iohints.advise(f.fileno(), 0, 0, 'POSIX_FADV_WILLNEED')
+            return digest, f
+
+        pool = ThreadPool(workers)
+        try:
+            keys = pool.map(order_key, digests, 64)
+            for key, digest in keys:
+                if key is None:
+                    raise KeyError("no stored file found for '{0}'".format(digest))
+            keys.sort()
+            window = in_flight or workers * 2
+            pending = collections.deque()
+            try:
+                for key, digest in keys:
+                    pending.append(pool.apply_async(prefetch, (digest,)))
+                    if len(pending) >= window:
+                        yield pending.popleft().get()
+                while pending:
+                    yield pending.popleft().get()
+            finally:
+                # close the files prefetched but never returned
+                for result in pending:
+                    try:
+                        result.get()[1].close()
+                    except Exception:
+                        pass
+        finally:
+            pool.close()
+            pool.join()
+
+    def _verified(self, digest):
+        """Called every time a verified read has been completed"""
+        self.logger.debug("Verified file: [{0}]".format(digest))
+        self._scrub_markers.mark_read(digest)
 
     @staticmethod
     def generate_tree_path(fileDigest, depth):
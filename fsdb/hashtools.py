@@ -1,35 +1,239 @@
+import os
 import hashlib
+import binascii
+import multiprocessing
 from os import stat
+from multiprocessing.pool import ThreadPool
 
+from . import iohints
+
+# suffix of tree hashing algorithms, e.g. "sha256-tree"
+TREE_SUFFIX = "-tree"
+TREE_CHUNK_SIZE = 2**22
+
+# domain separation of leaves and inner nodes
+LEAF_PREFIX = b"\x00"
+NODE_PREFIX = b"\x01"
+
+
+def new(algorithm, chunk_size=None):
+    """Return a new hash object for the given algorithm
+
+       `chunk_size` is the size of the leaves of tree hashing algorithms
+       (default: ``TREE_CHUNK_SIZE``) and it is ignored by the others.
+    """
+    base = tree_base(algorithm)
+    if base is not None:
+        return TreeHash(base, chunk_size or TREE_CHUNK_SIZE)
+    try:
+        return hashlib.new(algorithm)
+    except ValueError:
+        raise ValueError('hash algorithm not supported by the underlying platform: "{0}"'.format(algorithm))
+
+
+def tree_base(algorithm):
+    """Return the base algorithm of a tree hashing algorithm, None for other algorithms"""
+    if algorithm.endswith(TREE_SUFFIX):
+        return algorithm[:-len(TREE_SUFFIX)]
+    return None
+
+
+def digest_length(algorithm):
+    """Return the length of the hex digests of the given algorithm"""
+    return new(tree_base(algorithm) or algorithm).digest_size * 2
+
+
+class MultiHash(object):
+    """Hash object computing several algorithms over the same data
+
+       ``hexdigest()`` returns the digest of the first algorithm,
+       ``hexdigests()`` a dictionary with the digests of all of them.
+    """
+
+    def __init__(self, algorithms, chunk_size=None):
+        self.algorithms = list(algorithms)
+        self._hashes = [new(alg, chunk_size) for alg in self.algorithms]
+
+    def update(self, data):
+        for h in self._hashes:
+            h.update(data)
+
+    def hexdigest(self):
+        return self._hashes[0].hexdigest()
+
+    def hexdigests(self):
+        return dict((alg, h.hexdigest()) for alg, h in zip(self.algorithms, self._hashes))
+
+
+class TreeHash(object):
+    """Merkle tree hash of fixed size chunks
+
+       Every chunk of `chunk_size` bytes (the last one may be shorter, an empty
+       content is a single empty chunk) is a leaf hashed as ``H(0x00 || chunk)``,
+       pairs of nodes are combined as ``H(0x01 || left || right)`` level by level,
+       an odd node is promoted to the next level as it is.
+       Leaves can be hashed independently, see :py:func:`calc_file_digest()`.
+    """
+
+    def __init__(self, base, chunk_size):
+        self.base = base
+        self.chunk_size = chunk_size
+        self.digest_size = new(base).digest_size
+        self._leaves = []
+        self._buffer = []
+        self._buffered = 0
+
+    def update(self, data):
+        pos = 0
+        while pos < len(data):
+            take = min(self.chunk_size - self._buffered, len(data) - pos)
+            self._buffer.append(data[pos:pos + take])
+            self._buffered += take
+            pos += take
+            if self._buffered == self.chunk_size:
+                self._leaves.append(leaf_digest(self.base, b"".join(self._buffer)))
+                self._buffer = []
+                self._buffered = 0
+
+    def leaves(self):
+        """Return the binary digests of all the chunks hashed so far"""
+        leaves = list(self._leaves)
+        if self._buffered or not leaves:
+            leaves.append(leaf_digest(self.base, b"".join(self._buffer)))
+        return leaves
+
+    def digest(self):
+        return tree_root(self.base, self.leaves())
+
+    def hexdigest(self):
+        return _hex(self.digest())
+
+
+def leaf_digest(base, chunk):
+    h = hashlib.new(base)
+    h.update(LEAF_PREFIX)
+    h.update(chunk)
+    return h.digest()
+
+
+def tree_root(base, leaves):
+    """Combine the binary digests of the leaves into the root digest"""
+    level = leaves
+    while len(level) > 1:
+        nextLevel = []
+        for i in range(0, len(level) - 1, 2):
+            h = hashlib.new(base)
+            h.update(NODE_PREFIX + level[i] + level[i + 1])
+            nextLevel.append(h.digest())
+        if len(level) % 2:
+            nextLevel.append(level[-1])
+        level = nextLevel
+    return level[0]
+
+
+def calc_file_leaves(filePath, algorithm, chunk_size=None, workers=None, io_class=None):
+    """Return the binary digests of the chunks of a file, hashed in parallel
+
+       Chunks are read with ``pread`` and hashed by a pool of `workers` threads
+       (default: number of cpus); hash functions release the GIL while hashing.
+     Args:
+        filePath -- path of the file
+        algorithm -- a tree hashing algorithm
+        chunk_size -- size of the chunks (default: ``TREE_CHUNK_SIZE``)
+        workers -- number of threads hashing chunks
+        io_class -- page cache hints to use, see ``iohints.IO_CLASSES``
+    """
+    base = tree_base(algorithm)
+    if base is None:
+        raise ValueError("not a tree hashing algorithm: {0}".format(algorithm))
+    chunk_size = chunk_size or TREE_CHUNK_SIZE
+    fd = os.open(filePath, os.O_RDONLY)
+    try:
+        size = os.fstat(fd).st_size
+        chunks = max(1, (size + chunk_size - 1) // chunk_size)
+        iohints.start_read(fd, io_class)
+
+        def hash_chunk(i):
+            return leaf_digest(base, _pread(fd, filePath, chunk_size, i * chunk_size))
+
+        if chunks == 1:
+            leaves = [hash_chunk(0)]
+        else:
+            pool = ThreadPool(min(workers or multiprocessing.cpu_count(), chunks))
+            try:
+                leaves = pool.map(hash_chunk, range(chunks), 1)
+            finally:
+                pool.close()
+                pool.join()
+        iohints.end_read(fd, io_class)
+    finally:
+        os.close(fd)
+    return leaves
+
+
+def calc_file_digest(filePath, algorithm, io_class=None, chunk_size=None, workers=None):
+    """Calculate digest of a file
+
+       Tree hashing algorithms hash the chunks of the file in parallel,
+       see :py:func:`calc_file_leaves()`.
+     Args:
+        filePath -- path of the file
+        algorithm -- the algorithm to use, or a list of algorithms to
+          get a dictionary of digests computed in a single pass
+        io_class -- page cache hints to use, see ``iohints.IO_CLASSES``
+        chunk_size -- size of the leaves of tree hashing algorithms
+        workers -- number of threads hashing the leaves of tree hashing algorithms
+    """
+    if not isinstance(algorithm, (list, tuple)) and tree_base(algorithm) is not None:
+        leaves = calc_file_leaves(filePath, algorithm, chunk_size, workers, io_class)
+        return _hex(tree_root(tree_base(algorithm), leaves))
 
-def calc_file_digest(filePath, algorithm):
     try:
         block_size = stat(filePath).st_blksize
     except AttributeError:
         block_size = None
 
     with open(filePath, 'rb', block_size) as f:
-        digest = calc_digest(f, algorithm, block_size)
+        iohints.start_read(f.fileno(), io_class)
+        digest = calc_digest(f, algorithm, block_size, chunk_size)
+        iohints.end_read(f.fileno(), io_class)
 
     return digest
 
 
-def calc_digest(origin, algorithm="sha1", block_size=None):
+def calc_digest(origin, algorithm="sha1", block_size=None, chunk_size=None):
     """Calculate digest of a readable object
 
      Args:
         origin -- a readable object for which calculate digest
         algorithn -- the algorithm to use. See ``hashlib.algorithms_available`` for supported algorithms.
+          A list of algorithms returns a dictionary of digests computed in a single pass.
         block_size -- the size of the block to read at each iteration
+        chunk_size -- size of the leaves of tree hashing algorithms
     """
-    try:
-        hashM = hashlib.new(algorithm)
-    except ValueError:
-        raise ValueError('hash algorithm not supported by the underlying platform: "{0}"'.format(algorithm))
+    if isinstance(algorithm, (list, tuple)):
+        hashM = MultiHash(algorithm, chunk_size)
+    else:
+        hashM = new(algorithm, chunk_size)
 
     while True:
         chunk = origin.read(block_size) if block_size else origin.read()
         if not chunk:
             break
         hashM.update(chunk)
+    if isinstance(hashM, MultiHash):
+        return hashM.hexdigests()
     return hashM.hexdigest()
+
+
+def _pread(fd, path, size, offset):
+    if hasattr(os, 'pread'):
+        return os.pread(fd, size, offset)
+    # python 2: a private file per read, the offset of `fd` is shared by all threads
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        return f.read(size)
+
+
+def _hex(digest):
+    return binascii.hexlify(digest).decode('ascii')
@@ -0,0 +1,73 @@
+from __future__ import unicode_literals
+
+import os
+
+
+NORMAL = 'normal'
+BACKGROUND = 'background'
+IO_CLASSES = (NORMAL, BACKGROUND)
+
+# with the background class written data is flushed and dropped
+# from the page cache every DROP_BEHIND bytes
+DROP_BEHIND = 2**23
+
+_fadvise = getattr(os, 'posix_fadvise', None)
+
+
+def check_io_class(io_class):
+    '''Return the given I/O class, NORMAL if None, raise ValueError if unknown'''
+    if io_class is None:
+        return NORMAL
+    if io_class not in IO_CLASSES:
+        raise ValueError("`io_class` must be one of " + str(IO_CLASSES))
+    return io_class
+
+
+def advise(fd, offset, length, advice):
+    if _fadvise is not None:
+        try:
+            _fadvise(fd, offset, length, getattr(os, advice))
+        except OSError:
+            # hints are best effort (e.g. not supported by the filesystem)
+            pass
+
+
+def start_read(fd, io_class):
+    '''Hint the kernel that the whole file is going to be read sequentially'''
+    if io_class == BACKGROUND:
+        advise(fd, 0, 0, 'POSIX_FADV_SEQUENTIAL')
+
+
+def end_read(fd, io_class):
+    '''Drop a file read by background work from the page cache'''
+    if io_class == BACKGROUND:
+        advise(fd, 0, 0, 'POSIX_FADV_DONTNEED')
+
+
+class DropBehind(object):
+    '''Keep background writes from filling the page cache with dirty pages
+
+       Every DROP_BEHIND bytes the written data is flushed and dropped
+       from the page cache, which is what ``sync_file_range`` plus
+       ``POSIX_FADV_DONTNEED`` would do on Linux.
+    '''
+
+    def __init__(self, fd, io_class):
+        self.fd = fd
+        self.enabled = io_class == BACKGROUND and _fadvise is not None
+        self.written = 0
+        self.dropped = 0
+
+    def update(self, size):
+        if not self.enabled:
+            return
+        self.written += size
+        if self.written - self.dropped >= DROP_BEHIND:
+            self.drop()
+
+    def drop(self):
+        if not self.enabled or self.written == self.dropped:
+            return
+        os.fdatasync(self.fd)
+        advise(self.fd, self.dropped, self.written - self.dropped, 'POSIX_FADV_DONTNEED')
+        self.dropped = self.written
@@ -0,0 +1,193 @@
+from __future__ import unicode_literals
+
+import os
+import errno
+import weakref
+import threading
+import collections
+
+from .utils import open_append
+
+ADDED = "+"
+REMOVED = "-"
+
+# name of the fsdb lock stripe guarding the journal
+LOCK_NAME = "journal"
+
+# journals flushed at exit
+_live = weakref.WeakValueDictionary()
+
+
+def flush_all():
+    '''Write the buffered records of all the journals still alive'''
+    for journ in list(_live.values()):
+        journ.flush()
+
+
+class Journal(object):
+    '''Append-only journal of the changes made to an fsdb
+
+       The journal is a sequence of segment files named after the sequence
+       number of their first record. Every record is a line
+       ``<seq> <op> <digest>`` where op is ``+`` (added) or ``-`` (removed).
+
+       Records are buffered in memory and written in batches of `batch`
+       records, sequence numbers are assigned at write time holding an
+       exclusive lock, so several processes can share the journal.
+       A new segment is started every `segment_size` records.
+    '''
+
+    def __init__(self, fsdb, folder, batch, segment_size):
+        self._fsdb = fsdb
+        self.folder = folder
+        self.batch = batch
+        self.segment_size = segment_size
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._ready = False
+        # (segment, size) -> last seq, avoids reading back our own writes
+        self._tail = None
+        _live[id(self)] = self
+
+    def record(self, op, digest):
+        with self._lock:
+            self._buffer.append((op, digest))
+            if len(self._buffer) >= self.batch:
+                self._flush()
+
+    def flush(self):
+        '''Write buffered records'''
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        self._prepare()
+        with self._file_lock():
+            segments = self._segments()
+            if segments:
+                segment = segments[-1]
+                seq = self._last_seq(segment)
+            else:
+                segment = None
+                seq = 0
+            lines = []
+            for op, digest in self._buffer:
+                seq += 1
+                if segment is None or seq - segment >= self.segment_size:
+                    self._write(segment, lines)
+                    segment = seq
+                    lines = []
+                lines.append("{0} {1} {2}\n".format(seq, op, digest))
+            size = self._write(segment, lines)
+            self._tail = (segment, size, seq)
+        self._buffer = []
+
+    def _write(self, segment, lines):
+        if segment is None or not lines:
+            return None
+        fd = open_append(self._segment_path(segment), self._fsdb._conf['fmode'])
+        try:
+            os.write(fd, "".join(lines).encode('ascii'))
+            return os.fstat(fd).st_size
+        finally:
+            os.close(fd)
+
+    def _last_seq(self, segment):
+        path = self._segment_path(segment)
+        size = os.path.getsize(path)
+        if self._tail is not None and self._tail[:2] == (segment, size):
+            return self._tail[2]
+        with open(path, 'rb') as f:
+            f.seek(max(0, size - 4096))
+            lines = f.read().decode('ascii').splitlines()
+        if not lines:
+            return segment - 1
+        return int(lines[-1].split(" ")[0])
+
+    def last_seq(self):
+        '''Return the sequence number of the last written record'''
+        self.flush()
+        segments = self._segments()
+        return self._last_seq(segments[-1]) if segments else 0
+
+    def changes(self, since=0):
+        '''Iterate over `(seq, op, digest)` of all records following `since`'''
+        self.flush()
+        files = []
+        try:
+            # segments are opened together, so a concurrent compaction
+            # can not remove the ones that have not been read yet
+            with self._file_lock(shared=True):
+                segments = self._segments()
+                for i, segment in enumerate(segments):
+                    if i + 1 < len(segments) and segments[i + 1] <= since + 1:
+                        continue
+                    files.append(open(self._segment_path(segment), 'rb'))
+            for f in files:
+                for record in _parse(f.read()):
+                    if record[0] > since:
+                        yield record
+        finally:
+            for f in files:
+                f.close()
+
+    def compact(self):
+        '''Merge all segments but the current one keeping only the last record of every digest
+
+           Original sequence numbers are kept, so consumers at any position
+           still end up with the same state reading from there.
+        '''
+        self.flush()
+        with self._file_lock():
+            segments = self._segments()[:-1]
+            if len(segments) < 1:
+                return 0
+            last = collections.OrderedDict()
+            total = 0
+            for segment in segments:
+                for seq, op, digest in self._read(segment):
+                    last.pop(digest, None)
+                    last[digest] = (seq, op)
+                    total += 1
+            records = sorted((seq, op, digest) for digest, (seq, op) in last.items())
+            path = self._segment_path(segments[0])
+            tmpPath = path + ".tmp"
+            with open(tmpPath, 'wb') as f:
+                f.write("".join("{0} {1} {2}\n".format(*r) for r in records).encode('ascii'))
+            os.chmod(tmpPath, self._fsdb._conf['fmode'])
+            os.rename(tmpPath, path)
+            for segment in segments[1:]:
+                os.remove(self._segment_path(segment))
+        return total - len(records)
+
+    def _read(self, segment):
+        with open(self._segment_path(segment), 'rb') as f:
+            return list(_parse(f.read()))
+
+    def _segments(self):
+        try:
+            names = os.listdir(self.folder)
+        except OSError as e:
+            if e.errno == errno.ENOENT:
+                return []
+            raise
+        return sorted(int(n[:-4]) for n in names if n.endswith(".log"))
+
+    def _segment_path(self, segment):
+        return os.path.join(self.folder, "{0:020d}.log".format(segment))
+
+    def _prepare(self):
+        if not self._ready:
+            self._fsdb._makedirs(self.folder)
+            self._ready = True
+
+    def _file_lock(self, shared=False):
+        return self._fsdb._locks.stripe(LOCK_NAME, shared)
+
+
+def _parse(data):
+    for line in data.decode('ascii').splitlines():
+        seq, op, digest = line.split(" ")
+        yield int(seq), op, digest
@@ -0,0 +1,64 @@
+from __future__ import unicode_literals
+
+import os
+import re
+
+_HEX = re.compile(r"[0-9a-f]+\Z")
+
+
+class Layout(object):
+    '''Mapping from digests to paths in the tree, computed once per fsdb
+
+       The folder at level `p` (1 to `depth`) is named after the next
+       ``2**p`` characters of the digest, the file after the rest of it.
+       Slices of the digest are precomputed, so building a path is a single
+       join and validating a digest a regular expression and a length check.
+    '''
+
+    def __init__(self, root, depth, length):
+        if depth < 0:
+            raise ValueError("depth level can not be negative")
+        self.root = root
+        self.depth = depth
+        # the file name is at least one character long, with a too high depth every digest is rejected
+        self.length = length if length >= 2**(depth + 1) - 1 else None
+        bounds = [0]
+        for p in range(1, depth + 1):
+            bounds.append(bounds[-1] + 2**p)
+        self._folders = [slice(start, end) for start, end in zip(bounds, bounds[1:])]
+        self._parts = self._folders + [slice(bounds[-1], None)]
+        self._prefix = os.path.join(root, "")
+
+    def valid(self, digest):
+        '''Tell whether `digest` is a well formed digest: lowercase hex of the expected length'''
+        return len(digest) == self.length and _HEX.match(digest) is not None
+
+    def check(self, digest):
+        if self.length is None:
+            raise ValueError("digests are too short for depth {0}".format(self.depth))
+        if not self.valid(digest):
+            raise ValueError("malformed digest: '{0}'".format(digest))
+
+    def path(self, digest):
+        '''Return the absolute path of the file with the given digest'''
+        self.check(digest)
+        return self.join(digest)
+
+    def join(self, digest):
+        '''Return the absolute path of an already validated digest'''
+        return self._prefix + os.sep.join([digest[s] for s in self._parts])
+
+    def paths(self, digests):
+        '''Return the list of absolute paths of the given digests'''
+        check = self.check
+        join = self.join
+        paths = []
+        for digest in digests:
+            check(digest)
+            paths.append(join(digest))
+        return paths
+
+    def split(self, digest):
+        '''Return `(folder, name)` of the file with the given digest'''
+        self.check(digest)
+        return os.sep.join([self.root] + [digest[s] for s in self._folders]), digest[self._parts[-1]]
@@ -0,0 +1,59 @@
+from __future__ import unicode_literals
+
+import os
+import contextlib
+
+from .compat import fcntl
+
+
+# number of leading digest characters used to select a lock stripe
+STRIPE_LEN = 2
+
+
+def stripe_of(digest):
+    '''Return the lock stripe the given digest belongs to
+
+       The stripe is the digest prefix used for the first level of the
+       directory tree, so a stripe also covers every folder a digest lives in.
+    '''
+    return digest[:STRIPE_LEN]
+
+
+class StripedLock(object):
+    '''Advisory cross-process locks striped by digest prefix
+
+       Every stripe is backed by a lock file under `folder` and locked through
+       ``fcntl.flock``. Locks are shared by all processes (and threads) working
+       on the same fsdb. On platforms without ``fcntl`` locking is a no-op.
+    '''
+
+    def __init__(self, fsdb, folder):
+        self._fsdb = fsdb
+        self.folder = folder
+        self._ready = False
+
+    def _lock_path(self, stripe):
+        if not self._ready:
+            self._fsdb._makedirs(self.folder)
+            self._ready = True
+        return os.path.join(self.folder, stripe)
+
+    @contextlib.contextmanager
+    def stripe(self, stripe, shared=False):
+        '''Hold the lock of the given stripe for the duration of the block'''
+        if fcntl is None:
+            yield
+            return
+        # flock does not need write access, so lock files created by
+        # other users are fine as long as they are readable
+        fd = os.open(self._lock_path(stripe), os.O_RDONLY | os.O_CREAT, self._fsdb._conf['fmode'])
+        try:
+            fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            yield
+        finally:
+            # closing the descriptor releases the lock
+            os.close(fd)
+
+    def digest(self, digest, shared=False):
+        '''Hold the lock of the stripe the given digest belongs to'''
+        return self.stripe(stripe_of(digest), shared)
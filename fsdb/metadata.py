@@ -0,0 +1,170 @@
+from __future__ import unicode_literals
+
+import os
+import json
+import time
+import sqlite3
+import threading
+
+from .compat import string_types
+
+# metadata stored in their own (indexed) columns, any other key is kept as json
+COLUMNS = ('content_type', 'filename', 'owner')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    digest TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    content_type TEXT,
+    filename TEXT,
+    owner TEXT,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS objects_size ON objects (size);
+CREATE INDEX IF NOT EXISTS objects_content_type ON objects (content_type, size);
+CREATE INDEX IF NOT EXISTS objects_filename ON objects (filename);
+CREATE INDEX IF NOT EXISTS objects_owner ON objects (owner, size);
+CREATE TABLE IF NOT EXISTS tags (
+    tag TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    PRIMARY KEY (tag, digest)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS tags_digest ON tags (digest);
+"""
+
+# seconds a writer waits for a concurrent transaction to finish
+BUSY_TIMEOUT = 30
+
+
+class Metadata(object):
+    '''Per-file metadata kept in an SQLite database
+
+       Every stored file may have a row in the `objects` table with its size,
+       creation time, the COLUMNS fields and a json object of other fields,
+       and any number of rows in the `tags` table. Both tables are indexed
+       so that queries never scan the whole fsdb.
+       Every thread uses its own connection, the database is in WAL mode so
+       readers do not block writers, also across processes.
+    '''
+
+    def __init__(self, fsdb, path):
+        self._fsdb = fsdb
+        self.path = path
+        self._local = threading.local()
+        # connections of all the threads, closed together
+        self._connections = []
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.generation != self._generation:
+            # closed by close()
+            conn = None
+        if conn is None:
+            self._fsdb._makedirs(os.path.dirname(self.path))
+            created = not os.path.exists(self.path)
+            # only used by this thread, but closed by whichever thread calls close()
+            conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            if created:
+                os.chmod(self.path, self._fsdb._conf['fmode'])
+            with self._lock:
+                self._connections.append(conn)
+                self._local.generation = self._generation
+            self._local.conn = conn
+        return conn
+
+    def close(self):
+        '''Close the connections of all the threads, they are opened again when needed'''
+        with self._lock:
+            connections = self._connections
+            self._connections = []
+            self._generation += 1
+        for conn in connections:
+            conn.close()
+
+    def set_many(self, items):
+        '''Set the metadata of many files in a single transaction
+
+           `items` is an iterable of `(digest, size, meta)`, see :py:func:`Fsdb.set_meta()`.
+        '''
+        conn = self._connection()
+        with conn:
+            for digest, size, meta in items:
+                meta = dict(meta)
+                tags = meta.pop('tags', None)
+                values = [meta.pop(name, None) for name in COLUMNS]
+                extra = json.dumps(meta, sort_keys=True) if meta else None
+                conn.execute("INSERT OR REPLACE INTO objects (digest, size, created, content_type, filename, owner, extra) "
+                             "VALUES (?, ?, COALESCE((SELECT created FROM objects WHERE digest = ?), ?), ?, ?, ?, ?)",
+                             [digest, size, digest, time.time()] + values + [extra])
+                if tags is not None:
+                    conn.execute("DELETE FROM tags WHERE digest = ?", (digest,))
+                    conn.executemany("INSERT OR IGNORE INTO tags (tag, digest) VALUES (?, ?)",
+                                     ((tag, digest) for tag in _check_tags(tags)))
+
+    def get(self, digest):
+        '''Return the metadata of a file, None if it has none'''
+        conn = self._connection()
+        row = conn.execute("SELECT size, created, content_type, filename, owner, extra FROM objects "
+                           "WHERE digest = ?", (digest,)).fetchone()
+        if row is None:
+            return None
+        meta = json.loads(row[5]) if row[5] else {}
+        meta.update((name, value) for name, value in zip(COLUMNS, row[2:5]) if value is not None)
+        meta['size'] = row[0]
+        meta['created'] = row[1]
+        meta['tags'] = sorted(r[0] for r in conn.execute("SELECT tag FROM tags WHERE digest = ?", (digest,)))
+        return meta
+
+    def delete(self, digest):
+        conn = self._connection()
+        with conn:
+            conn.execute("DELETE FROM objects WHERE digest = ?", (digest,))
+            conn.execute("DELETE FROM tags WHERE digest = ?", (digest,))
+
+    def query(self, tags=(), min_size=None, max_size=None, **fields):
+        '''Iterate over the digests matching all the given conditions, in lexicographic order'''
+        where = []
+        params = []
+        sql = "SELECT o.digest FROM objects o"
+        order = " ORDER BY o.digest"
+        tags = list(tags)
+        if tags:
+            # the first tag drives the query through the (tag, digest) primary key
+            sql = "SELECT o.digest FROM tags t0 JOIN objects o ON o.digest = t0.digest"
+            where.append("t0.tag = ?")
+            params.append(tags[0])
+            order = " ORDER BY t0.digest"
+        for tag in tags[1:]:
+            where.append("EXISTS (SELECT 1 FROM tags t WHERE t.tag = ? AND t.digest = o.digest)")
+            params.append(tag)
+        if min_size is not None:
+            where.append("o.size >= ?")
+            params.append(min_size)
+        if max_size is not None:
+            where.append("o.size <= ?")
+            params.append(max_size)
+        for name in sorted(fields):
+            if name not in COLUMNS:
+                raise TypeError("unexpected query field: '{0}'".format(name))
+            where.append("o.{0} = ?".format(name))
+            params.append(fields[name])
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        cursor = self._connection().execute(sql + order, params)
+        try:
+            for row in cursor:
+                yield row[0]
+        finally:
+            cursor.close()
+
+
+def _check_tags(tags):
+    if isinstance(tags, string_types) or not all(isinstance(tag, string_types) and tag for tag in tags):
+        raise TypeError("tags must be a list of non-empty strings")
+    return tags
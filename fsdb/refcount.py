@@ -0,0 +1,116 @@
+from __future__ import unicode_literals
+
+import os
+import errno
+import threading
+import collections
+
+from .locking import stripe_of
+from .striped import StripedLog
+
+
+class RefCounts(object):
+    '''Per-digest reference counts and named pins
+
+       Every change is appended to a striped log as one of the records:
+
+         ``<digest> +``            one more reference
+         ``<digest> -``            one reference less
+         ``<digest> = <count>``    absolute count (written by compaction)
+         ``<digest> P <name>``     named pin added
+         ``<digest> U <name>``     named pin removed
+
+       the current state of a digest is obtained replaying its records.
+       The replayed state of every stripe is cached until its log changes.
+    '''
+
+    def __init__(self, fsdb, folder):
+        self._log = StripedLog(fsdb, folder)
+        # stripe -> ((inode, size, mtime) of the log, replayed state)
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def incr(self, digest):
+        self._log.append(digest, "+")
+
+    def decr(self, digest):
+        self._log.append(digest, "-")
+
+    def reset(self, digest):
+        self._log.append(digest, "=", "0")
+
+    def pin(self, digest, name):
+        self._log.append(digest, "P", check_pin_name(name))
+
+    def unpin(self, digest, name):
+        self._log.append(digest, "U", check_pin_name(name))
+
+    def get(self, digest):
+        '''Return `(count, pins)` of the given digest'''
+        return self._replayed(stripe_of(digest)).get(digest, (0, frozenset()))
+
+    def stripes(self):
+        return self._log.stripes()
+
+    def state(self, stripe):
+        '''Return a dictionary `digest -> (count, pins)` for the given stripe'''
+        return dict(self._replayed(stripe))
+
+    def _replayed(self, stripe):
+        '''Return the cached state of a stripe, replaying its log again only if it changed'''
+        try:
+            f = open(self._log._path(stripe), 'rb')
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                return {}
+            raise
+        with f:
+            st = os.fstat(f.fileno())
+            key = (st.st_ino, st.st_size, st.st_mtime)
+            with self._lock:
+                cached = self._cache.get(stripe)
+                if cached is not None and cached[0] == key:
+                    return cached[1]
+            data = f.read()
+        # a record being appended right now is read next time
+        data = data[:data.rfind(b"\n") + 1]
+        state = replay(line.split(" ") for line in data.decode('ascii').splitlines() if line)
+        if len(data) == st.st_size:
+            with self._lock:
+                self._cache[stripe] = (key, state)
+        return state
+
+    def compact(self, stripe, state):
+        '''Rewrite a stripe with the given state. Caller must hold the stripe lock'''
+        records = []
+        for digest in sorted(state):
+            count, pins = state[digest]
+            records.append((digest, "=", str(count)))
+            for name in sorted(pins):
+                records.append((digest, "P", name))
+        self._log.rewrite(stripe, records)
+
+
+def replay(records):
+    counts = collections.defaultdict(int)
+    pins = collections.defaultdict(set)
+    for record in records:
+        digest, op = record[0], record[1]
+        if op == "+":
+            counts[digest] += 1
+        elif op == "-":
+            counts[digest] = max(counts[digest] - 1, 0)
+        elif op == "=":
+            counts[digest] = int(record[2])
+        elif op == "P":
+            pins[digest].add(record[2])
+        elif op == "U":
+            pins[digest].discard(record[2])
+    return dict((d, (counts[d], frozenset(pins[d])))
+                for d in set(counts).union(pins))
+
+
+def check_pin_name(name):
+    if not name or len(name.split()) != 1 or name != name.strip():
+        raise ValueError("pin name must be a non empty string without whitespaces: '{0}'".format(name))
+    return name
@@ -0,0 +1,90 @@
+from __future__ import unicode_literals
+
+import os
+import logging
+import collections
+from multiprocessing.pool import ThreadPool
+
+from . import sync
+from .verify import CorruptedError
+
+logger = logging.getLogger(__name__)
+
+RepairResult = collections.namedtuple('RepairResult', ['repaired', 'failed'])
+
+
+def repair(fsdb, digests, replicas, workers=4, callback=None):
+    '''Restore quarantined files of `fsdb` from its replicas
+
+       Every digest is looked up in the replicas in turn, the first copy whose
+       content matches the digest is placed back into the tree and the quarantined
+       file is removed. Digests are repaired in parallel by `workers` threads,
+       `callback(digest, source)` is called from the calling thread after every
+       attempt with the root of the fsdb the file was restored from, None on failure.
+     Args:
+        replicas -- Fsdb instances or root paths of fsdbs using the same hash algorithm
+     Returns:
+        a `RepairResult` with the sorted lists of repaired and failed digests
+    '''
+    sources = list(_open_replicas(fsdb, replicas))
+
+    def restore(digest):
+        return digest, _restore(fsdb, digest, sources)
+
+    repaired = []
+    failed = []
+    digests = list(digests)
+    if not digests:
+        return RepairResult(repaired, failed)
+    pool = ThreadPool(min(workers, len(digests)))
+    try:
+        for digest, source in pool.imap_unordered(restore, digests):
+            if source is None:
+                failed.append(digest)
+            else:
+                repaired.append(digest)
+            if callback is not None:
+                callback(digest, source)
+    finally:
+        pool.close()
+        pool.join()
+    return RepairResult(sorted(repaired), sorted(failed))
+
+
+def _open_replicas(fsdb, replicas):
+    for replica in replicas:
+        if not hasattr(replica, 'fsdbRoot'):
+            if not fsdb.config_exists(replica):
+                logger.warning("skipping replica, no fsdb found: '{0}'".format(replica))
+                continue
+            replica = type(fsdb)(replica)
+        try:
+            sync._check_compatible(fsdb, replica)
+        except ValueError as e:
+            logger.warning("skipping replica '{0}': {1}".format(replica.fsdbRoot, e))
+            continue
+        yield replica
+
+
+def _restore(fsdb, digest, sources):
+    '''Return the root of the fsdb `digest` has been restored from, None if not found in any replica'''
+    if fsdb.exists(digest):
+        # added again after being quarantined
+        fsdb._unquarantine(digest)
+        return fsdb.fsdbRoot
+    for replica in sources:
+        path = replica.get_file_path(digest)
+        if not os.path.isfile(path):
+            continue
+        try:
+            fsdb._insert(path, digest, verify=True)
+        except CorruptedError:
+            logger.warning("copy of [{0}] is corrupted in replica '{1}' too".format(digest, replica.fsdbRoot))
+            continue
+        except (IOError, OSError) as e:
+            logger.warning("could not restore [{0}] from replica '{1}': {2}".format(digest, replica.fsdbRoot, e))
+            continue
+        fsdb._unquarantine(digest)
+        logger.info("restored [{0}] from replica '{1}'".format(digest, replica.fsdbRoot))
+        return replica.fsdbRoot
+    return None
@@ -0,0 +1,116 @@
+from __future__ import unicode_literals
+
+import os
+import time
+import logging
+import itertools
+import threading
+
+from .locking import stripe_of
+from .striped import StripedLog
+
+# a file read many times is marked at most once per this many seconds by a process
+READ_MARK_INTERVAL = 3600
+# number of recently marked files remembered by a process
+READ_MARK_MEMORY = 4096
+
+
+class ScrubMarkers(object):
+    '''Per-file "last verified" markers
+
+       Every successful verification made by a scrub, or by a complete
+       verified read, appends ``<digest> <time> <mtime> <size>`` to a striped
+       log, the last record of a digest wins. A marker is only valid as long
+       as mtime and size of the file did not change.
+    '''
+
+    def __init__(self, fsdb, folder):
+        self._log = StripedLog(fsdb, folder)
+        self._fsdb = fsdb
+        # digest -> time of the last marker written for a read
+        self._read_marks = {}
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+    def mark(self, digest, path=None):
+        '''Record a successful verification, best effort (e.g. on read-only stores)'''
+        try:
+            st = os.stat(path or self._fsdb.get_file_path(digest))
+            self._log.append(digest, str(int(time.time())), str(int(st.st_mtime)), str(st.st_size))
+        except (IOError, OSError) as e:
+            self.logger.debug("Cannot record the verification of [{0}]: {1}".format(digest, e))
+
+    def mark_read(self, digest):
+        '''Record the verification made by a complete read, at most once per READ_MARK_INTERVAL'''
+        now = time.time()
+        with self._lock:
+            if now - self._read_marks.get(digest, 0) < READ_MARK_INTERVAL:
+                return
+            if len(self._read_marks) >= READ_MARK_MEMORY:
+                self._read_marks.clear()
+            self._read_marks[digest] = now
+        self.mark(digest)
+
+    def load(self, stripe):
+        '''Return a dictionary `digest -> (time, mtime, size)` and the number of records'''
+        markers = {}
+        records = 0
+        for record in self._log.read(stripe):
+            markers[record[0]] = (int(record[1]), int(record[2]), int(record[3]))
+            records += 1
+        return markers, records
+
+    def compact(self, stripe, digests):
+        '''Drop duplicated records and markers of files no longer stored'''
+        with self._fsdb._locks.stripe(stripe):
+            markers = self.load(stripe)[0]
+            self._log.rewrite(stripe, [(d,) + tuple(str(v) for v in markers[d])
+                                       for d in sorted(markers) if d in digests])
+
+
+def scrub(fsdb, window, max_bytes=None, io_class=None):
+    '''Check the files not verified within `window` seconds, oldest first
+
+       Yields digests of corrupted files. If `max_bytes` is given the scrub
+       stops once that amount of data has been checked. Files are read with
+       the page cache hints of `io_class`.
+    '''
+    markers = fsdb._scrub_markers
+    limit = time.time() - window
+    candidates = []
+    for stripe, items in itertools.groupby(fsdb._walk(), lambda item: stripe_of(item[0])):
+        stripeMarkers, records = markers.load(stripe)
+        digests = set()
+        for digest, path in items:
+            digests.add(digest)
+            try:
+                st = os.stat(path)
+            except OSError:
+                # removed meanwhile
+                continue
+            marker = stripeMarkers.get(digest)
+            if marker is not None and marker[1:] == (int(st.st_mtime), st.st_size):
+                if marker[0] >= limit:
+                    continue
+                lastVerified = marker[0]
+            else:
+                lastVerified = 0
+            candidates.append((lastVerified, digest, st.st_size))
+        if records > 2 * len(digests):
+            markers.compact(stripe, digests)
+
+    # never verified first, then the ones verified longest ago
+    candidates.sort()
+    checked = 0
+    for lastVerified, digest, size in candidates:
+        if max_bytes is not None and checked and checked + size > max_bytes:
+            break
+        checked += size
+        try:
+            ok = fsdb.check(digest, record=True, io_class=io_class)
+        except (IOError, OSError):
+            # removed meanwhile
+            continue
+        if not ok:
+            yield digest
+    fsdb.logger.debug("Scrubbed {0} bytes".format(checked))
@@ -0,0 +1,379 @@
+from __future__ import unicode_literals
+
+import os
+import re
+import logging
+import threading
+
+from .compat import queue, HTTPServer, BaseHTTPRequestHandler
+from .verify import CorruptedError
+
+# stored files never change: clients and proxies can cache them forever
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# seconds an idle keep-alive connection holds a worker
+KEEPALIVE_TIMEOUT = 30
+
+# content of the request body read, and discarded, to keep a connection alive
+DRAIN_LIMIT = 2**20
+
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+_DIGEST = re.compile(r"^[0-9a-f]+$")
+
+logger = logging.getLogger(__name__)
+
+
+class FsdbServer(HTTPServer):
+    '''HTTP server exposing the files of an fsdb
+
+       Connections are served by a fixed pool of `workers` threads,
+       connections accepted while all workers are busy wait in a queue.
+       Supported requests:
+
+         ``GET /<digest>``      content of a stored file, with ``Range`` and ``ETag`` support
+         ``HEAD /<digest>``     same headers, no content
+         ``PUT /<digest>``      add a file, the content is verified against the digest
+         ``PUT /``, ``POST /``  add a file, the digest is returned in the body
+
+       Unless `readonly` is true. Files are read through :py:func:`Fsdb.open()`,
+       quarantined files are answered with 503.
+    '''
+
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def __init__(self, address, fsdb, workers=16, readonly=False):
+        HTTPServer.__init__(self, address, FsdbRequestHandler)
+        self.fsdb = fsdb
+        self.readonly = readonly
+        self._connections = queue.Queue(workers * 4)
+        self._workers = []
+        for i in range(workers):
+            t = threading.Thread(target=self._work, name="fsdb-http-{0}".format(i))
+            t.daemon = True
+            t.start()
+            self._workers.append(t)
+
+    def process_request(self, request, client_address):
+        self._connections.put((request, client_address))
+
+    def _work(self):
+        while True:
+            item = self._connections.get()
+            if item is None:
+                return
+            request, client_address = item
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    def server_close(self):
+        HTTPServer.server_close(self)
+        for _ in self._workers:
+            self._connections.put(None)
+
+
+class FsdbRequestHandler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+    server_version = "fsdb"
+    timeout = KEEPALIVE_TIMEOUT
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+    def _digest(self):
+        '''Return the digest named by the request path, None for the root'''
+        path = self.path.split('?', 1)[0].strip('/')
+        return path or None
+
+    def _stored(self, digest):
+        '''Return `(digest, path, size)` of a stored file, None if it is not stored'''
+        fsdb = self.server.fsdb
+        if not _DIGEST.match(digest):
+            return None
+        try:
+            digest = fsdb.resolve(digest)
+            path = fsdb.get_file_path(digest)
+            return digest, path, os.path.getsize(path)
+        except (OSError, ValueError, TypeError):
+            return None
+
+    def do_HEAD(self):
+        self._get(body=False)
+
+    def do_GET(self):
+        self._get(body=True)
+
+    def handle_expect_100(self):
+        # the content of a file already stored is not uploaded at all
+        digest = self._digest()
+        if self.command == 'PUT' and digest and self._stored(digest) is not None:
+            self.close_connection = True
+            self._reply(200, digest)
+            return False
+        return BaseHTTPRequestHandler.handle_expect_100(self)
+
+    def _get(self, body):
+        digest = self._digest()
+        stored = self._stored(digest) if digest else None
+        if stored is None:
+            if digest and _DIGEST.match(digest) and self.server.fsdb.is_quarantined(self.server.fsdb.resolve(digest)):
+                return self._error(503, "stored file is corrupted and has been quarantined")
+            return self._error(404, "no stored file found")
+        digest, path, size = stored
+        etag = '"{0}"'.format(digest)
+
+        if _etag_matches(self.headers.get('If-None-Match'), etag):
+            self.send_response(304)
+            self._cache_headers(etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        start, end = 0, size
+        status = 200
+        rangeHeader = self.headers.get('Range')
+        ifRange = self.headers.get('If-Range')
+        if rangeHeader and (ifRange is None or ifRange == etag):
+            byteRange = _parse_range(rangeHeader, size)
+            if byteRange is False:
+                self.send_response(416)
+                self.send_header("Content-Range", "bytes */{0}".format(size))
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            if byteRange is not None:
+                start, end = byteRange
+                status = 206
+
+        try:
+            # records the access for cache eviction and verifies the content if configured
+            f = self.server.fsdb.open(digest)
+        except KeyError:
+            return self._error(404, "no stored file found")
+        except CorruptedError:
+            return self._error(503, "stored file is corrupted and has been quarantined")
+        try:
+            self.send_response(status)
+            self._cache_headers(etag)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("Content-Length", str(end - start))
+            if status == 206:
+                self.send_header("Content-Range", "bytes {0}-{1}/{2}".format(start, end - 1, size))
+            self.end_headers()
+            if body:
+                self._send_file(f, start, end - start)
+        except CorruptedError:
+            # the content has already been sent, the client can only be told by a broken connection
+            self.close_connection = True
+            logger.warning("served corrupted file [{0}]".format(digest))
+        finally:
+            f.close()
+
+    def _send_file(self, f, offset, count):
+        self.wfile.flush()
+        if getattr(getattr(f, 'raw', None), 'verifying', False) and offset == 0:
+            # the content goes through the verifying reader, the end of file is verified
+            while count > 0:
+                chunk = f.read(min(count, 2**16))
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+                count -= len(chunk)
+            f.read(1)
+            return
+        if hasattr(os, 'sendfile'):
+            out = self.connection.fileno()
+            while count > 0:
+                sent = os.sendfile(out, f.fileno(), offset, count)
+                if sent == 0:
+                    break
+                offset += sent
+                count -= sent
+            return
+        f.seek(offset)
+        while count > 0:
+            chunk = f.read(min(count, 2**16))
+            if not chunk:
+                break
+            self.wfile.write(chunk)
+            count -= len(chunk)
+
+    def do_PUT(self):
+        self._add(self._digest())
+
+    def do_POST(self):
+        if self._digest() is not None:
+            body = self._body()
+            self.close_connection = body is None or not body.drain(DRAIN_LIMIT)
+            return self._error(405, "POST is only allowed on /")
+        self._add(None)
+
+    def _add(self, digest):
+        fsdb = self.server.fsdb
+        body = self._body()
+        if body is None or self.server.readonly:
+            # the content is not read, the connection can not be reused
+            self.close_connection = True
+            if body is None:
+                return self._error(411, "Content-Length or chunked transfer encoding required")
+            return self._error(405, "read-only server")
+        if digest is not None and not _DIGEST.match(digest):
+            self.close_connection = not body.drain(DRAIN_LIMIT)
+            return self._error(400, "malformed digest")
+        if digest is not None and self._stored(digest) is not None:
+            # no need to store the content again
+            self.close_connection = not body.drain(DRAIN_LIMIT)
+            return self._reply(200, digest)
+        try:
+            digest = fsdb.add(body, digest)
+        except CorruptedError:
+            return self._error(422, "content does not match the digest")
+        except (ValueError, TypeError) as e:
+            self.close_connection = not body.drain(DRAIN_LIMIT)
+            return self._error(400, str(e))
+        self._reply(201, digest)
+
+    def _body(self):
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            return ChunkedReader(self.rfile)
+        length = self.headers.get('Content-Length')
+        if length is None or not length.isdigit():
+            return None
+        return LimitedReader(self.rfile, int(length))
+
+    def _reply(self, status, digest):
+        data = (digest + "\n").encode('ascii')
+        self.send_response(status)
+        self.send_header("Location", "/" + digest)
+        self.send_header("ETag", '"{0}"'.format(digest))
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _cache_headers(self, etag):
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", CACHE_CONTROL)
+
+    def _error(self, status, message):
+        data = (message + "\n").encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(data)
+
+
+class LimitedReader(object):
+    '''Readable object returning at most `length` bytes of a stream'''
+
+    def __init__(self, stream, length):
+        self._stream = stream
+        self._left = length
+
+    def read(self, size=-1):
+        if self._left <= 0:
+            return b""
+        if size is None or size < 0 or size > self._left:
+            size = self._left
+        data = self._stream.read(size)
+        if not data:
+            raise IOError("connection closed before the end of the content")
+        self._left -= len(data)
+        return data
+
+    def drain(self, limit):
+        return _drain(self, limit)
+
+
+class ChunkedReader(object):
+    '''Readable object decoding a chunked transfer encoded stream'''
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._left = 0
+        self._done = False
+
+    def read(self, size=-1):
+        if self._done:
+            return b""
+        if self._left == 0:
+            line = self._stream.readline(1024)
+            if not line:
+                raise IOError("connection closed before the end of the content")
+            try:
+                self._left = int(line.split(b";", 1)[0].strip(), 16)
+            except ValueError:
+                raise IOError("malformed chunked transfer encoding")
+            if self._left == 0:
+                # skip trailers
+                while self._stream.readline(1024).strip():
+                    pass
+                self._done = True
+                return b""
+        if size is None or size < 0 or size > self._left:
+            size = self._left
+        data = self._stream.read(size)
+        if not data:
+            raise IOError("connection closed before the end of the content")
+        self._left -= len(data)
+        if self._left == 0:
+            self._stream.readline(1024)
+        return data
+
+    def drain(self, limit):
+        return _drain(self, limit)
+
+
+def _drain(reader, limit):
+    '''Read and discard what is left of a body, up to `limit` bytes. Returns True if all was read'''
+    while limit > 0:
+        data = reader.read(min(limit, 2**16))
+        if not data:
+            return True
+        limit -= len(data)
+    return not reader.read(1)
+
+
+def _etag_matches(header, etag):
+    if not header:
+        return False
+    return header.strip() == "*" or etag in [t.strip() for t in header.split(",")]
+
+
+def _parse_range(header, size):
+    '''Return `(start, end)` of a single byte range, None to serve the whole file, False if not satisfiable'''
+    match = _RANGE.match(header.strip())
+    if match is None:
+        # multiple or malformed ranges: the whole content is served
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        start = max(0, size - int(last))
+        end = size
+    else:
+        start = int(first)
+        end = min(size, int(last) + 1) if last else size
+    if start >= size or start >= end:
+        return False
+    return start, end
+
+
+def serve(fsdb, host="127.0.0.1", port=8080, workers=16, readonly=False):
+    '''Serve the given fsdb over HTTP until interrupted'''
+    server = FsdbServer((host, port), fsdb, workers=workers, readonly=readonly)
+    logger.info("Serving {0} on http://{1}:{2}/".format(fsdb.fsdbRoot, host, server.server_address[1]))
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
@@ -0,0 +1,289 @@
+from __future__ import unicode_literals
+
+import os
+import re
+import json
+import time
+import errno
+import binascii
+import threading
+from multiprocessing.pool import ThreadPool
+
+from . import journal
+from . import hashtools
+from .digestset import DigestSet
+from .utils import list_dir, bounded_imap
+
+_NAME = re.compile(r"^[A-Za-z0-9_-][A-Za-z0-9_.-]*$")
+
+MANIFEST_SUFFIX = ".set"
+INFO_SUFFIX = ".json"
+
+
+class Snapshots(object):
+    '''Point-in-time manifests of the digests stored in an fsdb
+
+       Every snapshot is a :py:class:`DigestSet` file ``<name>.set`` and a
+       json file ``<name>.json`` holding its creation time, the number of
+       digests and the journal sequence number it corresponds to, if any.
+       The json file is written last: a snapshot without it is incomplete.
+
+       With the journal enabled a snapshot is the previous one with the
+       journal changes following it applied, no scan is needed. The first
+       snapshot is built by scanning the top level folders in parallel and
+       replaying the changes made during the scan, so it is consistent too.
+       Without journal the scan is the snapshot, files added or removed
+       while it runs may or may not be listed.
+
+       Files listed in a snapshot are kept by gc, eviction and expiration
+       until the snapshot is released.
+    '''
+
+    def __init__(self, fsdb, folder):
+        self._fsdb = fsdb
+        self.folder = folder
+        # snapshot files -> open digest sets
+        self._live = ((), [])
+        self._lock = threading.Lock()
+
+    def create(self, name=None, workers=8):
+        '''Write a new snapshot and return its name (default: the current UTC time)'''
+        self._fsdb._makedirs(self.folder)
+        if name is None:
+            fd = None
+            while fd is None:
+                created = time.time()
+                name = _default_name(created)
+                fd = self._reserve(name)
+        else:
+            self._check_name(name)
+            created = time.time()
+            fd = self._reserve(name)
+            if fd is None:
+                raise ValueError("snapshot already exists: '{0}'".format(name))
+        tmpPath = self._path(name, INFO_SUFFIX) + ".tmp"
+        manifest = self._path(name, MANIFEST_SUFFIX)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                digests, seq = self._write(manifest, workers)
+                info = {"created": created, "count": len(digests), "journal_seq": seq}
+                digests.close()
+                json.dump(info, f)
+            os.chmod(tmpPath, self._fsdb._conf['fmode'])
+            os.chmod(manifest, self._fsdb._conf['fmode'])
+        except Exception:
+            for path in (manifest, tmpPath):
+                if os.path.exists(path):
+                    os.remove(path)
+            raise
+        os.rename(tmpPath, self._path(name, INFO_SUFFIX))
+        return name
+
+    def _reserve(self, name):
+        '''Exclusively create the temporary json file of a new snapshot
+
+           Returns:
+             its file descriptor, None if the snapshot exists or is being created
+        '''
+        tmpPath = self._path(name, INFO_SUFFIX) + ".tmp"
+        try:
+            fd = os.open(tmpPath, os.O_WRONLY | os.O_CREAT | os.O_EXCL, self._fsdb._conf['fmode'])
+        except OSError as e:
+            if e.errno == errno.EEXIST:
+                return None
+            raise
+        # a complete snapshot renamed its temporary file away
+        if os.path.exists(self._path(name, INFO_SUFFIX)):
+            os.close(fd)
+            os.remove(tmpPath)
+            return None
+        return fd
+
+    def _write(self, manifest, workers):
+        '''Write the manifest of a new snapshot, return its `(DigestSet, journal seq)`'''
+        digestSize = hashtools.digest_length(self._fsdb._conf['hash_alg']) // 2
+        journ = self._fsdb._journal
+        seq = None
+        if journ is None:
+            digests = DigestSet.create(manifest, _scan(self._fsdb, workers), digestSize)
+        else:
+            base = self._latest_with_seq()
+            if base is None:
+                # changes made while scanning are replayed on top of the scan
+                seq = journ.last_seq()
+                base = DigestSet.create(manifest + ".scan", _scan(self._fsdb, workers), digestSize)
+            else:
+                seq = self.info(base)['journal_seq']
+                base = self.open(base)
+            try:
+                changes = {}
+                for recordSeq, op, digest in journ.changes(seq):
+                    # the last change of every digest wins
+                    changes[digest] = op
+                    seq = recordSeq
+                changes = sorted((binascii.unhexlify(digest), op) for digest, op in changes.items()
+                                 if self._fsdb._layout.valid(digest))
+                digests = DigestSet.create(manifest, _apply(base, changes), digestSize)
+            finally:
+                base.close()
+                if os.path.exists(manifest + ".scan"):
+                    os.remove(manifest + ".scan")
+        return digests, seq
+
+    def names(self):
+        '''Return the names of the complete snapshots, oldest first'''
+        names = []
+        for entry in self._list():
+            try:
+                names.append((self.info(entry)['created'], entry))
+            except KeyError:
+                # released meanwhile
+                continue
+        return [name for _, name in sorted(names)]
+
+    def info(self, name):
+        '''Return the dictionary of the json file of a snapshot'''
+        self._check_name(name)
+        try:
+            with open(self._path(name, INFO_SUFFIX)) as f:
+                return json.load(f)
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                raise KeyError("no such snapshot: '{0}'".format(name))
+            raise
+
+    def open(self, name):
+        '''Return the :py:class:`DigestSet` of a snapshot'''
+        self.info(name)
+        return DigestSet(self._path(name, MANIFEST_SUFFIX))
+
+    def release(self, name):
+        '''Remove a snapshot, its files are not held anymore'''
+        self.info(name)
+        os.remove(self._path(name, INFO_SUFFIX))
+        os.remove(self._path(name, MANIFEST_SUFFIX))
+
+    def close(self):
+        with self._lock:
+            for digests in self._live[1]:
+                digests.close()
+            self._live = ((), [])
+
+    def holds(self, digest, live=None):
+        '''Tell whether the given digest is listed in any snapshot
+
+           `live` are the digest sets returned by :py:func:`live()`, loaded
+           once by the passes over many digests.
+        '''
+        for digests in self.live() if live is None else live:
+            if digest in digests:
+                return True
+        return False
+
+    def live(self):
+        '''Return the digest sets of all the snapshots, reopened whenever snapshots change'''
+        key = []
+        for name in self._list():
+            try:
+                st = os.stat(self._path(name, INFO_SUFFIX))
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+                continue
+            key.append((name, st.st_ino, st.st_mtime))
+        key = tuple(key)
+        with self._lock:
+            if self._live[0] != key:
+                for digests in self._live[1]:
+                    digests.close()
+                sets = []
+                for name, _, _ in key:
+                    try:
+                        sets.append(DigestSet(self._path(name, MANIFEST_SUFFIX)))
+                    except IOError as e:
+                        if e.errno != errno.ENOENT:
+                            raise
+                self._live = (key, sets)
+            return self._live[1]
+
+    def _latest_with_seq(self):
+        for name in reversed(self.names()):
+            if self.info(name).get('journal_seq') is not None:
+                return name
+        return None
+
+    def _list(self):
+        try:
+            entries = os.listdir(self.folder)
+        except OSError as e:
+            if e.errno == errno.ENOENT:
+                return []
+            raise
+        return sorted(entry[:-len(INFO_SUFFIX)] for entry in entries if entry.endswith(INFO_SUFFIX))
+
+    def _path(self, name, suffix):
+        return os.path.join(self.folder, name + suffix)
+
+    def _check_name(self, name):
+        if not _NAME.match(name):
+            raise ValueError("invalid snapshot name: '{0}'".format(name))
+
+
+def _default_name(created):
+    '''Return the UTC time `created` as a snapshot name, to the microsecond'''
+    return time.strftime("%Y%m%dT%H%M%S", time.gmtime(created)) + ".{0:06d}Z".format(int(created % 1 * 1000000))
+
+
+def diff(old, new):
+    '''Iterate over `(op, digest)` of the changes from the `old` to the `new` digest set
+
+       op is '+' for digests only in `new` and '-' for digests only in `old`.
+    '''
+    for side, digest in old.diff(new):
+        if side == '<':
+            yield journal.REMOVED, binascii.hexlify(digest).decode('ascii')
+        elif side == '>':
+            yield journal.ADDED, binascii.hexlify(digest).decode('ascii')
+
+
+def _apply(digests, changes):
+    '''Merge the sorted binary `digests` with the sorted `(digest, op)` journal `changes`'''
+    changes = iter(changes)
+    change = next(changes, None)
+    for digest in digests:
+        while change is not None and change[0] < digest:
+            if change[1] == journal.ADDED:
+                yield change[0]
+            change = next(changes, None)
+        if change is not None and change[0] == digest:
+            if change[1] == journal.ADDED:
+                yield digest
+            change = next(changes, None)
+        else:
+            yield digest
+    while change is not None:
+        if change[1] == journal.ADDED:
+            yield change[0]
+        change = next(changes, None)
+
+
+def _scan(fsdb, workers):
+    '''Iterate in order over the binary digests of all stored files, top level folders are listed in parallel'''
+    if fsdb._conf['depth'] == 0 or workers <= 1:
+        for digest in fsdb.raw_digests():
+            yield digest
+        return
+
+    def list_shard(name):
+        items = fsdb._walk_folder(os.path.join(fsdb.fsdbRoot, name), name, 1, None)
+        return [binascii.unhexlify(digest) for digest, _ in items if fsdb._layout.valid(digest)]
+
+    shards = [name for name, is_dir in list_dir(fsdb.fsdbRoot) if is_dir]
+    pool = ThreadPool(workers)
+    try:
+        for digests in bounded_imap(pool, list_shard, shards, workers * 2):
+            for digest in digests:
+                yield digest
+    finally:
+        pool.close()
+        pool.join()
@@ -0,0 +1,103 @@
+from __future__ import unicode_literals
+
+import os
+import errno
+import collections
+
+from .locking import stripe_of
+from .utils import open_append
+
+
+class StripedLog(object):
+    '''Append-only record files striped by digest prefix
+
+       Records are lines of space separated fields whose first field is
+       always a digest. Appends hold the stripe lock in shared mode and rely
+       on ``O_APPEND`` atomicity, so concurrent writers do not block each other.
+       Rewriting a stripe (compaction) requires its exclusive lock.
+    '''
+
+    def __init__(self, fsdb, folder):
+        self._fsdb = fsdb
+        self.folder = folder
+        self._ready = False
+
+    def _path(self, stripe):
+        return os.path.join(self.folder, stripe)
+
+    def _prepare(self):
+        if not self._ready:
+            self._fsdb._makedirs(self.folder)
+            self._ready = True
+
+    def append(self, digest, *fields):
+        self.append_many([(digest,) + fields])
+
+    def append_many(self, records, locked=False):
+        '''Append records (tuples of fields) grouping writes by stripe
+
+           With `locked` the caller already holds the locks of the stripes.
+        '''
+        byStripe = collections.defaultdict(list)
+        for record in records:
+            byStripe[stripe_of(record[0])].append(" ".join(record) + "\n")
+        self._prepare()
+        for stripe in sorted(byStripe):
+            data = "".join(byStripe[stripe]).encode('ascii')
+            if locked:
+                self._write(stripe, data)
+            else:
+                with self._fsdb._locks.stripe(stripe, shared=True):
+                    self._write(stripe, data)
+
+    def _write(self, stripe, data):
+        fd = open_append(self._path(stripe), self._fsdb._conf['fmode'])
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+
+    def read(self, stripe):
+        '''Iterate over the records (lists of fields) of the given stripe'''
+        try:
+            with open(self._path(stripe), 'rb') as f:
+                data = f.read().decode('ascii')
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                return
+            raise
+        for line in data.splitlines():
+            if line:
+                yield line.split(" ")
+
+    def read_digest(self, digest):
+        '''Iterate over the records of the given digest'''
+        for record in self.read(stripe_of(digest)):
+            if record[0] == digest:
+                yield record
+
+    def rewrite(self, stripe, records):
+        '''Atomically replace the content of a stripe
+
+           Caller must hold the exclusive lock of the stripe.
+        '''
+        self._prepare()
+        path = self._path(stripe)
+        tmpPath = path + ".tmp"
+        fd = os.open(tmpPath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, self._fsdb._conf['fmode'])
+        try:
+            os.fchmod(fd, self._fsdb._conf['fmode'])
+            os.write(fd, "".join(" ".join(r) + "\n" for r in records).encode('ascii'))
+        finally:
+            os.close(fd)
+        os.rename(tmpPath, path)
+
+    def stripes(self):
+        '''Return the sorted list of existing stripes'''
+        try:
+            names = os.listdir(self.folder)
+        except OSError as e:
+            if e.errno == errno.ENOENT:
+                return []
+            raise
+        return sorted(n for n in names if not n.endswith(".tmp"))
@@ -0,0 +1,130 @@
+from __future__ import unicode_literals
+
+import os
+import logging
+import collections
+from multiprocessing.pool import ThreadPool
+
+from . import hashtools
+from .utils import bounded_imap
+from .verify import CorruptedError
+
+
+logger = logging.getLogger(__name__)
+
+# number of processed files between two checkpoint updates
+CHECKPOINT_INTERVAL = 1000
+
+SyncResult = collections.namedtuple('SyncResult', ['copied', 'corrupted'])
+
+
+def diff(src, dst, start=None):
+    '''Merge the sorted digest streams of `src` and `dst`
+
+       yield `('<', digest)` for digests stored only in `src`
+       and `('>', digest)` for digests stored only in `dst`.
+    '''
+    _check_compatible(src, dst)
+    srcIter = src._walk(start)
+    dstIter = dst._walk(start)
+    s = next(srcIter, None)
+    d = next(dstIter, None)
+    while s is not None or d is not None:
+        if d is None or (s is not None and s[0] < d[0]):
+            yield '<', s[0]
+            s = next(srcIter, None)
+        elif s is None or d[0] < s[0]:
+            yield '>', d[0]
+            d = next(dstIter, None)
+        else:
+            s = next(srcIter, None)
+            d = next(dstIter, None)
+
+
+def sync(src, dst, workers=4, verify=False, checkpoint=None, io_class=None):
+    '''Copy to `dst` all the digests stored only in `src`
+
+       Digests are processed in lexicographic order, so the last copied digest
+       is enough to resume an interrupted run. It is saved into `checkpoint`
+       (if given) every CHECKPOINT_INTERVAL files and when an error occurs.
+       Files are added to `dst` as by :py:func:`Fsdb.add()` (references, journal).
+       With `verify` files are hashed while copied, corrupted ones are not placed in `dst`
+       and reported. The checkpoint is deleted once the sync completes.
+       Returns a `SyncResult` with the number of copied files and the sorted list of corrupted digests.
+    '''
+    start = _read_checkpoint(checkpoint) if checkpoint else None
+    if start:
+        logger.info("resuming sync from checkpoint: {0}".format(start))
+    missing = (digest for side, digest in diff(src, dst, start) if side == '<')
+
+    def copy(digest):
+        return _copy(src, dst, digest, verify, io_class)
+
+    copied = 0
+    corrupted = []
+    processed = 0
+    last = start
+    pool = ThreadPool(workers)
+    try:
+        for digest, done in bounded_imap(pool, copy, missing, workers * 4):
+            last = digest
+            if done is None:
+                corrupted.append(digest)
+            elif done:
+                copied += 1
+            processed += 1
+            if checkpoint and processed >= CHECKPOINT_INTERVAL:
+                _write_checkpoint(checkpoint, last)
+                processed = 0
+    except Exception:
+        pool.terminate()
+        if checkpoint and last:
+            _write_checkpoint(checkpoint, last)
+        raise
+    else:
+        pool.close()
+    finally:
+        pool.join()
+
+    if checkpoint and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    logger.debug("synced {0} files from {1} to {2}".format(copied, src.fsdbRoot, dst.fsdbRoot))
+    return SyncResult(copied, sorted(corrupted))
+
+
+def _copy(src, dst, digest, verify, io_class=None):
+    '''Return `(digest, outcome)`, outcome is True if copied, False if gone from `src`, None if corrupted'''
+    srcPath = src.get_file_path(digest)
+    if not os.path.isfile(srcPath):
+        # removed from source after being listed
+        return digest, False
+    try:
+        dst._store(srcPath, digest, trusted=verify, io_class=io_class)
+    except CorruptedError:
+        logger.warning("corrupted file not synced: '{0}' [{1}]".format(srcPath, digest))
+        return digest, None
+    return digest, True
+
+
+def _check_compatible(src, dst):
+    if src._conf['hash_alg'] != dst._conf['hash_alg']:
+        raise ValueError("cannot compare fsdb instances using different hash algorithms: {0} != {1}".format(
+            src._conf['hash_alg'], dst._conf['hash_alg']))
+    if hashtools.tree_base(src._conf['hash_alg']) and src._conf['tree_chunk_size'] != dst._conf['tree_chunk_size']:
+        raise ValueError("cannot compare fsdb instances using different tree chunk sizes: {0} != {1}".format(
+            src._conf['tree_chunk_size'], dst._conf['tree_chunk_size']))
+
+
+def _read_checkpoint(path):
+    try:
+        with open(path, 'r') as f:
+            return f.read().strip() or None
+    except IOError:
+        return None
+
+
+def _write_checkpoint(path, digest):
+    tmpPath = path + ".tmp"
+    with open(tmpPath, 'w') as f:
+        f.write(digest)
+    os.rename(tmpPath, path)
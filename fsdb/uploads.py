@@ -0,0 +1,159 @@
+from __future__ import unicode_literals
+
+import os
+import re
+import uuid
+import errno
+import threading
+import contextlib
+
+from .compat import fcntl
+
+_UPLOAD_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+class Uploads(object):
+    '''Resumable uploads staged under `folder`
+
+       Every upload is a file named by its id, on the same filesystem as the
+       tree, so that a finished upload is moved in place by a rename.
+       Chunks are only appended at the end of the file: its size is the offset
+       a client resumes from. Chunks are hashed as they are written, the hash
+       state is kept in memory; after a restart, or when chunks have been
+       appended by another process, only the part of the file it has not seen
+       yet is read and hashed.
+       Every operation holds an exclusive ``flock`` on the upload file.
+    '''
+
+    def __init__(self, fsdb, folder):
+        self._fsdb = fsdb
+        self.folder = folder
+        # upload id -> (bytes hashed, hash object)
+        self._hashes = {}
+        self._lock = threading.Lock()
+
+    def begin(self):
+        '''Create a new empty upload and return its id'''
+        self._fsdb._makedirs(self.folder)
+        upload_id = uuid.uuid4().hex
+        self._fsdb._create_empty_file(self._path(upload_id))
+        return upload_id
+
+    def offset(self, upload_id):
+        '''Return the number of bytes received'''
+        try:
+            return os.path.getsize(self._path(upload_id))
+        except OSError as e:
+            if e.errno == errno.ENOENT:
+                raise KeyError("no such upload: '{0}'".format(upload_id))
+            raise
+
+    def append(self, upload_id, offset, data):
+        '''Write the bytes of `data` not received yet, return the new offset'''
+        with self._open(upload_id) as fd:
+            size = os.fstat(fd).st_size
+            if offset < 0 or offset > size:
+                raise ValueError("chunk at offset {0} of upload '{1}', but {2} bytes have been received"
+                                 .format(offset, upload_id, size))
+            # a chunk sent again (e.g. its reply was lost) is only written past what was received
+            data = data[size - offset:]
+            hashM = self._catch_up(upload_id, fd, size)
+            done = 0
+            try:
+                while done < len(data):
+                    written = os.write(fd, data[done:])
+                    hashM.update(data[done:done + written])
+                    done += written
+            finally:
+                with self._lock:
+                    self._hashes[upload_id] = (size + done, hashM)
+            return size + done
+
+    @contextlib.contextmanager
+    def finish(self, upload_id):
+        '''Hold the upload for the duration of the block, yielding `(path, hash object)` of its content
+
+           The block is expected to move or remove the file.
+        '''
+        with self._open(upload_id) as fd:
+            hashM = self._catch_up(upload_id, fd, os.fstat(fd).st_size)
+            with self._lock:
+                self._hashes.pop(upload_id, None)
+            yield self._path(upload_id), hashM
+
+    def abort(self, upload_id):
+        '''Remove an upload and what it received'''
+        with self._open(upload_id):
+            os.remove(self._path(upload_id))
+            with self._lock:
+                self._hashes.pop(upload_id, None)
+
+    def __iter__(self):
+        '''Iterate over `(upload id, offset, last modification time)` of the unfinished uploads'''
+        try:
+            names = sorted(os.listdir(self.folder))
+        except OSError as e:
+            if e.errno == errno.ENOENT:
+                return
+            raise
+        for name in names:
+            if not _UPLOAD_ID.match(name):
+                continue
+            try:
+                st = os.stat(os.path.join(self.folder, name))
+            except OSError as e:
+                # finished meanwhile
+                if e.errno == errno.ENOENT:
+                    continue
+                raise
+            yield name, st.st_size, st.st_mtime
+
+    def _catch_up(self, upload_id, fd, size):
+        '''Return the hash object of the upload updated with its first `size` bytes'''
+        with self._lock:
+            hashed, hashM = self._hashes.get(upload_id, (0, None))
+        if hashM is None:
+            hashed, hashM = 0, self._fsdb._new_hash()
+        if hashed < size:
+            # O_APPEND writes always go to the end, moving the offset only affects reads
+            os.lseek(fd, hashed, os.SEEK_SET)
+            while hashed < size:
+                chunk = os.read(fd, min(self._fsdb.BLOCK_SIZE, size - hashed))
+                if not chunk:
+                    break
+                hashM.update(chunk)
+                hashed += len(chunk)
+        return hashM
+
+    @contextlib.contextmanager
+    def _open(self, upload_id):
+        path = self._path(upload_id)
+        try:
+            fd = os.open(path, os.O_RDWR | os.O_APPEND)
+        except OSError as e:
+            if e.errno == errno.ENOENT:
+                raise KeyError("no such upload: '{0}'".format(upload_id))
+            raise
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                # committed or aborted while waiting for the lock
+                if not _same_file(fd, path):
+                    raise KeyError("no such upload: '{0}'".format(upload_id))
+            yield fd
+        finally:
+            os.close(fd)
+
+    def _path(self, upload_id):
+        if not _UPLOAD_ID.match(upload_id):
+            raise KeyError("no such upload: '{0}'".format(upload_id))
+        return os.path.join(self.folder, upload_id)
+
+
+def _same_file(fd, path):
+    try:
+        return os.path.samestat(os.fstat(fd), os.stat(path))
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+        return False
@@ -1,7 +1,15 @@
 import os
 import errno
+import struct
 import tempfile
 import platform
+import threading
+import contextlib
+import collections
+
+from .compat import scandir, fcntl
+from .verify import CorruptedError
+from .iohints import DropBehind
 
 
 def calc_dir_mode(mode):
@@ -24,7 +32,22 @@ def calc_dir_mode(mode):
     return mode
 
 
-def copy_content(origin, dstPath, blockSize, mode):
+# umask is process wide, changes must not interleave between threads
+_umask_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def umask(mask):
+    '''Set the process umask for the duration of the block'''
+    with _umask_lock:
+        oldmask = os.umask(mask)
+        try:
+            yield
+        finally:
+            os.umask(oldmask)
+
+
+def copy_content(origin, dstPath, blockSize, mode, hashM=None, expected=None, io_class=None):
     ''' copy the content of `origin` to `dstPath` in a safe manner.
 
         this function will first copy the content to a temporary file
@@ -32,34 +55,140 @@ def copy_content(origin, dstPath, blockSize, mode):
 
         if some error occurred during content copy or file movement
         the temporary file will be deleted.
+
+        if `hashM` is given it is updated with the copied content and,
+        when `expected` is also given, the file is moved to its destination
+        only if the resulting digest matches (``CorruptedError`` otherwise).
+
+        `io_class` selects the page cache hints to use, see ``iohints.IO_CLASSES``.
     '''
     tmpFD, tmpPath = tempfile.mkstemp(prefix=os.path.basename(dstPath) + "_", suffix='.tmp', dir=os.path.dirname(dstPath))
     try:
         try:
-            # change mode of the temp file
-            oldmask = os.umask(0)
-            try:
-                os.chmod(tmpPath, mode)
-            finally:
-                os.umask(oldmask)
+            # change mode of the temp file (chmod is not affected by umask)
+            os.chmod(tmpPath, mode)
             # copy content to temporary file
+            dropBehind = DropBehind(tmpFD, io_class)
             while True:
                 chunk = origin.read(blockSize)
                 if not chunk:
                     break
+                if hashM is not None:
+                    hashM.update(chunk)
                 os.write(tmpFD, chunk)
+                dropBehind.update(len(chunk))
+            dropBehind.drop()
         finally:
             os.close(tmpFD)
 
+        if expected is not None and hashM.hexdigest() != expected:
+            raise CorruptedError(expected)
+
         # move temporary file to actual requested destination
         try:
             os.rename(tmpPath, dstPath)
         except OSError as e:
             # on Windows if dstPath already exists at renaming time, an OSError is raised.
-            if platform.system() is 'Windows' and e.errno is errno.EEXIST:
+            if platform.system() == 'Windows' and e.errno == errno.EEXIST:
                 pass
             else:
                 raise
     except:
         os.remove(tmpPath)
         raise
+
+
+def list_dir(path):
+    '''Return the sorted list of `(name, is_dir)` entries of `path`.
+
+       Hidden entries (starting with ".") are skipped: digests never start
+       with a dot while fsdb private files and folders always do.
+    '''
+    entries = []
+    if scandir is not None:
+        for entry in scandir(path):
+            if not entry.name.startswith('.'):
+                entries.append((entry.name, entry.is_dir(follow_symlinks=False)))
+    else:
+        for name in os.listdir(path):
+            if not name.startswith('.'):
+                entries.append((name, os.path.isdir(os.path.join(path, name))))
+    entries.sort()
+    return entries
+
+
+def bounded_imap(pool, func, iterable, window):
+    '''Ordered version of ``pool.imap`` that keeps at most `window` tasks in flight.
+
+       ``Pool.imap`` consumes the whole input before yielding, which is not
+       an option when iterating over the content of a huge fsdb.
+    '''
+    pending = collections.deque()
+    for item in iterable:
+        pending.append(pool.apply_async(func, (item,)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def open_append(path, mode):
+    '''Open `path` for appending, creating it with the given `mode` if missing.
+
+       Returns a raw file descriptor opened with ``O_APPEND``.
+    '''
+    flags = os.O_WRONLY | os.O_APPEND
+    try:
+        return os.open(path, flags)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+    fd = os.open(path, flags | os.O_CREAT, mode)
+    try:
+        os.fchmod(fd, mode)
+    except OSError:
+        os.close(fd)
+        raise
+    return fd
+
+
+# FS_IOC_FIEMAP = _IOWR('f', 11, struct fiemap)
+FS_IOC_FIEMAP = 0xC020660B
+_FIEMAP_HEADER = struct.Struct(str('=QQLLLL'))
+_FIEMAP_EXTENT_SIZE = 56
+
+
+def physical_offset(fd):
+    '''Return the physical offset of the first extent of the file, None if unknown
+
+       Uses the Linux ``FIEMAP`` ioctl, not all filesystems support it.
+    '''
+    if fcntl is None:
+        return None
+    buf = bytearray(_FIEMAP_HEADER.size + _FIEMAP_EXTENT_SIZE)
+    _FIEMAP_HEADER.pack_into(buf, 0, 0, 2**64 - 1, 0, 0, 1, 0)
+    try:
+        fcntl.ioctl(fd, FS_IOC_FIEMAP, buf, True)
+    except (IOError, OSError):
+        return None
+    mapped = _FIEMAP_HEADER.unpack_from(buf, 0)[3]
+    if not mapped:
+        return None
+    # fe_physical follows fe_logical in the first extent
+    return struct.unpack_from(str('=Q'), buf, _FIEMAP_HEADER.size + 8)[0]
+
+
+def physical_order_key(path):
+    '''Sort key placing files in the order they are laid out on disk
+
+       Extents are used when available, otherwise the inode number is
+       a good approximation of the on-disk position on most filesystems.
+    '''
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        offset = physical_offset(fd)
+        if offset is not None:
+            return (0, offset)
+        return (1, os.fstat(fd).st_ino)
+    finally:
+        os.close(fd)
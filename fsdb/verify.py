@@ -0,0 +1,140 @@
+from __future__ import unicode_literals
+
+import io
+import os
+import logging
+import threading
+
+from . import hashtools
+from . import iohints
+from .compat import queue
+
+
+class CorruptedError(IOError):
+    '''The content of a stored file does not match its digest'''
+
+    def __init__(self, digest, path=None):
+        IOError.__init__(self, "corrupted file: '{0}' [{1}]".format(digest, path))
+        self.digest = digest
+        self.path = path
+
+
+class BackgroundVerifier(object):
+    '''Verify added files on a background thread
+
+       Corrupted files are moved to the fsdb quarantine.
+       The thread is started at the first submitted digest.
+    '''
+
+    def __init__(self, fsdb):
+        self._fsdb = fsdb
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, digest):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="fsdb-verifier")
+                self._thread.daemon = True
+                self._thread.start()
+        self._queue.put(digest)
+
+    def join(self):
+        '''Wait for all the submitted digests to be verified'''
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            digest = self._queue.get()
+            try:
+                if self._fsdb.exists(digest) and not self._fsdb.check(digest, io_class=iohints.BACKGROUND):
+                    # already moved by check() with the auto_quarantine config option
+                    if self._fsdb.exists(digest):
+                        self._fsdb.quarantine(digest)
+            except Exception:
+                logging.getLogger(__name__).exception("verification of [{0}] failed".format(digest))
+            finally:
+                self._queue.task_done()
+
+
+class VerifyingReader(io.RawIOBase):
+    '''Raw read-only file object that verifies the content while it is consumed
+
+       The digest is updated as the caller reads sequentially. When the end
+       of file is reached the digest is compared with the expected one and
+       :py:class:`CorruptedError` is raised on mismatch, after calling
+       `on_corrupted(digest)`, otherwise `on_verified(digest)` is called.
+       Seeking away from the current position disables the verification.
+       :py:func:`Fsdb.open()` returns it wrapped in an ``io.BufferedReader``,
+       like a plain binary file, the reader is its ``raw`` attribute.
+    '''
+
+    def __init__(self, fileobj, digest, algorithm, on_verified=None, chunk_size=None, on_corrupted=None):
+        io.RawIOBase.__init__(self)
+        self._file = fileobj
+        self.digest = digest
+        self._hash = hashtools.new(algorithm, chunk_size)
+        self._pos = fileobj.tell()
+        self._on_verified = on_verified
+        self._on_corrupted = on_corrupted
+        # the hash can only follow reads starting from the beginning of the file
+        self.verifying = self._pos == 0
+        self.verified = False
+
+    def _update(self, data):
+        if self.verifying:
+            self._hash.update(data)
+        self._pos += len(data)
+
+    def _eof(self):
+        if not self.verifying:
+            return
+        self.verifying = False
+        if self._hash.hexdigest() != self.digest:
+            if self._on_corrupted is not None:
+                try:
+                    self._on_corrupted(self.digest)
+                except Exception:
+                    logging.getLogger(__name__).exception("handling corrupted file [{0}] failed".format(self.digest))
+            raise CorruptedError(self.digest, getattr(self._file, 'name', None))
+        self.verified = True
+        if self._on_verified is not None:
+            self._on_verified(self.digest)
+
+    def readinto(self, buf):
+        data = self._file.read(len(buf))
+        self._update(data)
+        if not data and len(buf) > 0:
+            self._eof()
+        buf[:len(data)] = data
+        return len(data)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        self._file.seek(offset, whence)
+        newPos = self._file.tell()
+        if newPos != self._pos:
+            self.verifying = False
+        self._pos = newPos
+        return newPos
+
+    def tell(self):
+        return self._pos
+
+    def close(self):
+        if not self.closed:
+            self._file.close()
+        io.RawIOBase.close(self)
+
+    @property
+    def name(self):
+        return self._file.name
+
+    def fileno(self):
+        return self._file.fileno()
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
@@ -11,6 +11,9 @@ setup(
     name="Fsdb",
     version=__version__,
     packages=['fsdb'],
+    entry_points={
+        'console_scripts': ['fsdb = fsdb.cli:main'],
+    },
 
     author="Ael",
     author_email="tommy.ael@gmail.com",
@@ -0,0 +1,83 @@
+from __future__ import unicode_literals
+
+import io
+import os
+import hashlib
+from . import Fsdb
+from . import FsdbTest
+
+
+class FsdbTestAliases(FsdbTest):
+
+    def setUp(self):
+        super(FsdbTestAliases, self).setUp()
+        self.root = os.path.join(self.fsdb_tmp_path, "aliasRoot")
+        self.fsdb = Fsdb(self.root, alias_algs=['md5', 'sha256'])
+
+    def digests(self, path):
+        with open(path, 'rb') as f:
+            content = f.read()
+        return dict((alg, hashlib.new(alg, content).hexdigest()) for alg in ('sha1', 'md5', 'sha256'))
+
+    def test_add_registers_aliases(self):
+        path = self.createTestFile()
+        digests = self.digests(path)
+        self.assertEqual(self.fsdb.add(path), digests['sha1'])
+        for alg, digest in digests.items():
+            self.assertTrue(self.fsdb.exists(digest))
+            self.assertEqual(self.fsdb.resolve(digest), digests['sha1'])
+            self.assertEqual(self.fsdb.get_file_path(digest), self.fsdb.get_file_path(digests['sha1']))
+            with self.fsdb[digest] as f:
+                self.assertEqual(f.read(), open(path, 'rb').read())
+        self.assertEqual(list(self.fsdb), [digests['sha1']])
+
+    def test_trusted_add_registers_aliases(self):
+        path = self.createTestFile()
+        digests = self.digests(path)
+        with open(path, 'rb') as f:
+            self.fsdb.add(f, digests['sha1'])
+        self.assertTrue(self.fsdb.exists(digests['md5']))
+        self.assertTrue(self.fsdb.exists(digests['sha256']))
+
+    def test_unknown_alias(self):
+        self.fsdb.add(self.createTestFile())
+        self.assertFalse(self.fsdb.exists(hashlib.md5(b"missing").hexdigest()))
+        with self.assertRaises(KeyError):
+            self.fsdb[hashlib.sha256(b"missing").hexdigest()]
+
+    def test_aliases_persist(self):
+        path = self.createTestFile()
+        digests = self.digests(path)
+        with open(path, 'rb') as f:
+            self.fsdb.add(io.BytesIO(f.read()))
+        other = Fsdb(self.root)
+        self.assertEqual(other.resolve(digests['md5']), digests['sha1'])
+
+    def test_removed(self):
+        path = self.createTestFile()
+        digests = self.digests(path)
+        self.fsdb.add(path)
+        self.fsdb.remove(digests['sha1'])
+        self.assertFalse(self.fsdb.exists(digests['md5']))
+        self.fsdb.add(path)
+        self.assertTrue(self.fsdb.exists(digests['md5']))
+
+    def test_config(self):
+        root = os.path.join(self.fsdb_tmp_path, "badRoot")
+        with self.assertRaises(ValueError):
+            Fsdb(root, alias_algs=['sha1'])
+        with self.assertRaises(ValueError):
+            Fsdb(root, alias_algs=['crc32'])
+        with self.assertRaises(TypeError):
+            Fsdb(root, alias_algs='md5')
+
+    def test_remove_by_alias(self):
+        self.fsdb = Fsdb(os.path.join(self.fsdb_tmp_path, "metaRoot"), alias_algs=['md5'],
+                         metadata=True, journal=True)
+        path = self.createTestFile()
+        digests = self.digests(path)
+        self.fsdb.add(path, meta={'tags': ['a']})
+        self.fsdb.remove(digests['md5'])
+        self.assertFalse(self.fsdb.exists(digests['sha1']))
+        self.assertEqual(self.fsdb.get_meta(digests['sha1']), None)
+        self.assertEqual([c[1:] for c in self.fsdb.changes()], [('+', digests['sha1']), ('-', digests['sha1'])])
@@ -0,0 +1,89 @@
+from __future__ import unicode_literals
+
+import io
+import os
+import tarfile
+from . import Fsdb
+from . import FsdbTest
+
+
+class FsdbTestArchive(FsdbTest):
+
+    def setUp(self):
+        super(FsdbTestArchive, self).setUp()
+        self.other = Fsdb(os.path.join(self.fsdb_tmp_path, "otherRoot"))
+
+    def export(self, **kwargs):
+        stream = io.BytesIO()
+        count = self.fsdb.export_archive(stream, **kwargs)
+        stream.seek(0)
+        return count, stream
+
+    def test_roundtrip(self):
+        digests = [self.fsdb.add(self.createTestFile()) for _ in range(10)]
+        count, stream = self.export()
+        self.assertEqual(count, 10)
+        result = self.other.import_archive(stream)
+        self.assertEqual(result, (10, 0, []))
+        self.assertEqual(sorted(self.other), sorted(digests))
+        self.assertFalse(list(self.other.corrupted()))
+
+    def test_traversal_order(self):
+        for _ in range(5):
+            self.fsdb.add(self.createTestFile())
+        count, stream = self.export()
+        with tarfile.open(fileobj=stream, mode='r|') as tar:
+            self.assertEqual([m.name for m in tar], list(self.fsdb))
+
+    def test_export_selected_compressed(self):
+        digests = [self.fsdb.add(self.createTestFile()) for _ in range(4)]
+        count, stream = self.export(digests=digests[:2], compression='gz')
+        self.assertEqual(count, 2)
+        self.assertEqual(self.other.import_archive(stream).imported, 2)
+        self.assertEqual(sorted(self.other), sorted(digests[:2]))
+
+    def test_skip_existing(self):
+        digests = [self.fsdb.add(self.createTestFile()) for _ in range(3)]
+        self.other.add(self.fsdb.get_file_path(digests[0]))
+        count, stream = self.export()
+        self.assertEqual(self.other.import_archive(stream), (2, 1, []))
+
+    def test_import_corrupted(self):
+        good = self.fsdb.add(self.createTestFile())
+        bad = self.fsdb.add(self.createTestFile())
+        with open(self.fsdb.get_file_path(bad), 'ab') as f:
+            f.write(b"garbage")
+        count, stream = self.export()
+        result = self.other.import_archive(stream)
+        self.assertEqual(result, (1, 0, [bad]))
+        self.assertEqual(list(self.other), [good])
+
+    def test_import_stray_members(self):
+        digests = [self.fsdb.add(self.createTestFile()) for _ in range(2)]
+        stream = io.BytesIO()
+        with tarfile.open(fileobj=stream, mode='w') as tar:
+            tar.add(self.fsdb.get_file_path(digests[0]), arcname=digests[0])
+            tar.add(self.createTestFile(), arcname="README")
+            tar.add(self.fsdb.get_file_path(digests[1]), arcname=digests[1])
+        stream.seek(0)
+        self.assertEqual(self.other.import_archive(stream), (2, 1, []))
+        self.assertEqual(sorted(self.other), sorted(digests))
+
+    def test_import_referenced(self):
+        good = self.fsdb.add(self.createTestFile())
+        bad = self.fsdb.add(self.createTestFile())
+        with open(self.fsdb.get_file_path(bad), 'ab') as f:
+            f.write(b"garbage")
+        count, stream = self.export()
+        self.other = Fsdb(os.path.join(self.fsdb_tmp_path, "refRoot"), refcount=True)
+        self.assertEqual(self.other.import_archive(stream), (1, 0, [bad]))
+        self.assertEqual(self.other.refcount(good), 1)
+        self.assertEqual(self.other.refcount(bad), 0)
+        self.other.add(self.fsdb.get_file_path(good))
+        self.other.release(good)
+        self.assertEqual(self.other.gc(), 0)
+        self.assertEqual(list(self.other), [good])
+
+    def test_bad_compression(self):
+        with self.assertRaises(ValueError):
+            self.fsdb.export_archive(io.BytesIO(), compression='rar')
@@ -0,0 +1,109 @@
+from __future__ import unicode_literals
+
+import os
+import time
+from io import BytesIO
+import fsdb.config
+from fsdb.locking import stripe_of
+from . import Fsdb
+from . import FsdbTest
+
+
+class FsdbTestCache(FsdbTest):
+
+    def cache(self, **options):
+        return Fsdb(os.path.join(self.fsdb_tmp_path, "cacheRoot"), **options)
+
+    def add(self, i):
+        return self.fsdb.add(BytesIO(("content %03d" % i).encode('ascii')))
+
+    def test_usage(self):
+        self.fsdb = self.cache(cache_max_objects=100)
+        digests = [self.add(i) for i in range(5)]
+        self.assertEqual(self.fsdb.cache_usage(), (5, 5 * 11))
+        self.fsdb.remove(digests[0])
+        self.assertEqual(self.fsdb.cache_usage(), (4, 4 * 11))
+
+    def test_usage_of_existing_files(self):
+        plain = self.cache()
+        for i in range(3):
+            plain.add(BytesIO(("content %03d" % i).encode('ascii')))
+        # enable the cache mode on an existing fsdb
+        confPath = os.path.join(plain.fsdbRoot, Fsdb.CONFIG_FILE)
+        conf = fsdb.config.loadConf(confPath)
+        conf['cache_max_objects'] = 100
+        fsdb.config.writeConf(confPath, conf)
+        self.fsdb = self.cache()
+        self.assertEqual(self.fsdb.cache_usage(), (3, 3 * 11))
+
+    def test_fifo(self):
+        self.fsdb = self.cache(cache_max_objects=10, cache_policy="fifo")
+        digests = [self.add(i) for i in range(10)]
+        self.fsdb.close()
+        self.assertEqual(len(self.fsdb), 10)
+        self.add(10)
+        self.fsdb.close()
+        self.assertTrue(len(self.fsdb) <= 9)
+        self.assertFalse(digests[0] in self.fsdb)
+        self.assertEqual(self.fsdb.cache_usage()[0], len(self.fsdb))
+
+    def test_lru(self):
+        self.fsdb = self.cache(cache_max_bytes=10 * 11)
+        digests = [self.add(i) for i in range(10)]
+        # make insertion times older than accesses
+        time.sleep(0.01)
+        for d in digests[:5]:
+            self.fsdb[d].close()
+        self.fsdb.flush()
+        self.fsdb.add(BytesIO(b"a bigger content"))
+        self.fsdb.close()
+        for d in digests[:5]:
+            self.assertTrue(d in self.fsdb)
+        self.assertFalse(digests[5] in self.fsdb)
+        self.assertTrue(self.fsdb.cache_usage()[1] <= 10 * 11 * 0.9)
+
+    def test_evict_under_budget(self):
+        self.fsdb = self.cache(cache_max_objects=10)
+        self.add(0)
+        self.assertEqual(self.fsdb.evict(), (0, 0))
+
+    def test_cache_disabled(self):
+        self.assertRaises(ValueError, self.fsdb.cache_usage)
+
+    def test_removed_not_indexed(self):
+        self.fsdb = self.cache(cache_max_objects=100)
+        digest = self.add(0)
+        self.fsdb.remove(digest)
+        cache = self.fsdb._cache
+        self.assertFalse(digest in cache._load(stripe_of(digest)))
+
+    def test_rewrite_evicted_stripes(self):
+        self.fsdb = self.cache(cache_max_objects=20, cache_policy="fifo")
+        digests = [self.add(i) for i in range(20)]
+        self.fsdb.close()
+        index = self.fsdb._cache._index
+        rewritten = []
+        rewrite = index.rewrite
+        index.rewrite = lambda stripe, records: rewritten.append(stripe) or rewrite(stripe, records)
+        self.add(20)
+        self.fsdb.close()
+        evicted = [d for d in digests if d not in self.fsdb]
+        self.assertTrue(evicted)
+        self.assertEqual(sorted(rewritten), sorted(set(stripe_of(d) for d in evicted)))
+        self.assertTrue(len(rewritten) < len(index.stripes()))
+
+    def test_gc(self):
+        self.fsdb = self.cache(cache_max_objects=100, refcount=True)
+        digest = self.add(0)
+        self.fsdb.release(digest)
+        self.assertEqual(self.fsdb.gc(), 1)
+        self.assertEqual(self.fsdb.cache_usage(), (0, 0))
+        self.assertFalse(digest in self.fsdb._cache._load(stripe_of(digest)))
+
+    def test_evict_requested_while_running(self):
+        self.fsdb = self.cache(cache_max_objects=10)
+        for i in range(30):
+            self.add(i)
+        self.fsdb.close()
+        self.assertTrue(len(self.fsdb) <= 10)
+        self.assertEqual(self.fsdb.cache_usage()[0], len(self.fsdb))
@@ -0,0 +1,125 @@
+from __future__ import unicode_literals
+
+import os
+import sys
+import subprocess
+from io import StringIO
+import fsdb.cli
+from . import Fsdb
+from . import FsdbTest
+
+
+class FsdbTestCli(FsdbTest):
+
+    def fsdb_cli(self, *args, **kwargs):
+        cmd = [sys.executable, "-m", "fsdb.cli", "--root", self.fsdb.fsdbRoot] + list(args)
+        proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        stdout, stderr = proc.communicate(kwargs.get('stdin', b''))
+        return proc.returncode, stdout
+
+    def test_add_and_ls(self):
+        paths = [self.createTestFile() for _ in range(3)]
+        code, stdout = self.fsdb_cli("add", "-j", "2", *paths)
+        self.assertEqual(code, 0)
+        added = [line.split(b" ")[0].decode() for line in stdout.splitlines()]
+        self.assertEqual(sorted(added), list(self.fsdb))
+        code, stdout = self.fsdb_cli("ls")
+        self.assertEqual(stdout.decode().split(), list(self.fsdb))
+
+    def test_add_recursive_from_stdin(self):
+        folder = os.path.join(self.fsdb_tmp_path, "folder")
+        os.mkdir(folder)
+        for i in range(3):
+            with open(os.path.join(folder, str(i)), 'w') as f:
+                f.write("content " + str(i))
+        code, stdout = self.fsdb_cli("add", "-r", stdin=folder.encode() + b"\n")
+        self.assertEqual(code, 0)
+        self.assertEqual(len(self.fsdb), 3)
+
+    def test_get(self):
+        path = self.createTestFile()
+        digest = self.fsdb.add(path)
+        code, stdout = self.fsdb_cli("get", digest)
+        with open(path, 'rb') as f:
+            self.assertEqual(stdout, f.read())
+
+    def test_rm(self):
+        digest = self.fsdb.add(self.createTestFile())
+        self.assertEqual(self.fsdb_cli("rm", digest)[0], 0)
+        self.assertFalse(digest in self.fsdb)
+        self.assertEqual(self.fsdb_cli("rm", digest)[0], 1)
+
+    def test_du(self):
+        path = self.createTestFile()
+        self.fsdb.add(path)
+        code, stdout = self.fsdb_cli("du")
+        self.assertEqual(stdout.split()[0].decode(), str(os.path.getsize(path)))
+
+    def test_fsck(self):
+        self.fsdb.add(self.createTestFile())
+        self.assertEqual(self.fsdb_cli("fsck")[0], 0)
+        digest = self.fsdb.add(self.createTestFile())
+        with open(self.fsdb.get_file_path(digest), "w") as f:
+            f.write("more is less, less is more")
+        code, stdout = self.fsdb_cli("fsck", "-j", "2")
+        self.assertEqual(code, 1)
+        self.assertEqual(stdout.decode().split(), [digest])
+        code, stdout = self.fsdb_cli("fsck", "--background")
+        self.assertEqual((code, stdout.decode().split()), (1, [digest]))
+
+    def test_fsck_quarantine_and_repair(self):
+        replica = Fsdb(os.path.join(self.fsdb_tmp_path, "replicaRoot"))
+        path = self.createTestFile()
+        digest = self.fsdb.add(path)
+        replica.add(path)
+        with open(self.fsdb.get_file_path(digest), "w") as f:
+            f.write("more is less, less is more")
+        self.assertEqual(self.fsdb_cli("fsck", "--quarantine")[0], 1)
+        self.assertEqual(list(self.fsdb.quarantined()), [digest])
+        code, stdout = self.fsdb_cli("repair", "--replica", replica.fsdbRoot)
+        self.assertEqual(code, 0)
+        self.assertEqual(stdout.decode().split()[0], digest)
+        self.assertTrue(self.fsdb.check(digest))
+
+    def test_missing_fsdb(self):
+        self.fsdb = Fsdb.__new__(Fsdb)
+        self.fsdb.fsdbRoot = os.path.join(self.fsdb_tmp_path, "missing")
+        self.assertEqual(self.fsdb_cli("ls")[0], 2)
+        self.assertFalse(os.path.exists(self.fsdb.fsdbRoot))
+
+    def test_export_import(self):
+        digests = [self.fsdb.add(self.createTestFile()) for _ in range(3)]
+        code, archive = self.fsdb_cli("export", "-z", "gz")
+        self.assertEqual(code, 0)
+        for digest in digests:
+            self.fsdb.remove(digest)
+        code, stdout = self.fsdb_cli("import", stdin=archive)
+        self.assertEqual(code, 0)
+        self.assertEqual(list(self.fsdb), sorted(digests))
+
+    def test_add_ttl_and_expire(self):
+        code, stdout = self.fsdb_cli("add", "--ttl", "0", self.createTestFile())
+        self.assertEqual(code, 0)
+        code, stdout = self.fsdb_cli("expire")
+        self.assertEqual(stdout.split()[1:], [b"1", b"files", b"expired"])
+        self.assertEqual(len(self.fsdb), 0)
+
+    def test_cache_eviction(self):
+        self.fsdb = Fsdb(os.path.join(self.fsdb_tmp_path, "cacheRoot"), cache_max_objects=10)
+        folder = os.path.join(self.fsdb_tmp_path, "folder")
+        os.mkdir(folder)
+        for i in range(30):
+            with open(os.path.join(folder, str(i)), 'w') as f:
+                f.write("content " + str(i))
+        self.assertEqual(self.fsdb_cli("add", "-r", folder)[0], 0)
+        self.assertTrue(len(self.fsdb) <= 10)
+
+    def test_gc_without_refcount(self):
+        stderr = sys.stderr
+        sys.stderr = StringIO()
+        try:
+            self.assertEqual(fsdb.cli.main(["--root", self.fsdb.fsdbRoot, "gc"]), 1)
+            self.assertTrue(sys.stderr.getvalue().startswith("fsdb: reference counting is not enabled"))
+        finally:
+            sys.stderr = stderr
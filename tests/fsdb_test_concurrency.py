@@ -0,0 +1,108 @@
+from __future__ import unicode_literals
+
+import os
+import errno
+import random
+import hashlib
+import threading
+import multiprocessing
+from io import BytesIO
+from . import Fsdb
+from . import FsdbTest
+
+
+def colliding_payloads(count, prefix="a"):
+    '''Return `count` payloads whose sha1 digests share the first tree level'''
+    payloads = []
+    i = 0
+    while len(payloads) < count:
+        data = ("payload " + str(i)).encode('ascii')
+        if hashlib.sha1(data).hexdigest().startswith(prefix):
+            payloads.append(data)
+        i += 1
+    return payloads
+
+
+def stress_worker(root, payloads, operations, seed, errors):
+    '''Randomly add and remove payloads that live in the same folders'''
+    fsdb = Fsdb(root)
+    rnd = random.Random(seed)
+    for _ in range(operations):
+        data = rnd.choice(payloads)
+        try:
+            if rnd.random() < 0.6:
+                fsdb.add(BytesIO(data))
+            else:
+                fsdb.remove(hashlib.sha1(data).hexdigest())
+        except OSError as e:
+            # removing a file removed by someone else is legit
+            if e.errno != errno.ENOENT:
+                errors.put(repr(e))
+        except Exception as e:
+            errors.put(repr(e))
+
+
+def run_stress(root, processes=8, operations=500, payloads=16, **options):
+    '''Hammer the fsdb in `root` from several processes
+
+       Returns the list of unexpected errors raised by the workers.
+    '''
+    Fsdb(root, depth=3, **options)
+    data = colliding_payloads(payloads)
+    errors = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=stress_worker, args=(root, data, operations, i, errors))
+               for i in range(processes)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    found = []
+    while not errors.empty():
+        found.append(errors.get())
+    return found
+
+
+class FsdbTestConcurrency(FsdbTest):
+
+    def check_store(self, root):
+        fsdb = Fsdb(root)
+        self.assertFalse([d for d in fsdb.corrupted()])
+        for dirpath, dirnames, filenames in os.walk(root):
+            self.assertFalse([f for f in filenames if f.endswith(".tmp")])
+
+    def test_stress_retry(self):
+        root = os.path.join(self.fsdb_tmp_path, "retryRoot")
+        self.assertEqual(run_stress(root, processes=4, operations=300), [])
+        self.check_store(root)
+
+    def test_stress_locking(self):
+        root = os.path.join(self.fsdb_tmp_path, "lockRoot")
+        self.assertEqual(run_stress(root, processes=4, operations=300, locking=True), [])
+        self.check_store(root)
+
+    def test_threads_keep_umask(self):
+        mask = os.umask(0o022)
+        try:
+            threads = [threading.Thread(target=self.fsdb.add, args=(self.createTestFile(),)) for _ in range(8)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            self.assertEqual(os.umask(0o022), 0o022)
+        finally:
+            os.umask(mask)
+
+
+if __name__ == '__main__':
+    import sys
+    import tempfile
+    import shutil
+    tmp = tempfile.mkdtemp(prefix="fsdb_stress")
+    try:
+        procs = int(sys.argv[1]) if len(sys.argv) > 1 else multiprocessing.cpu_count() * 2
+        found = run_stress(os.path.join(tmp, "root"), processes=procs, operations=5000, locking=True)
+        print("{0} processes, {1} errors".format(procs, len(found)))
+        for e in found[:20]:
+            print(e)
+    finally:
+        shutil.rmtree(tmp)
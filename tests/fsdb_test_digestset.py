@@ -0,0 +1,93 @@
+from __future__ import unicode_literals
+
+import os
+import array
+import hashlib
+import binascii
+from fsdb import DigestSet
+from . import Fsdb
+from . import FsdbTest
+
+
+def raw(i):
+    return hashlib.sha1(str(i).encode('ascii')).digest()
+
+
+def hexed(digests):
+    return [binascii.hexlify(d).decode('ascii') for d in digests]
+
+
+class FsdbTestDigestSet(FsdbTest):
+
+    def setUp(self):
+        super(FsdbTestDigestSet, self).setUp()
+        self.digests = sorted(self.fsdb.add(self.createTestFile()) for _ in range(20))
+
+    def path(self, name):
+        return os.path.join(self.fsdb_tmp_path, name)
+
+    def test_raw_digests(self):
+        self.assertEqual(hexed(self.fsdb.raw_digests()), self.digests)
+        self.assertEqual(len(list(self.fsdb.raw_digests(start=self.digests[14]))), 5)
+
+    def test_fill_digests(self):
+        buf = bytearray(20 * 8)
+        self.assertEqual(self.fsdb.fill_digests(buf), 8)
+        last = binascii.hexlify(bytes(buf[-20:])).decode('ascii')
+        self.assertEqual(last, self.digests[7])
+        buf = array.array('B', bytes(20 * 30))
+        self.assertEqual(self.fsdb.fill_digests(buf, start=last), 12)
+        self.assertEqual(binascii.hexlify(buf.tobytes()[:20 * 12]).decode('ascii'), "".join(self.digests[8:]))
+        self.assertEqual(self.fsdb.fill_digests(bytearray(19)), 0)
+
+    def test_write_digest_set(self):
+        with self.fsdb.write_digest_set(self.path("all.set")) as ds:
+            self.assertEqual(len(ds), 20)
+            self.assertEqual(list(ds.hexdigests()), self.digests)
+            for digest in self.digests:
+                self.assertTrue(digest in ds)
+                self.assertTrue(binascii.unhexlify(digest) in ds)
+            self.assertFalse(hashlib.sha1(b"missing").hexdigest() in ds)
+            self.assertFalse("not a digest" in ds)
+            self.assertFalse("z" * 40 in ds)
+
+    def test_set_operations(self):
+        other = Fsdb(self.path("otherRoot"))
+        for digest in self.digests[:10]:
+            other.add(self.fsdb.get_file_path(digest))
+        extra = other.add(self.createTestFile())
+        mine = self.fsdb.write_digest_set(self.path("mine.set"))
+        theirs = other.write_digest_set(self.path("theirs.set"))
+        self.assertEqual(hexed(mine.intersection(theirs)), self.digests[:10])
+        self.assertEqual(hexed(mine.difference(theirs)), self.digests[10:])
+        self.assertEqual(hexed(theirs.difference(mine)), [extra])
+        expected = [('<', d) for d in self.digests[10:]] + [('>', extra)]
+        changes = [(side, hexed([d])[0]) for side, d in mine.diff(other.raw_digests()) if side != '=']
+        self.assertEqual(sorted(changes), sorted(expected))
+
+    def test_binary_search_path(self):
+        small = DigestSet.create(self.path("small.set"), sorted(raw(i) for i in range(0, 3000, 300)), 20)
+        big = DigestSet.create(self.path("big.set"), sorted(raw(i) for i in range(1500)), 20)
+        expected = sorted(raw(i) for i in range(0, 1500, 300))
+        self.assertEqual(list(small.intersection(big)), expected)
+        self.assertEqual(list(big.intersection(small)), expected)
+        self.assertEqual(list(small.difference(big)), sorted(raw(i) for i in range(1500, 3000, 300)))
+
+    def test_create(self):
+        digests = sorted(raw(i) for i in range(10))
+        ds = DigestSet.create(self.path("dup.set"), digests[:5] + digests[4:], 20)
+        self.assertEqual(list(ds), digests)
+        self.assertRaises(ValueError, DigestSet.create, self.path("unsorted.set"), digests[::-1], 20)
+        self.assertRaises(ValueError, DigestSet.create, self.path("short.set"), [b"x"], 20)
+        self.assertFalse(os.path.exists(self.path("unsorted.set")))
+        self.assertFalse(os.path.exists(self.path("unsorted.set.tmp")))
+        self.assertEqual(len(DigestSet.create(self.path("empty.set"), [], 20)), 0)
+
+    def test_invalid_files(self):
+        with open(self.path("garbage"), 'wb') as f:
+            f.write(b"garbage")
+        self.assertRaises(ValueError, DigestSet, self.path("garbage"))
+        DigestSet.create(self.path("valid.set"), [raw(1)], 20).close()
+        with open(self.path("valid.set"), 'ab') as f:
+            f.write(b"x")
+        self.assertRaises(ValueError, DigestSet, self.path("valid.set"))
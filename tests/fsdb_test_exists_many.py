@@ -0,0 +1,29 @@
+from __future__ import unicode_literals
+
+import os
+import hashlib
+from . import Fsdb
+from . import FsdbTest
+
+
+class FsdbTestExistsMany(FsdbTest):
+
+    def test_exists_many(self):
+        stored = set(self.fsdb.add(self.createTestFile()) for _ in range(10))
+        absent = set(hashlib.sha1(str(i).encode()).hexdigest() for i in range(10))
+        self.assertEqual(self.fsdb.exists_many(stored.union(absent)), stored)
+        self.assertEqual(self.fsdb.missing(stored.union(absent)), absent)
+
+    def test_same_folder(self):
+        '''with depth 0 all digests share the same folder'''
+        self.fsdb = Fsdb(os.path.join(self.fsdb_tmp_path, "flatRoot"), depth=0)
+        stored = set(self.fsdb.add(self.createTestFile()) for _ in range(5))
+        absent = hashlib.sha1(b"absent").hexdigest()
+        self.assertEqual(self.fsdb.exists_many(list(stored) + [absent], workers=1), stored)
+
+    def test_empty(self):
+        self.assertEqual(self.fsdb.exists_many([]), set())
+        self.assertEqual(self.fsdb.missing([]), set())
+
+    def test_type_error(self):
+        self.assertRaises(TypeError, self.fsdb.exists_many, [3])
@@ -0,0 +1,83 @@
+from __future__ import unicode_literals
+
+import os
+import time
+from . import Fsdb
+from . import FsdbTest
+
+
+class FsdbTestExpiry(FsdbTest):
+
+    def test_expire(self):
+        path = self.createTestFile()
+        temporary = self.fsdb.add(path, ttl=60)
+        permanent = self.fsdb.add(self.createTestFile())
+        self.assertEqual(self.fsdb.expire(), (0, 0))
+        self.assertEqual(self.fsdb.expire(time.time() + 61), (1, os.path.getsize(path)))
+        self.assertEqual(list(self.fsdb), [permanent])
+        self.assertFalse(os.path.exists(os.path.dirname(self.fsdb.get_file_path(temporary))))
+        self.assertEqual(self.fsdb.expire(time.time() + 3600 * 24), (0, 0))
+
+    def test_only_due_buckets(self):
+        soon = self.fsdb.add(self.createTestFile(), ttl=60)
+        later = self.fsdb.add(self.createTestFile(), ttl=3600 * 5)
+        self.assertEqual(self.fsdb.expire(time.time() + 120)[0], 1)
+        self.assertEqual(list(self.fsdb), [later])
+        self.assertFalse(soon in self.fsdb)
+        self.assertEqual(self.fsdb.expire(time.time() + 3600 * 6)[0], 1)
+
+    def test_postpone_and_cancel(self):
+        path = self.createTestFile()
+        digest = self.fsdb.add(path, ttl=60)
+        self.fsdb.add(path, ttl=30)
+        self.fsdb.add(path, ttl=7200)
+        self.assertTrue(self.fsdb.expires(digest) > time.time() + 7000)
+        self.assertEqual(self.fsdb.expire(time.time() + 120)[0], 0)
+        self.fsdb.add(path)
+        self.assertEqual(self.fsdb.expires(digest), None)
+        self.assertEqual(self.fsdb.expire(time.time() + 3600 * 24)[0], 0)
+        self.assertTrue(digest in self.fsdb)
+
+    def test_readded_without_ttl(self):
+        path = self.createTestFile()
+        digest = self.fsdb.add(path, ttl=60)
+        self.fsdb.remove(digest)
+        self.fsdb.add(path)
+        self.assertEqual(self.fsdb.expires(digest), None)
+        self.assertEqual(self.fsdb.expire(time.time() + 120)[0], 0)
+        self.assertTrue(digest in self.fsdb)
+
+    def test_permanent_readded_with_ttl(self):
+        path = self.createTestFile()
+        digest = self.fsdb.add(path)
+        self.fsdb.add(path, ttl=60)
+        self.assertEqual(self.fsdb.expires(digest), None)
+        self.assertEqual(self.fsdb.expire(time.time() + 120), (0, 0))
+        self.assertTrue(digest in self.fsdb)
+
+    def test_removed_with_ttl(self):
+        path = self.createTestFile()
+        digest = self.fsdb.add(path, ttl=60)
+        self.fsdb.remove(digest)
+        self.assertEqual(self.fsdb.expires(digest), None)
+        # the expiration of the removed file is not inherited
+        self.fsdb.add(path)
+        self.fsdb.add(path, ttl=60)
+        self.assertEqual(self.fsdb.expire(time.time() + 120), (0, 0))
+        self.assertTrue(digest in self.fsdb)
+
+    def test_pinned(self):
+        fsdb = Fsdb(os.path.join(self.fsdb_tmp_path, "refRoot"), refcount=True)
+        digest = fsdb.add(self.createTestFile(), ttl=60)
+        fsdb.pin(digest, "keep")
+        self.assertEqual(fsdb.expire(time.time() + 120)[0], 0)
+        self.assertTrue(digest in fsdb)
+        fsdb.unpin(digest, "keep")
+        self.assertEqual(fsdb.expire(time.time() + 120)[0], 1)
+
+    def test_cache_mode(self):
+        self.fsdb = Fsdb(os.path.join(self.fsdb_tmp_path, "cacheRoot"), cache_max_bytes=10 ** 9)
+        path = self.createTestFile()
+        self.fsdb.add(path, ttl=1)
+        self.assertEqual(self.fsdb.expire(time.time() + 10), (1, os.path.getsize(path)))
+        self.assertEqual(self.fsdb.cache_usage(), (0, 0))
@@ -0,0 +1,34 @@
+from __future__ import unicode_literals
+
+import hashlib
+from . import FsdbTest
+
+
+class FsdbTestGetMany(FsdbTest):
+
+    def test_get_many(self):
+        expected = {}
+        for _ in range(20):
+            path = self.createTestFile()
+            with open(path, 'rb') as f:
+                expected[self.fsdb.add(path)] = f.read()
+        found = {}
+        for digest, f in self.fsdb.get_many(expected, workers=3, in_flight=4):
+            with f:
+                found[digest] = f.read()
+        self.assertEqual(found, expected)
+
+    def test_missing(self):
+        digest = self.fsdb.add(self.createTestFile())
+        missing = hashlib.sha1(b"missing").hexdigest()
+        self.assertRaises(KeyError, list, self.fsdb.get_many([digest, missing]))
+
+    def test_early_stop(self):
+        digests = [self.fsdb.add(self.createTestFile()) for _ in range(10)]
+        items = self.fsdb.get_many(digests, workers=2)
+        digest, f = next(items)
+        f.close()
+        items.close()
+
+    def test_empty(self):
+        self.assertEqual(list(self.fsdb.get_many([])), [])
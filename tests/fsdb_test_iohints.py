@@ -0,0 +1,67 @@
+from __future__ import unicode_literals
+
+import os
+import json
+import unittest
+from io import BytesIO
+from fsdb import iohints
+from . import Fsdb
+from . import FsdbTest
+
+
+@unittest.skipIf(iohints._fadvise is None, "posix_fadvise not available")
+class FsdbTestIOHints(FsdbTest):
+
+    def setUp(self):
+        super(FsdbTestIOHints, self).setUp()
+        self.advices = []
+        self._fadvise = iohints._fadvise
+        iohints._fadvise = lambda fd, offset, length, advice: self.advices.append(advice)
+
+    def tearDown(self):
+        iohints._fadvise = self._fadvise
+        super(FsdbTestIOHints, self).tearDown()
+
+    def test_check(self):
+        digest = self.fsdb.add(self.createTestFile())
+        self.assertEqual(self.advices, [])
+        self.assertTrue(self.fsdb.check(digest))
+        self.assertEqual(self.advices, [])
+        self.assertTrue(self.fsdb.check(digest, io_class="background"))
+        self.assertEqual(self.advices, [os.POSIX_FADV_SEQUENTIAL, os.POSIX_FADV_DONTNEED])
+
+    def test_scrub(self):
+        self.fsdb.add(self.createTestFile())
+        self.assertEqual(list(self.fsdb.scrub(io_class="background")), [])
+        self.assertEqual(self.advices, [os.POSIX_FADV_SEQUENTIAL, os.POSIX_FADV_DONTNEED])
+
+    def test_sync_drop_behind(self):
+        data = os.urandom(iohints.DROP_BEHIND + 10)
+        digest = self.fsdb.add(BytesIO(data))
+        other = Fsdb(os.path.join(self.fsdb_tmp_path, "otherRoot"))
+        self.assertEqual(self.advices, [])
+        self.assertEqual(self.fsdb.sync_to(other, io_class="background").copied, 1)
+        self.assertEqual(self.advices.count(os.POSIX_FADV_SEQUENTIAL), 1)
+        # the source file once, the copy every DROP_BEHIND bytes and at the end
+        self.assertEqual(self.advices.count(os.POSIX_FADV_DONTNEED), 3)
+        with other[digest] as f:
+            self.assertEqual(f.read(), data)
+
+    def test_wrong_io_class(self):
+        digest = self.fsdb.add(self.createTestFile())
+        self.assertRaises(ValueError, self.fsdb.check, digest, io_class="idle")
+        self.assertRaises(TypeError, Fsdb, os.path.join(self.fsdb_tmp_path, "other"), io_class="background")
+
+    def test_old_config_option(self):
+        root = os.path.join(self.fsdb_tmp_path, "oldRoot")
+        Fsdb(root)
+        configPath = os.path.join(root, Fsdb.CONFIG_FILE)
+        with open(configPath) as f:
+            conf = json.load(f)
+        conf['io_class'] = "background"
+        with open(configPath, 'w') as f:
+            json.dump(conf, f)
+        fsdb = Fsdb(root)
+        digest = fsdb.add(self.createTestFile())
+        self.assertEqual(self.advices, [])
+        self.assertTrue(fsdb.check(digest))
@@ -0,0 +1,85 @@
+from __future__ import unicode_literals
+
+import os
+from . import Fsdb
+from . import FsdbTest
+
+
+class FsdbTestJournal(FsdbTest):
+
+    def setUp(self):
+        super(FsdbTestJournal, self).setUp()
+        self.root = os.path.join(self.fsdb_tmp_path, "journalRoot")
+        self.fsdb = Fsdb(self.root, journal=True, journal_batch=4, journal_segment_size=5)
+
+    def test_changes(self):
+        a = self.fsdb.add(self.createTestFile())
+        b = self.fsdb.add(self.createTestFile())
+        self.fsdb.add(self.createTestFile())
+        self.fsdb.remove(a)
+        changes = list(self.fsdb.changes())
+        self.assertEqual([c[0] for c in changes], [1, 2, 3, 4])
+        self.assertEqual(changes[1], (2, '+', b))
+        self.assertEqual(changes[3], (4, '-', a))
+        self.assertEqual(list(self.fsdb.changes(since=3)), [(4, '-', a)])
+        self.assertEqual(self.fsdb.journal_seq(), 4)
+
+    def test_duplicate_not_recorded(self):
+        path = self.createTestFile()
+        self.fsdb.add(path)
+        self.fsdb.add(path)
+        self.assertEqual(len(list(self.fsdb.changes())), 1)
+
+    def test_buffered(self):
+        self.fsdb.add(self.createTestFile())
+        other = Fsdb(self.root)
+        self.assertEqual(list(other.changes()), [])
+        self.fsdb.close()
+        self.assertEqual(len(list(other.changes())), 1)
+
+    def test_shared_sequence(self):
+        other = Fsdb(self.root)
+        with self.fsdb:
+            self.fsdb.add(self.createTestFile())
+        with other:
+            other.add(self.createTestFile())
+        with self.fsdb:
+            self.fsdb.add(self.createTestFile())
+        self.assertEqual([c[0] for c in other.changes()], [1, 2, 3])
+
+    def test_rotation_and_compaction(self):
+        digests = [self.fsdb.add(self.createTestFile()) for _ in range(8)]
+        for d in digests[:4]:
+            self.fsdb.remove(d)
+        self.fsdb.add(self.createTestFile())
+        self.fsdb.flush()
+        self.assertEqual(len(os.listdir(self.fsdb._aux_path("journal"))), 3)
+        before = self.state(self.fsdb.changes())
+        self.assertEqual(self.fsdb.compact_journal(), 2)
+        self.assertEqual(self.state(self.fsdb.changes()), before)
+        self.assertEqual(self.state(self.fsdb.changes(since=6)), self.state(
+            c for c in self.fsdb.changes() if c[0] > 6))
+        self.assertEqual(set(before), set(self.fsdb))
+
+    def test_compaction_while_reading(self):
+        digests = [self.fsdb.add(self.createTestFile()) for _ in range(8)]
+        for d in digests[:4]:
+            self.fsdb.remove(d)
+        self.fsdb.add(self.createTestFile())
+        changes = self.fsdb.changes()
+        first = next(changes)
+        self.fsdb.compact_journal()
+        self.assertEqual([c[0] for c in [first] + list(changes)], list(range(1, 14)))
+
+    def state(self, changes):
+        state = set()
+        for seq, op, digest in changes:
+            if op == '+':
+                state.add(digest)
+            else:
+                state.discard(digest)
+        return state
+
+    def test_journal_disabled(self):
+        plain = Fsdb(os.path.join(self.fsdb_tmp_path, "plainRoot"))
+        self.assertRaises(ValueError, plain.changes)
@@ -0,0 +1,115 @@
+from __future__ import unicode_literals
+
+import io
+import os
+import sqlite3
+import hashlib
+import threading
+from fsdb import CorruptedError
+from . import Fsdb
+from . import FsdbTest
+
+
+class FsdbTestMetadata(FsdbTest):
+
+    def setUp(self):
+        super(FsdbTestMetadata, self).setUp()
+        self.root = os.path.join(self.fsdb_tmp_path, "metaRoot")
+        self.fsdb = Fsdb(self.root, metadata=True)
+
+    def tearDown(self):
+        self.fsdb.close()
+        super(FsdbTestMetadata, self).tearDown()
+
+    def add(self, size, **meta):
+        return self.fsdb.add(io.BytesIO(os.urandom(size)), meta=meta)
+
+    def test_add_with_meta(self):
+        digest = self.add(10, content_type="text/plain", filename="a.txt", tags=["x", "y"], origin="upload")
+        meta = self.fsdb.get_meta(digest)
+        self.assertEqual(meta['size'], 10)
+        self.assertEqual(meta['content_type'], "text/plain")
+        self.assertEqual(meta['filename'], "a.txt")
+        self.assertEqual(meta['tags'], ["x", "y"])
+        self.assertEqual(meta['origin'], "upload")
+        self.assertTrue(meta['created'] > 0)
+        self.assertEqual(self.fsdb.get_meta(self.fsdb.add(self.createTestFile())), None)
+
+    def pipe(self, data):
+        r, w = os.pipe()
+        os.write(w, data)
+        os.close(w)
+        return io.open(r, 'rb', buffering=0)
+
+    def test_add_pipe_with_digest(self):
+        data = b"piped content"
+        digest = hashlib.sha1(data).hexdigest()
+        wrong = hashlib.sha1(b"something else").hexdigest()
+        with self.pipe(data) as pipe:
+            self.assertRaises(CorruptedError, self.fsdb.add, pipe, digest=wrong, meta={'tags': ["x"]})
+        self.assertEqual(self.fsdb.get_meta(wrong), None)
+        with self.pipe(data) as pipe:
+            self.assertEqual(self.fsdb.add(pipe, digest=digest, meta={'tags': ["x"]}), digest)
+        self.assertEqual(self.fsdb.get_meta(digest)['size'], len(data))
+        self.assertEqual(list(self.fsdb), [digest])
+
+    def test_query(self):
+        small = self.add(10, tags=["x"], owner="alice")
+        big = self.add(1000, tags=["x", "y"], owner="bob")
+        other = self.add(2000, tags=["y"], owner="alice")
+        self.assertEqual(list(self.fsdb.query(tags="x")), sorted([small, big]))
+        self.assertEqual(list(self.fsdb.query(tags=["x"], min_size=100)), [big])
+        self.assertEqual(list(self.fsdb.query(tags=["x", "y"])), [big])
+        self.assertEqual(list(self.fsdb.query(owner="alice")), sorted([small, other]))
+        self.assertEqual(list(self.fsdb.query(max_size=1000)), sorted([small, big]))
+        self.assertEqual(list(self.fsdb.query(tags=["z"])), [])
+
+    def test_set_meta_many(self):
+        digests = [self.fsdb.add(self.createTestFile()) for _ in range(3)]
+        self.fsdb.set_meta_many((d, {'tags': ["batch"]}) for d in digests)
+        self.assertEqual(list(self.fsdb.query(tags=["batch"])), sorted(digests))
+        self.fsdb.set_meta(digests[0], {'owner': "carol"})
+        self.assertEqual(self.fsdb.get_meta(digests[0])['tags'], ["batch"])
+        self.fsdb.set_meta(digests[0], {'tags': []})
+        self.assertEqual(list(self.fsdb.query(tags=["batch"])), sorted(digests[1:]))
+        with self.assertRaises(KeyError):
+            self.fsdb.set_meta("0" * 40, {})
+
+    def test_remove_cleans_up(self):
+        digest = self.add(10, tags=["x"])
+        self.fsdb.remove(digest)
+        self.assertEqual(self.fsdb.get_meta(digest), None)
+        self.assertEqual(list(self.fsdb.query(tags=["x"])), [])
+
+    def test_failed_meta_discards_file(self):
+        with self.assertRaises(TypeError):
+            self.add(10, tags="not a list")
+        self.assertEqual(len(self.fsdb), 0)
+
+    def test_failed_meta_keeps_concurrent_file(self):
+        path = self.createTestFile()
+        digest = Fsdb(self.root).add(path)
+        # as if the file was stored by another process right after the existence check
+        self.fsdb.exists = lambda digest: False
+        try:
+            with self.assertRaises(TypeError):
+                self.fsdb.add(path, meta={'tags': "not a list"})
+        finally:
+            del self.fsdb.exists
+        self.assertEqual(list(self.fsdb), [digest])
+
+    def test_close_all_connections(self):
+        digest = self.add(10, owner="alice")
+        thread = threading.Thread(target=self.fsdb.get_meta, args=(digest,))
+        thread.start()
+        thread.join()
+        connections = list(self.fsdb._meta._connections)
+        self.assertEqual(len(connections), 2)
+        self.fsdb.close()
+        for conn in connections:
+            self.assertRaises(sqlite3.ProgrammingError, conn.execute, "SELECT 1")
+        self.assertEqual(self.fsdb.get_meta(digest)['owner'], "alice")
+
+    def test_disabled(self):
+        with self.assertRaises(ValueError):
+            Fsdb(os.path.join(self.fsdb_tmp_path, "plain")).add(self.createTestFile(), meta={})
@@ -0,0 +1,86 @@
+from __future__ import unicode_literals
+
+import os
+import hashlib
+from fsdb import CorruptedError
+from . import Fsdb
+from . import FsdbTest
+
+
+class FsdbTestRefcount(FsdbTest):
+
+    def setUp(self):
+        super(FsdbTestRefcount, self).setUp()
+        self.fsdb = Fsdb(os.path.join(self.fsdb_tmp_path, "refRoot"), refcount=True)
+
+    def test_add_increments(self):
+        path = self.createTestFile()
+        digest = self.fsdb.add(path)
+        self.fsdb.add(path)
+        self.assertEqual(self.fsdb.refcount(digest), 2)
+
+    def test_gc_collects_released(self):
+        path = self.createTestFile()
+        digest = self.fsdb.add(path)
+        self.fsdb.add(path)
+        other = self.fsdb.add(self.createTestFile())
+        self.fsdb.release(digest)
+        self.assertEqual(self.fsdb.gc(), 0)
+        self.fsdb.release(digest)
+        self.assertTrue(digest in self.fsdb)
+        self.assertEqual(self.fsdb.gc(), 1)
+        self.assertEqual(list(self.fsdb), [other])
+        self.assertEqual(self.fsdb.refcount(digest), 0)
+
+    def test_pin(self):
+        digest = self.fsdb.add(self.createTestFile())
+        self.fsdb.pin(digest, "backup")
+        self.fsdb.release(digest)
+        self.assertEqual(self.fsdb.gc(), 0)
+        self.assertEqual(self.fsdb.pins(digest), set(["backup"]))
+        self.fsdb.unpin(digest, "backup")
+        self.assertEqual(self.fsdb.gc(), 1)
+        self.assertFalse(digest in self.fsdb)
+
+    def test_readd_after_gc(self):
+        path = self.createTestFile()
+        digest = self.fsdb.add(path)
+        self.fsdb.release(digest)
+        self.fsdb.gc()
+        self.fsdb.add(path)
+        self.assertEqual(self.fsdb.refcount(digest), 1)
+        self.assertTrue(self.fsdb.check(digest))
+
+    def test_not_listed(self):
+        digest = self.fsdb.add(self.createTestFile())
+        self.assertEqual(list(self.fsdb), [digest])
+
+    def test_failed_add_not_referenced(self):
+        digest = hashlib.sha1(b"something else").hexdigest()
+        self.assertRaises(CorruptedError, self.fsdb.add, self.createTestFile(), digest)
+        self.assertEqual(self.fsdb.refcount(digest), 0)
+
+    def test_shared_counts(self):
+        path = self.createTestFile()
+        digest = self.fsdb.add(path)
+        self.assertEqual(self.fsdb.refcount(digest), 1)
+        other = Fsdb(self.fsdb.fsdbRoot)
+        other.add(path)
+        other.pin(digest, "backup")
+        self.assertEqual(self.fsdb.refcount(digest), 2)
+        self.assertEqual(self.fsdb.pins(digest), set(["backup"]))
+
+    def test_release_missing(self):
+        self.assertRaises(KeyError, self.fsdb.release, "0" * 40)
+
+    def test_wrong_pin_name(self):
+        digest = self.fsdb.add(self.createTestFile())
+        self.assertRaises(ValueError, self.fsdb.pin, digest, "two words")
+
+    def test_refcount_disabled(self):
+        digest = self.fsdb.add(self.createTestFile())
+        plain = Fsdb(os.path.join(self.fsdb_tmp_path, "plainRoot"))
+        self.assertRaises(ValueError, plain.release, digest)
+
+    def test_unexpected_option(self):
+        self.assertRaises(TypeError, Fsdb, os.path.join(self.fsdb_tmp_path, "other"), refcnt=True)
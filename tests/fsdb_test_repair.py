@@ -0,0 +1,102 @@
+from __future__ import unicode_literals
+
+import os
+from fsdb import CorruptedError
+from . import Fsdb
+from . import FsdbTest
+
+
+class FsdbTestRepair(FsdbTest):
+
+    def setUp(self):
+        super(FsdbTestRepair, self).setUp()
+        self.replicaRoot = os.path.join(self.fsdb_tmp_path, "replicaRoot")
+        self.replica = Fsdb(self.replicaRoot)
+
+    def corrupt(self, fsdb, digest):
+        with open(fsdb.get_file_path(digest), 'w') as f:
+            f.write("more is less, less is more")
+
+    def add_both(self, path=None):
+        path = path or self.createTestFile()
+        digest = self.fsdb.add(path)
+        self.replica.add(path)
+        return digest
+
+    def test_quarantine(self):
+        digest = self.fsdb.add(self.createTestFile())
+        path = self.fsdb.get_file_path(digest)
+        self.fsdb.quarantine(digest)
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(digest in self.fsdb)
+        self.assertTrue(self.fsdb.is_quarantined(digest))
+        self.assertEqual(list(self.fsdb.quarantined()), [digest])
+        self.assertEqual(list(self.fsdb), [])
+        # reads fail fast instead of returning bad bytes
+        self.assertRaises(CorruptedError, self.fsdb.open, digest)
+        self.assertRaises(KeyError, self.fsdb.open, self.replica.add(self.createTestFile()))
+        self.assertFalse(self.fsdb.is_quarantined("../" + digest[3:]))
+
+    def test_auto_quarantine(self):
+        self.fsdb = Fsdb(os.path.join(self.fsdb_tmp_path, "autoRoot"), auto_quarantine=True)
+        digests = [self.fsdb.add(self.createTestFile()) for _ in range(3)]
+        self.corrupt(self.fsdb, digests[0])
+        self.assertEqual(list(self.fsdb.corrupted()), [digests[0]])
+        self.assertEqual(list(self.fsdb.quarantined()), [digests[0]])
+        self.assertEqual(list(self.fsdb), sorted(digests[1:]))
+
+        self.corrupt(self.fsdb, digests[1])
+        with self.assertRaises(CorruptedError):
+            with self.fsdb.open(digests[1], verify=True) as f:
+                f.read()
+        self.assertTrue(self.fsdb.is_quarantined(digests[1]))
+
+    def test_repair(self):
+        paths = [self.createTestFile() for _ in range(4)]
+        digests = [self.add_both(path) for path in paths]
+        for digest in digests[:3]:
+            self.corrupt(self.fsdb, digest)
+            self.fsdb.quarantine(digest)
+        # corrupted in the replica too
+        self.corrupt(self.replica, digests[2])
+        reports = []
+        result = self.fsdb.repair(replicas=[self.replicaRoot], callback=lambda d, s: reports.append((d, s)))
+        self.assertEqual(result.repaired, sorted(digests[:2]))
+        self.assertEqual(result.failed, [digests[2]])
+        self.assertEqual(sorted(reports), sorted([(d, self.replicaRoot) for d in digests[:2]] + [(digests[2], None)]))
+        for digest in digests[:2] + digests[3:]:
+            self.assertTrue(self.fsdb.check(digest))
+        self.assertEqual(list(self.fsdb.quarantined()), [digests[2]])
+
+        # restored from a second, intact replica
+        other = Fsdb(os.path.join(self.fsdb_tmp_path, "otherRoot"))
+        other.add(paths[2])
+        reports = []
+        result = self.fsdb.repair(replicas=[self.replica, other], callback=lambda d, s: reports.append((d, s)))
+        self.assertEqual(result, ([digests[2]], []))
+        self.assertEqual(reports, [(digests[2], other.fsdbRoot)])
+        self.assertTrue(self.fsdb.check(digests[2]))
+
+    def test_repair_from_config(self):
+        self.fsdb = Fsdb(os.path.join(self.fsdb_tmp_path, "configRoot"),
+                         replicas=[os.path.join(self.fsdb_tmp_path, "missing"), self.replicaRoot])
+        digest = self.add_both()
+        self.corrupt(self.fsdb, digest)
+        self.fsdb.quarantine(digest)
+        self.assertEqual(self.fsdb.repair(workers=2).repaired, [digest])
+        self.assertTrue(self.fsdb.check(digest))
+        self.assertFalse(os.path.exists(os.path.join(self.fsdb_tmp_path, "missing")))
+
+    def test_repair_added_again(self):
+        path = self.createTestFile()
+        digest = self.fsdb.add(path)
+        self.fsdb.quarantine(digest)
+        self.fsdb.add(path)
+        self.assertEqual(self.fsdb.repair(replicas=[]).repaired, [digest])
+        self.assertEqual(list(self.fsdb.quarantined()), [])
+
+    def test_incompatible_replica(self):
+        replica = Fsdb(os.path.join(self.fsdb_tmp_path, "md5Root"), hash_alg="md5")
+        digest = self.fsdb.add(self.createTestFile())
+        self.fsdb.quarantine(digest)
+        self.assertEqual(self.fsdb.repair(replicas=[replica]).failed, [digest])
@@ -0,0 +1,76 @@
+from __future__ import unicode_literals
+
+import os
+from fsdb.locking import stripe_of
+from . import FsdbTest
+
+
+class FsdbTestScrub(FsdbTest):
+
+    def corrupt(self, digest):
+        with open(self.fsdb.get_file_path(digest), "w") as f:
+            f.write("more is less, less is more")
+
+    def checked(self, **kwargs):
+        '''Return the digests checked by a scrub run'''
+        checked = []
+        check = self.fsdb.check
+        self.fsdb.check = lambda digest, **kwargs: checked.append(digest) or check(digest, **kwargs)
+        try:
+            list(self.fsdb.scrub(**kwargs))
+        finally:
+            del self.fsdb.check
+        return checked
+
+    def test_scrub_finds_corrupted(self):
+        self.fsdb.add(self.createTestFile())
+        digest = self.fsdb.add(self.createTestFile())
+        self.corrupt(digest)
+        self.assertEqual(list(self.fsdb.scrub()), [digest])
+
+    def test_skip_verified(self):
+        digests = [self.fsdb.add(self.createTestFile()) for _ in range(4)]
+        self.assertEqual(sorted(self.checked()), sorted(digests))
+        self.assertEqual(self.checked(), [])
+        self.assertEqual(sorted(self.checked(window=0)), sorted(digests))
+
+    def test_modified_file_is_checked(self):
+        digest = self.fsdb.add(self.createTestFile())
+        self.fsdb.check(digest)
+        self.corrupt(digest)
+        self.assertEqual(list(self.fsdb.scrub()), [digest])
+
+    def test_recorded_checks(self):
+        digest = self.fsdb.add(self.createTestFile())
+        other = self.fsdb.add(self.createTestFile())
+        with self.fsdb.open(digest, verify=True) as f:
+            f.read()
+        self.fsdb.check(other)
+        # plain checks have no side effects, complete verified reads are recorded
+        self.assertEqual(self.checked(), [other])
+        self.fsdb.check(other, record=True)
+        self.assertEqual(self.checked(), [])
+
+    def test_read_marks_sampled(self):
+        digest = self.fsdb.add(self.createTestFile())
+        for _ in range(3):
+            with self.fsdb.open(digest, verify=True) as f:
+                f.read()
+        self.assertEqual(self.fsdb._scrub_markers.load(stripe_of(digest))[1], 1)
+
+    def test_read_only_markers(self):
+        digest = self.fsdb.add(self.createTestFile())
+        # markers cannot be written, like on a read-only store
+        log = self.fsdb._scrub_markers._log
+        log._ready = True
+        log._path = lambda stripe: os.path.join(self.fsdb_tmp_path, "missing", stripe)
+        with self.fsdb.open(digest, verify=True) as f:
+            f.read()
+        self.assertTrue(self.fsdb.check(digest, record=True))
+
+    def test_budget_prioritizes_never_verified(self):
+        digests = [self.fsdb.add(self.createTestFile()) for _ in range(4)]
+        for d in digests[:3]:
+            self.fsdb.check(d, record=True)
+        size = os.path.getsize(self.fsdb.get_file_path(digests[0]))
+        self.assertEqual(self.checked(window=0, max_bytes=size), [digests[3]])
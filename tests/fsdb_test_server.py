@@ -0,0 +1,108 @@
+from __future__ import unicode_literals
+
+import io
+import os
+import hashlib
+import threading
+from fsdb.server import FsdbServer
+from . import FsdbTest
+
+try:
+    from http.client import HTTPConnection
+except ImportError:
+    from httplib import HTTPConnection
+
+
+class FsdbTestServer(FsdbTest):
+
+    def setUp(self):
+        super(FsdbTestServer, self).setUp()
+        self.server = FsdbServer(("127.0.0.1", 0), self.fsdb, workers=2)
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(0.05,))
+        self.thread.daemon = True
+        self.thread.start()
+        self.conn = HTTPConnection("127.0.0.1", self.server.server_address[1], timeout=10)
+
+    def tearDown(self):
+        self.conn.close()
+        self.server.shutdown()
+        self.server.server_close()
+        super(FsdbTestServer, self).tearDown()
+
+    def request(self, method, path, body=None, headers={}, **kwargs):
+        self.conn.request(method, path, body, headers, **kwargs)
+        response = self.conn.getresponse()
+        return response.status, response.getheaders(), response.read()
+
+    def test_get(self):
+        content = os.urandom(1000)
+        digest = self.fsdb.add(io.BytesIO(content))
+        status, headers, body = self.request("GET", "/" + digest)
+        self.assertEqual(status, 200)
+        self.assertEqual(body, content)
+        headers = dict((k.lower(), v) for k, v in headers)
+        self.assertEqual(headers['etag'], '"{0}"'.format(digest))
+        self.assertTrue("immutable" in headers['cache-control'])
+        # same keep-alive connection
+        status, headers, body = self.request("GET", "/" + digest, headers={'If-None-Match': '"{0}"'.format(digest)})
+        self.assertEqual((status, body), (304, b""))
+
+    def test_range(self):
+        content = os.urandom(1000)
+        digest = self.fsdb.add(io.BytesIO(content))
+        status, headers, body = self.request("GET", "/" + digest, headers={'Range': 'bytes=10-19'})
+        self.assertEqual((status, body), (206, content[10:20]))
+        self.assertTrue(("Content-Range", "bytes 10-19/1000") in headers)
+        status, headers, body = self.request("GET", "/" + digest, headers={'Range': 'bytes=-5'})
+        self.assertEqual((status, body), (206, content[-5:]))
+        status, headers, body = self.request("GET", "/" + digest, headers={'Range': 'bytes=2000-'})
+        self.assertEqual(status, 416)
+
+    def test_head_and_missing(self):
+        digest = self.fsdb.add(io.BytesIO(b"content"))
+        status, headers, body = self.request("HEAD", "/" + digest)
+        self.assertEqual((status, body), (200, b""))
+        self.assertTrue(("Content-Length", "7") in headers)
+        self.assertEqual(self.request("HEAD", "/" + "0" * 40)[0], 404)
+        self.assertEqual(self.request("GET", "/../../etc/passwd")[0], 404)
+
+    def test_post(self):
+        content = os.urandom(5000)
+        status, headers, body = self.request("POST", "/", content)
+        digest = hashlib.sha1(content).hexdigest()
+        self.assertEqual((status, body), (201, (digest + "\n").encode()))
+        self.assertEqual(list(self.fsdb), [digest])
+        self.assertFalse(os.listdir(self.fsdb._aux_path("staging")))
+        self.assertEqual(self.request("POST", "/", content)[0], 201)
+        self.assertEqual(len(self.fsdb), 1)
+
+    def test_put_verified(self):
+        content = os.urandom(5000)
+        digest = hashlib.sha1(content).hexdigest()
+        self.assertEqual(self.request("PUT", "/" + digest, content)[0], 201)
+        self.assertEqual(self.request("PUT", "/" + digest, content)[0], 200)
+        other = hashlib.sha1(b"other").hexdigest()
+        self.assertEqual(self.request("PUT", "/" + other, content)[0], 422)
+        self.assertFalse(other in self.fsdb)
+
+    def test_put_chunked(self):
+        content = os.urandom(3000)
+
+        def chunks():
+            for i in range(0, len(content), 1000):
+                yield content[i:i + 1000]
+        status, headers, body = self.request("PUT", "/", chunks(), {'Transfer-Encoding': 'chunked'},
+                                             encode_chunked=True)
+        self.assertEqual(status, 201)
+        self.assertTrue(hashlib.sha1(content).hexdigest() in self.fsdb)
+
+    def test_post_not_root(self):
+        digest = self.fsdb.add(io.BytesIO(b"content"))
+        self.assertEqual(self.request("POST", "/" + digest, b"GET /x HTTP/1.1\r\n\r\n")[0], 405)
+        # the body is not parsed as a request on the same connection
+        self.assertEqual(self.request("GET", "/" + digest)[2], b"content")
+
+    def test_quarantined(self):
+        digest = self.fsdb.add(io.BytesIO(b"content"))
+        self.fsdb.quarantine(digest)
+        self.assertEqual(self.request("GET", "/" + digest)[0], 503)
@@ -47,3 +47,19 @@ class FsdbTestSingleOperations(FsdbTest):
     def test_contains_empty(self):
         digest = self.fsdb.add(self.createTestFile())
         self.assertTrue(digest in self.fsdb)
+
+    def test_malformed_digests(self):
+        digest = self.fsdb.add(self.createTestFile())
+        for malformed in (digest.upper(), digest[:-1], digest + "0", "../" + digest[3:], ""):
+            self.assertFalse(self.fsdb.exists(malformed))
+            self.assertRaises(ValueError, self.fsdb.get_file_path, malformed)
+            with self.assertRaises(OSError) as cm:
+                self.fsdb.remove(malformed)
+            self.assertEqual(cm.exception.errno, errno.ENOENT)
+        self.assertEqual(self.fsdb.exists_many([digest, digest.upper()]), set([digest]))
+        self.assertTrue(self.fsdb.exists(digest))
+
+    def test_get_file_paths(self):
+        digests = [self.fsdb.add(self.createTestFile()) for _ in range(3)]
+        self.assertEqual(self.fsdb.get_file_paths(digests), [self.fsdb.get_file_path(d) for d in digests])
+        self.assertRaises(ValueError, self.fsdb.get_file_paths, digests + ["xyz"])
@@ -0,0 +1,110 @@
+from __future__ import unicode_literals
+
+import os
+import time
+from io import BytesIO
+from . import Fsdb
+from . import FsdbTest
+
+
+class FsdbTestSnapshots(FsdbTest):
+
+    def journaled(self, **options):
+        return Fsdb(os.path.join(self.fsdb_tmp_path, "journalRoot"), journal=True, **options)
+
+    def test_snapshot_without_journal(self):
+        digests = [self.fsdb.add(self.createTestFile()) for _ in range(20)]
+        name = self.fsdb.snapshot(workers=4)
+        self.assertEqual(self.fsdb.snapshots(), [name])
+        info = self.fsdb.snapshot_info(name)
+        self.assertEqual(info['count'], 20)
+        self.assertEqual(info['journal_seq'], None)
+        with self.fsdb.open_snapshot(name) as snap:
+            self.assertEqual(list(snap.hexdigests()), sorted(digests))
+        # private files are not listed as stored files
+        self.assertEqual(list(self.fsdb), sorted(digests))
+
+    def test_snapshot_from_journal(self):
+        self.fsdb = self.journaled()
+        digests = [self.fsdb.add(self.createTestFile()) for _ in range(5)]
+        self.fsdb.snapshot("first")
+        self.fsdb.remove(digests[0])
+        added = self.fsdb.add(self.createTestFile())
+        # added and removed between the two snapshots
+        self.fsdb.remove(self.fsdb.add(self.createTestFile()))
+        self.fsdb.flush()
+        self.fsdb.snapshot("second")
+        expected = sorted(digests[1:] + [added])
+        with self.fsdb.open_snapshot("second") as snap:
+            self.assertEqual(list(snap.hexdigests()), expected)
+        self.assertGreater(self.fsdb.snapshot_info("second")['journal_seq'],
+                           self.fsdb.snapshot_info("first")['journal_seq'])
+        self.assertEqual(list(self.fsdb.snapshot_diff("first", "second")),
+                         sorted([('-', digests[0]), ('+', added)], key=lambda change: change[1]))
+        self.assertEqual(list(self.fsdb.snapshot_diff("second", "second")), [])
+
+    def test_default_names(self):
+        names = [self.fsdb.snapshot() for _ in range(3)]
+        self.assertEqual(self.fsdb.snapshots(), names)
+        created = self.fsdb.snapshot_info(names[0])['created']
+        microseconds = int(created % 1 * 1000000)
+        self.assertEqual(names[0], time.strftime("%Y%m%dT%H%M%S.", time.gmtime(created)) + "%06dZ" % microseconds)
+
+    def test_create_race(self):
+        # the json file of a snapshot being created by someone else
+        os.makedirs(self.fsdb._aux_path("snapshots"))
+        open(self.fsdb._aux_path("snapshots", "backup.json.tmp"), 'w').close()
+        self.assertRaises(ValueError, self.fsdb.snapshot, "backup")
+        self.assertEqual(self.fsdb.snapshots(), [])
+
+    def test_snapshots_loaded_once(self):
+        self.fsdb = self.journaled(refcount=True)
+        for _ in range(5):
+            self.fsdb.release(self.fsdb.add(self.createTestFile()))
+        self.fsdb.snapshot("backup")
+        live = self.fsdb._snapshots.live
+        loads = []
+        self.fsdb._snapshots.live = lambda: loads.append(1) or live()
+        self.assertEqual(self.fsdb.gc(), 0)
+        self.assertEqual(len(loads), 1)
+
+    def test_hold_back_gc(self):
+        self.fsdb = self.journaled(refcount=True)
+        digest = self.fsdb.add(self.createTestFile())
+        other = self.fsdb.add(self.createTestFile())
+        self.fsdb.snapshot("backup")
+        self.fsdb.release(digest)
+        self.fsdb.release(other)
+        self.assertEqual(self.fsdb.gc(), 0)
+        self.assertTrue(digest in self.fsdb)
+        self.fsdb.release_snapshot("backup")
+        self.assertEqual(self.fsdb.gc(), 2)
+        self.assertEqual(list(self.fsdb), [])
+
+    def test_hold_back_expire(self):
+        digest = self.fsdb.add(self.createTestFile(), ttl=60)
+        self.fsdb.snapshot("backup")
+        self.assertEqual(self.fsdb.expire(time.time() + 61), (0, 0))
+        self.assertTrue(digest in self.fsdb)
+        self.fsdb.release_snapshot("backup")
+        self.assertEqual(self.fsdb.expire(time.time() + 61)[0], 1)
+
+    def test_hold_back_eviction(self):
+        self.fsdb = Fsdb(os.path.join(self.fsdb_tmp_path, "cacheRoot"), cache_max_objects=10, cache_policy="fifo")
+        digests = [self.fsdb.add(BytesIO("content {0}".format(i).encode('ascii'))) for i in range(10)]
+        self.fsdb.snapshot("backup")
+        self.fsdb.add(BytesIO(b"one more"))
+        self.fsdb.close()
+        for digest in digests:
+            self.assertTrue(digest in self.fsdb)
+
+    def test_invalid_snapshots(self):
+        self.fsdb.snapshot("backup")
+        self.assertRaises(ValueError, self.fsdb.snapshot, "backup")
+        self.assertRaises(ValueError, self.fsdb.snapshot, "../backup")
+        self.assertRaises(ValueError, self.fsdb.snapshot, ".hidden")
+        self.assertRaises(KeyError, self.fsdb.snapshot_info, "missing")
+        self.assertRaises(KeyError, self.fsdb.open_snapshot, "missing")
+        self.assertRaises(KeyError, self.fsdb.release_snapshot, "missing")
+        self.fsdb.release_snapshot("backup")
+        self.assertEqual(self.fsdb.snapshots(), [])
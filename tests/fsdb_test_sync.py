@@ -0,0 +1,85 @@
+from __future__ import unicode_literals
+
+import os
+from fsdb import sync
+from . import Fsdb
+from . import FsdbTest
+
+
+class FsdbTestSync(FsdbTest):
+
+    def setUp(self):
+        super(FsdbTestSync, self).setUp()
+        self.other = Fsdb(os.path.join(self.fsdb_tmp_path, "otherRoot"))
+
+    def test_iter_sorted(self):
+        for _ in range(10):
+            self.fsdb.add(self.createTestFile())
+        digests = list(self.fsdb)
+        self.assertEqual(digests, sorted(digests))
+
+    def test_diff(self):
+        common = self.createTestFile()
+        self.fsdb.add(common)
+        self.other.add(common)
+        mine = self.fsdb.add(self.createTestFile())
+        theirs = self.other.add(self.createTestFile())
+        self.assertEqual(sorted(self.fsdb.diff(self.other)), [('<', mine), ('>', theirs)])
+
+    def test_diff_empty(self):
+        self.assertEqual(list(self.fsdb.diff(self.other)), [])
+
+    def test_sync_to(self):
+        digests = set(self.fsdb.add(self.createTestFile()) for _ in range(10))
+        theirs = self.other.add(self.createTestFile())
+        self.assertEqual(self.fsdb.sync_to(self.other, verify=True), (10, []))
+        self.assertEqual(set(self.other), digests.union([theirs]))
+        self.assertFalse([d for d in self.other.corrupted()])
+        self.assertEqual(self.fsdb.sync_to(self.other), (0, []))
+
+    def test_sync_to_checkpoint(self):
+        digests = sorted(self.fsdb.add(self.createTestFile()) for _ in range(6))
+        checkpoint = os.path.join(self.fsdb_tmp_path, "checkpoint")
+        with open(checkpoint, 'w') as f:
+            f.write(digests[2])
+        # digests up to the checkpoint are considered already synced
+        self.assertEqual(self.fsdb.sync_to(self.other, checkpoint=checkpoint).copied, 3)
+        self.assertEqual(list(self.other), digests[3:])
+        self.assertFalse(os.path.exists(checkpoint))
+
+    def test_sync_to_corrupted(self):
+        digests = sorted(self.fsdb.add(self.createTestFile()) for _ in range(3))
+        with open(self.fsdb.get_file_path(digests[1]), 'w') as f:
+            f.write("more is less, less is more")
+        self.assertEqual(self.fsdb.sync_to(self.other, verify=True), (2, [digests[1]]))
+        self.assertEqual(list(self.other), [digests[0], digests[2]])
+
+    def test_sync_to_bookkeeping(self):
+        other = Fsdb(os.path.join(self.fsdb_tmp_path, "refRoot"), refcount=True, journal=True)
+        digest = self.fsdb.add(self.createTestFile())
+        self.fsdb.sync_to(other)
+        self.assertEqual(other.refcount(digest), 1)
+        self.assertEqual([c[1:] for c in other.changes()], [('+', digest)])
+
+    def test_checkpoint_interval(self):
+        digests = sorted(self.fsdb.add(self.createTestFile()) for _ in range(3))
+        for digest in digests:
+            with open(self.fsdb.get_file_path(digest), 'w') as f:
+                f.write("more is less, less is more")
+        checkpoint = os.path.join(self.fsdb_tmp_path, "checkpoint")
+        written = []
+        writeCheckpoint = sync._write_checkpoint
+        sync._write_checkpoint = lambda path, digest: written.append(digest) or writeCheckpoint(path, digest)
+        interval = sync.CHECKPOINT_INTERVAL
+        sync.CHECKPOINT_INTERVAL = 2
+        try:
+            self.assertEqual(self.fsdb.sync_to(self.other, verify=True, checkpoint=checkpoint), (0, digests))
+        finally:
+            sync._write_checkpoint = writeCheckpoint
+            sync.CHECKPOINT_INTERVAL = interval
+        # nothing copied, still written every 2 files
+        self.assertEqual(written, [digests[1]])
+
+    def test_sync_to_different_algorithm(self):
+        other = Fsdb(os.path.join(self.fsdb_tmp_path, "sha256Root"), hash_alg="sha256")
+        self.assertRaises(ValueError, self.fsdb.sync_to, other)
@@ -0,0 +1,71 @@
+from __future__ import unicode_literals
+
+import io
+import os
+import hashlib
+from fsdb import hashtools
+from . import Fsdb
+from . import FsdbTest
+
+
+def reference_tree(content, chunk_size):
+    '''Straightforward sequential Merkle root used as reference'''
+    chunks = [content[i:i + chunk_size] for i in range(0, len(content), chunk_size)] or [b""]
+    level = [hashlib.sha256(b"\x00" + c).digest() for c in chunks]
+    while len(level) > 1:
+        pairs = [hashlib.sha256(b"\x01" + level[i] + level[i + 1]).digest() for i in range(0, len(level) - 1, 2)]
+        level = pairs + level[len(pairs) * 2:]
+    return level[0]
+
+
+class FsdbTestTreeHash(FsdbTest):
+
+    CHUNK = 1024
+
+    def setUp(self):
+        super(FsdbTestTreeHash, self).setUp()
+        self.root = os.path.join(self.fsdb_tmp_path, "treeRoot")
+        self.fsdb = Fsdb(self.root, hash_alg="sha256-tree", tree_chunk_size=self.CHUNK)
+
+    def createFile(self, size):
+        path = self.createTestFile()
+        content = os.urandom(size)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path, content
+
+    def test_streaming_and_parallel_agree(self):
+        for size in (0, 1, self.CHUNK, self.CHUNK * 5 + 7):
+            path, content = self.createFile(size)
+            expected = reference_tree(content, self.CHUNK)
+            parallel = hashtools.calc_file_digest(path, "sha256-tree", chunk_size=self.CHUNK, workers=3)
+            streaming = hashtools.calc_digest(io.BytesIO(content), "sha256-tree", 100, self.CHUNK)
+            self.assertEqual(parallel, streaming)
+            self.assertEqual(bytearray.fromhex(parallel), bytearray(expected))
+
+    def test_add_and_check(self):
+        path, content = self.createFile(self.CHUNK * 3 + 1)
+        digest = self.fsdb.add(path)
+        self.assertEqual(len(digest), 64)
+        self.assertTrue(self.fsdb.check(digest))
+        with open(path, 'rb') as f:
+            self.assertEqual(self.fsdb.add(f, digest), digest)
+        with self.fsdb.open(digest, verify=True) as f:
+            self.assertEqual(f.read(), content)
+            self.assertTrue(f.raw.verified)
+
+    def test_chunk_digests(self):
+        path, content = self.createFile(self.CHUNK * 2 + 10)
+        digest = self.fsdb.add(path)
+        leaves = self.fsdb.chunk_digests(digest)
+        self.assertEqual(len(leaves), 3)
+        self.assertEqual(leaves[2], hashlib.sha256(b"\x00" + content[self.CHUNK * 2:]).hexdigest())
+
+    def test_chunk_digests_requires_tree(self):
+        with self.assertRaises(ValueError):
+            Fsdb(os.path.join(self.fsdb_tmp_path, "plain")).chunk_digests("a" * 40)
+
+    def test_config(self):
+        self.assertEqual(Fsdb(self.root)._conf['hash_alg'], "sha256-tree")
+        with self.assertRaises(ValueError):
+            Fsdb(os.path.join(self.fsdb_tmp_path, "bad"), hash_alg="crc-tree")
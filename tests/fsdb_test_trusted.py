@@ -0,0 +1,63 @@
+from __future__ import unicode_literals
+
+import os
+import hashlib
+from io import BytesIO
+from fsdb import CorruptedError
+from . import Fsdb
+from . import FsdbTest
+
+
+class Unreadable(object):
+    '''readable object failing if actually read'''
+
+    def read(self, size=-1):
+        raise AssertionError("origin should not be read")
+
+
+class FsdbTestTrusted(FsdbTest):
+
+    def test_trusted_digest(self):
+        data = b"trusted content"
+        digest = hashlib.sha1(data).hexdigest()
+        self.assertEqual(self.fsdb.add(BytesIO(data), digest=digest), digest)
+        self.assertTrue(self.fsdb.check(digest))
+
+    def test_dedup_hit_does_not_read(self):
+        digest = self.fsdb.add(self.createTestFile())
+        self.assertEqual(self.fsdb.add(Unreadable(), digest=digest), digest)
+
+    def test_wrong_digest(self):
+        digest = hashlib.sha1(b"something else").hexdigest()
+        self.assertRaises(CorruptedError, self.fsdb.add, BytesIO(b"content"), digest=digest)
+        self.assertFalse(digest in self.fsdb)
+        self.assertEqual(len(self.fsdb), 0)
+        for dirpath, dirnames, filenames in os.walk(self.fsdb.fsdbRoot):
+            self.assertFalse([f for f in filenames if f.endswith(".tmp")])
+        # nor the folders made for it
+        self.assertFalse(os.path.exists(os.path.dirname(self.fsdb.get_file_path(digest))))
+
+    def test_deferred(self):
+        data = b"deferred content"
+        digest = hashlib.sha1(data).hexdigest()
+        self.fsdb.add(BytesIO(data), digest=digest, deferred=True)
+        self.fsdb.wait_verification()
+        self.assertTrue(digest in self.fsdb)
+
+    def test_deferred_wrong_digest(self):
+        digest = hashlib.sha1(b"something else").hexdigest()
+        self.fsdb.add(BytesIO(b"content"), digest=digest, deferred=True)
+        self.fsdb.wait_verification()
+        self.assertFalse(digest in self.fsdb)
+        self.assertTrue(os.path.isfile(self.fsdb._aux_path("quarantine", digest)))
+
+    def test_deferred_auto_quarantine(self):
+        self.fsdb = Fsdb(os.path.join(self.fsdb_tmp_path, "autoRoot"), auto_quarantine=True)
+        quarantine = self.fsdb.quarantine
+        calls = []
+        self.fsdb.quarantine = lambda digest: calls.append(digest) or quarantine(digest)
+        digest = hashlib.sha1(b"something else").hexdigest()
+        self.fsdb.add(BytesIO(b"content"), digest=digest, deferred=True)
+        self.fsdb.wait_verification()
+        self.assertEqual(calls, [digest])
+        self.assertTrue(os.path.isfile(self.fsdb._aux_path("quarantine", digest)))
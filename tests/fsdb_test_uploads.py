@@ -0,0 +1,97 @@
+from __future__ import unicode_literals
+
+import os
+import hashlib
+from fsdb import CorruptedError
+from . import Fsdb
+from . import FsdbTest
+
+
+class FsdbTestUploads(FsdbTest):
+
+    CONTENT = b"".join(("chunk {0}\n".format(i).encode('ascii') for i in range(1000)))
+
+    def upload(self, fsdb, content, chunk=1000):
+        upload_id = fsdb.begin_upload()
+        for offset in range(0, len(content), chunk):
+            self.assertEqual(fsdb.append(upload_id, offset, content[offset:offset + chunk]),
+                             min(len(content), offset + chunk))
+        return upload_id
+
+    def test_upload(self):
+        upload_id = self.upload(self.fsdb, self.CONTENT)
+        self.assertEqual(self.fsdb.upload_offset(upload_id), len(self.CONTENT))
+        staged = os.stat(os.path.join(self.fsdb.fsdbRoot, ".fsdb", "uploads", upload_id))
+        digest = self.fsdb.commit(upload_id)
+        self.assertEqual(digest, hashlib.sha1(self.CONTENT).hexdigest())
+        with self.fsdb[digest] as f:
+            self.assertEqual(f.read(), self.CONTENT)
+        # moved into the tree, not copied
+        self.assertEqual(os.stat(self.fsdb.get_file_path(digest)).st_ino, staged.st_ino)
+        self.assertEqual(list(self.fsdb.uploads()), [])
+        self.assertRaises(KeyError, self.fsdb.upload_offset, upload_id)
+        self.assertRaises(KeyError, self.fsdb.append, upload_id, len(self.CONTENT), b"more")
+
+    def test_empty_upload(self):
+        digest = self.fsdb.commit(self.fsdb.begin_upload())
+        self.assertEqual(digest, hashlib.sha1(b"").hexdigest())
+        self.assertTrue(digest in self.fsdb)
+
+    def test_offsets(self):
+        upload_id = self.fsdb.begin_upload()
+        self.fsdb.append(upload_id, 0, b"abcdef")
+        # a chunk sent again is not written twice
+        self.assertEqual(self.fsdb.append(upload_id, 0, b"abcdef"), 6)
+        self.assertEqual(self.fsdb.append(upload_id, 3, b"defghi"), 9)
+        self.assertRaises(ValueError, self.fsdb.append, upload_id, 10, b"k")
+        self.assertRaises(ValueError, self.fsdb.append, upload_id, -1, b"k")
+        self.assertEqual(self.fsdb.upload_offset(upload_id), 9)
+        self.assertEqual(self.fsdb.commit(upload_id), hashlib.sha1(b"abcdefghi").hexdigest())
+
+    def test_resume_after_restart(self):
+        upload_id = self.fsdb.begin_upload()
+        self.fsdb.append(upload_id, 0, self.CONTENT[:5000])
+        other = Fsdb(self.fsdb.fsdbRoot)
+        offset = other.upload_offset(upload_id)
+        self.assertEqual(offset, 5000)
+        other.append(upload_id, offset, self.CONTENT[offset:])
+        # the first instance catches up with what the other one appended
+        self.assertEqual(self.fsdb.commit(upload_id), hashlib.sha1(self.CONTENT).hexdigest())
+
+    def test_commit_verifies_digest(self):
+        upload_id = self.upload(self.fsdb, self.CONTENT)
+        self.assertRaises(CorruptedError, self.fsdb.commit, upload_id, hashlib.sha1(b"other").hexdigest())
+        self.assertEqual(list(self.fsdb), [])
+        self.assertRaises(KeyError, self.fsdb.commit, upload_id)
+
+        upload_id = self.upload(self.fsdb, self.CONTENT)
+        digest = hashlib.sha1(self.CONTENT).hexdigest()
+        self.assertEqual(self.fsdb.commit(upload_id, digest), digest)
+
+    def test_commit_already_stored(self):
+        digest = self.fsdb.add(self.createTestFile())
+        with self.fsdb[digest] as f:
+            content = f.read()
+        upload_id = self.upload(self.fsdb, content)
+        self.assertEqual(self.fsdb.commit(upload_id), digest)
+        self.assertEqual(list(self.fsdb), [digest])
+        self.assertEqual(list(self.fsdb.uploads()), [])
+
+    def test_abort_and_list(self):
+        first = self.fsdb.begin_upload()
+        second = self.fsdb.begin_upload()
+        self.fsdb.append(second, 0, b"content")
+        self.assertEqual(sorted((u[0], u[1]) for u in self.fsdb.uploads()), sorted([(first, 0), (second, 7)]))
+        self.fsdb.abort(first)
+        self.assertEqual([u[0] for u in self.fsdb.uploads()], [second])
+        self.assertRaises(KeyError, self.fsdb.abort, first)
+        self.assertRaises(KeyError, self.fsdb.upload_offset, "../../config")
+        self.assertEqual(list(self.fsdb), [])
+
+    def test_tree_hash_and_aliases(self):
+        root = os.path.join(self.fsdb_tmp_path, "treeRoot")
+        fsdb = Fsdb(root, hash_alg="sha256-tree", tree_chunk_size=4096, alias_algs=['md5'])
+        upload_id = self.upload(fsdb, self.CONTENT, chunk=3000)
+        digest = fsdb.commit(upload_id)
+        self.assertEqual(digest, fsdb._calc_digest(fsdb.get_file_path(digest)))
+        self.assertEqual(fsdb.resolve(hashlib.md5(self.CONTENT).hexdigest()), digest)
@@ -0,0 +1,68 @@
+from __future__ import unicode_literals
+
+import io
+import os
+from fsdb import CorruptedError
+from . import Fsdb
+from . import FsdbTest
+
+
+class FsdbTestVerify(FsdbTest):
+
+    def corrupt(self, digest):
+        with open(self.fsdb.get_file_path(digest), "w") as f:
+            f.write("more is less, less is more")
+
+    def test_verified_read(self):
+        path = self.createTestFile()
+        digest = self.fsdb.add(path)
+        with self.fsdb.open(digest, verify=True) as f:
+            data = b"".join(iter(lambda: f.read(3), b""))
+            self.assertTrue(f.raw.verified)
+        with open(path, 'rb') as f:
+            self.assertEqual(data, f.read())
+
+    def test_corrupted_read(self):
+        digest = self.fsdb.add(self.createTestFile())
+        self.corrupt(digest)
+        with self.fsdb.open(digest, verify=True) as f:
+            self.assertRaises(CorruptedError, f.read)
+
+    def test_corrupted_chunked_read(self):
+        digest = self.fsdb.add(self.createTestFile())
+        self.corrupt(digest)
+        with self.fsdb.open(digest, verify=True) as f:
+            f.read(5)
+            # raised as soon as the end of file is read ahead
+            self.assertRaises(CorruptedError, f.read, 100)
+
+    def test_seek_disables_verification(self):
+        digest = self.fsdb.add(self.createTestFile())
+        self.corrupt(digest)
+        with self.fsdb.open(digest, verify=True) as f:
+            f.seek(2)
+            f.read()
+            self.assertFalse(f.raw.verified)
+
+    def test_verify_on_read_config(self):
+        self.fsdb = Fsdb(os.path.join(self.fsdb_tmp_path, "verifyRoot"), verify_on_read=True)
+        digest = self.fsdb.add(self.createTestFile())
+        self.corrupt(digest)
+        with self.fsdb[digest] as f:
+            self.assertRaises(CorruptedError, f.read)
+
+    def test_read_lines(self):
+        data = b"a\nb\nc\n"
+        digest = self.fsdb.add(io.BytesIO(data))
+        with self.fsdb.open(digest, verify=True) as f:
+            self.assertEqual(list(f), [b"a\n", b"b\n", b"c\n"])
+            self.assertTrue(f.raw.verified)
+        with self.fsdb.open(digest, verify=True) as f:
+            self.assertEqual(f.readline(), b"a\n")
+            self.assertEqual(f.readlines(), [b"b\n", b"c\n"])
+
+    def test_plain_read(self):
+        digest = self.fsdb.add(self.createTestFile())
+        self.corrupt(digest)
+        with self.fsdb[digest] as f:
+            self.assertEqual(f.read(), b"more is less, less is more")